@@ -1,21 +1,29 @@
 # bot.py
 
 import os
-import shutil
+import sys
 import time
 import threading
 import logging
+from typing import Optional
 import telebot
-from utils import llamadaSistema, obtener_ip
-from oled_display import start_auto_update
+from utils import obtener_ip
+from oled_display import start_auto_update, oled_stats_text
 from handlers.admin_handler import admin
 from handlers.basic_commands import start, ping, fecha, comandos
-from handlers.system_commands import status, ip, logs, backup, backup_status, run_backup_thread
-from handlers.minecraft_handler import minecraft, handle_minecraft_callback, mc_players_online, mc_last_activity, _mc_players_cached, _mc_state_cached
-from handlers.transmission_handler import register_transmission_handlers, get_oled_torrent_status
-from handlers.services_handler import services, handle_service_callback
+from handlers.system_commands import status, status_text, ip, logs, historial, backup, backup_status, run_backup_thread
+from handlers.minecraft_handler import minecraft, handle_minecraft_callback, mc_players_online, online_reply_text, mc_last_activity, _mc_players_cached, _mc_state_cached, start_mc_watcher, start_mc_log_follower, mc_stats_text, mc_top_text
+from handlers.transmission_handler import register_transmission_handlers, get_oled_torrent_status, rpc_stats_text, start_torrent_watcher
+from handlers.services_handler import services, servicios, handle_service_callback, start_service_watcher
 from handlers.ha_handler import register_ha_handlers
 from logger import setup_logging
+from dispatcher import DispatchTeleBot
+import sampler
+import tsdb
+import mc_sessions
+import mc_stats
+import ha_api
+import runner
 
 setup_logging()
 
@@ -23,11 +31,19 @@ TOKEN = os.getenv("TOKEN")
 RAW_ADMIN_IDS = os.getenv("ADMIN_IDS", "0")
 ADMIN_IDS = [int(i.strip()) for i in RAW_ADMIN_IDS.split(",") if i.strip()]
 ADMIN_ID = ADMIN_IDS[0] if ADMIN_IDS else 0
+BOT_MODE = os.getenv("BOT_MODE", "threaded").strip().lower()  # threaded | asyncio
 
 if not TOKEN:
     raise RuntimeError("Falta TOKEN en variables de entorno (archivo .env o export).")
 
-bot = telebot.TeleBot(token=TOKEN)
+bot = DispatchTeleBot(token=TOKEN)
+# Handlers que esperan a docker, Transmission, HA o discos: carril lento
+bot.tag_slow(
+    commands=["minecraft", "mc", "mc_online", "online", "mc_last", "last", "torrents", "tr",
+              "reboot_router", "router", "historial", "backup", "logs", "plex", "zerotier",
+              "servicios", "ha"],
+    callback_prefixes=["mc:", "tr:", "router:", "svc:", "backup:", "ha:"],
+)
 
 display_state = {"last_text": "","last_ts": 0.0,}
 _state_lock = threading.Lock()
@@ -45,23 +61,12 @@ ALERT_RAM_PCT = int(os.getenv("ALERT_RAM_PCT", "85"))
 ALERT_DISK_PCT = int(os.getenv("ALERT_DISK_PCT", "90"))
 ALERT_COOLDOWN_S = int(os.getenv("ALERT_COOLDOWN_S", "1800"))  # 30 min
 
-_disk_cache: dict = {"ts": 0.0, "pct": None, "path": ""}
-
-def _read_disk_percent(cache_s: int = 60) -> tuple[int | None, str]:
+def _worst_disk(snap: dict) -> tuple[int | None, str]:
     """Devuelve (porcentaje, path) del disco más lleno entre / y /media/disco."""
-    now = time.time()
-    if now - _disk_cache["ts"] < cache_s:
-        return _disk_cache["pct"], _disk_cache["path"]
     worst_pct, worst_path = None, "/"
-    for path in ("/", "/media/disco"):
-        try:
-            u = shutil.disk_usage(path)
-            pct = int(u.used * 100 / u.total)
-            if worst_pct is None or pct > worst_pct:
-                worst_pct, worst_path = pct, path
-        except Exception:
-            pass
-    _disk_cache.update({"ts": now, "pct": worst_pct, "path": worst_path})
+    for path, d in snap["disks"].items():
+        if d and (worst_pct is None or d["percent"] > worst_pct):
+            worst_pct, worst_path = d["percent"], path
     return worst_pct, worst_path
 
 _last_alert_sent = 0.0
@@ -192,6 +197,10 @@ def handle_status(message):
 def handle_ip(message):
     ip(bot, message)
 
+@bot.message_handler(commands=['historial'])
+def handle_historial(message):
+    historial(bot, message)
+
 @bot.message_handler(commands=['logs'])
 def handle_logs(message):
     if message.from_user.id not in ADMIN_IDS:
@@ -199,6 +208,14 @@ def handle_logs(message):
         return
     logs(bot, message)
 
+@bot.message_handler(commands=['diag'])
+def handle_diag(message):
+    if message.from_user.id not in ADMIN_IDS:
+        bot.reply_to(message, "Solo los admins pueden ver el diagnóstico.")
+        return
+    bot.reply_to(message, "Diagnóstico\n\n" + bot.stats_text() + "\n\n" + runner.stats_text() + "\n\n" + rpc_stats_text()
+                 + "\n" + ha_api.status_text() + "\n" + oled_stats_text())
+
 @bot.message_handler(commands=['backup'])
 def handle_backup(message):
     backup(bot, message, ADMIN_IDS)
@@ -233,6 +250,10 @@ def handle_plex(message):
 def handle_zerotier(message):
     services(bot, message, ADMIN_IDS)
 
+@bot.message_handler(commands=['servicios'])
+def handle_servicios(message):
+    servicios(bot, message)
+
 @bot.message_handler(commands=['minecraft', 'mc'])
 def handle_minecraft(message):
     minecraft(bot, message)
@@ -247,17 +268,23 @@ def on_svc_callback(call):
 
 @bot.message_handler(commands=['mc_online', 'online'])
 def handle_mc_online(message):
-    text, count, names = mc_players_online()
-    if count == 0:
-        bot.reply_to(message, "No hay jugadores conectados الآن.\n" + text)
-    else:
-        bot.reply_to(message, f"Jugadores conectados ({count}):\n- " + "\n- ".join(names))
-        
+    bot.reply_to(message, online_reply_text(mc_players_online()))
+
 @bot.message_handler(commands=['mc_last', 'last'])
 def handle_mc_last(message):
     last = mc_last_activity()
     bot.reply_to(message, f"Última actividad:\n{last}")
 
+@bot.message_handler(commands=['mc_stats'])
+def handle_mc_stats(message):
+    parts = (message.text or "").split(maxsplit=1)
+    player = parts[1].strip() if len(parts) > 1 else None
+    bot.reply_to(message, mc_stats_text(player))
+
+@bot.message_handler(commands=['mc_top'])
+def handle_mc_top(message):
+    bot.reply_to(message, mc_top_text())
+
 @bot.callback_query_handler(func=lambda call: call.data in ["ip", "status", "pwd", "ls"])
 def handle_system_commands(call):
     print(f"Comando del sistema recibido: {call.data}")
@@ -269,43 +296,18 @@ def handle_system_commands(call):
         bot.send_message(call.message.chat.id, f"IP del sistema: {ip_address}")
     
     elif call.data == "status":
-        # Mostrar estado del sistema (puedes mover tu función status aquí)
-        status_info = llamadaSistema("top -bn1 | grep 'Cpu(s)'")
-        bot.send_message(call.message.chat.id, f"Estado del sistema: {status_info}")
+        bot.send_message(call.message.chat.id, status_text(), parse_mode="Markdown")
     
     elif call.data == "pwd":
         # Mostrar el directorio actual
-        current_dir = llamadaSistema("pwd")
+        current_dir = os.getcwd()
         bot.send_message(call.message.chat.id, f"Directorio actual: {current_dir}")
     
     elif call.data == "ls":
         # Mostrar los archivos en el directorio actual
-        files = llamadaSistema("ls")
+        files = runner.run(["ls"], timeout=5).text
         bot.send_message(call.message.chat.id, f"Archivos:\n{files}")
 
-def _read_temp_c():
-    try:
-        with open("/sys/class/thermal/thermal_zone0/temp", "r") as f:
-            return float(f.read().strip()) / 1000.0
-    except Exception:
-        return None
-
-def _read_mem_percent():
-    try:
-        meminfo = {}
-        with open("/proc/meminfo", "r") as f:
-            for line in f:
-                k, v = line.split(":")
-                meminfo[k] = int(v.strip().split()[0])
-        total = meminfo.get("MemTotal", 0)
-        avail = meminfo.get("MemAvailable", 0)
-        if total:
-            used = total - avail
-            return int(used * 100 / total)
-    except Exception:
-        pass
-    return None
-
 def _get_display_payload():
     now = time.time()
 
@@ -313,10 +315,11 @@ def _get_display_payload():
         last_text = display_state["last_text"]
         last_ts = display_state["last_ts"]
 
-    # Lecturas sistema
-    temp = _read_temp_c()
-    mem = _read_mem_percent()
-    disk, disk_path = _read_disk_percent(cache_s=60)
+    # Lecturas sistema (última muestra del sampler, sin I/O)
+    snap = sampler.latest()
+    temp = snap["temp"]
+    mem = snap["mem"]["percent"] if snap["mem"] else None
+    disk, disk_path = _worst_disk(snap)
 
     temp_alert = (temp is not None and temp >= ALERT_TEMP_C)
     mem_alert  = (mem  is not None and mem  >= ALERT_RAM_PCT)
@@ -428,6 +431,13 @@ def _get_display_payload():
     idx = int(now / 6) % len(screens)
     return screens[idx]
 
+def _notify_admins(text: str, parse_mode: Optional[str] = "Markdown"):
+    for admin_id in ADMIN_IDS:
+        try:
+            bot.send_message(admin_id, text, parse_mode=parse_mode)
+        except Exception as e:
+            logging.warning("No pude avisar a %s: %s", admin_id, e)
+
 if __name__ == "__main__":
     # Mensaje solo al arrancar (si reinicia el servicio, lo mandará de nuevo)
     try:
@@ -441,6 +451,21 @@ if __name__ == "__main__":
     except Exception:
         pass
 
-    start_auto_update(_get_display_payload, interval=2)
-    # Infinity polling = bucle interno con reconexión
-    bot.infinity_polling(timeout=20, long_polling_timeout=20, skip_pending=True)
\ No newline at end of file
+    sampler.add_listener(tsdb.record)
+    sampler.start_sampler()
+    start_mc_watcher(_notify_admins)
+    sampler.add_listener(mc_stats.heartbeat)
+    mc_sessions.add_listener(mc_stats.record)
+    start_mc_log_follower()
+    # nombres de torrent con _ o * romperían el Markdown
+    start_torrent_watcher(lambda text: _notify_admins(text, parse_mode=None))
+    start_service_watcher(lambda text: _notify_admins(text, parse_mode=None))
+    ha_api.start_mirror()
+
+    if BOT_MODE == "asyncio" or "--async" in sys.argv:
+        import bot_async
+        bot_async.run(TOKEN, bot, ADMIN_IDS, _get_display_payload, oled_interval=2)
+    else:
+        start_auto_update(_get_display_payload, interval=2)
+        # Infinity polling = bucle interno con reconexión
+        bot.infinity_polling(timeout=20, long_polling_timeout=20, skip_pending=True)
\ No newline at end of file
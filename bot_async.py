@@ -0,0 +1,104 @@
+# bot_async.py
+#
+# Modo asyncio del bot (BOT_MODE=asyncio o `python3 bot.py --async`).
+# - AsyncTeleBot hace el polling.
+# - Las operaciones lentas (docker, Home Assistant, Transmission, `date`)
+#   tienen handler nativo con subprocess/HTTP asíncrono: cientos de esperas
+#   lentas cuestan corrutinas, no hilos.
+# - El resto de comandos se reenvía a los handlers síncronos ya registrados
+#   en el TeleBot de bot.py (process_new_messages/process_new_callback_query),
+#   que los encola en su propio pool sin bloquear el event loop.
+
+import asyncio
+import logging
+
+import telebot
+from telebot.async_telebot import AsyncTeleBot
+
+import runner
+from logger import log_action
+from oled_display import run_auto_update_async, actualizar_pantalla
+from handlers.system_commands import status_text, ip_text
+from handlers.minecraft_handler import (
+    minecraft_async,
+    handle_minecraft_callback_async,
+    mc_players_online_async,
+    mc_last_activity_async,
+    online_reply_text,
+)
+from handlers.transmission_handler import handle_transmission_callback_async
+from handlers.ha_handler import register_ha_handlers_async
+
+
+def _user(message):
+    return message.from_user.username or str(message.from_user.id)
+
+
+def build_async_bot(token: str, sync_bot: telebot.TeleBot, admin_ids: list[int]) -> AsyncTeleBot:
+    abot = AsyncTeleBot(token)
+
+    register_ha_handlers_async(abot, admin_ids)
+
+    @abot.message_handler(commands=["status"])
+    async def handle_status(message):
+        await abot.reply_to(message, status_text(), parse_mode="Markdown")
+        log_action(_user(message), "/status")
+
+    @abot.message_handler(commands=["ip"])
+    async def handle_ip(message):
+        await abot.reply_to(message, ip_text(), parse_mode="Markdown")
+        log_action(_user(message), "/ip")
+
+    @abot.message_handler(commands=["fecha"])
+    async def handle_fecha(message):
+        r = await runner.arun(["date"], timeout=5)
+        await abot.reply_to(message, r.text or "N/A")
+        log_action(_user(message), "/fecha")
+        await asyncio.to_thread(actualizar_pantalla, "Fecha mostrada")
+
+    @abot.message_handler(commands=["minecraft", "mc"])
+    async def handle_minecraft(message):
+        await minecraft_async(abot, message)
+
+    @abot.message_handler(commands=["mc_online", "online"])
+    async def handle_mc_online(message):
+        await abot.reply_to(message, online_reply_text(await mc_players_online_async()))
+
+    @abot.message_handler(commands=["mc_last", "last"])
+    async def handle_mc_last(message):
+        await abot.reply_to(message, f"Última actividad:\n{await mc_last_activity_async()}")
+
+    @abot.callback_query_handler(func=lambda c: c.data.startswith("mc:"))
+    async def on_mc_callback(call):
+        await handle_minecraft_callback_async(abot, call)
+
+    # ---- Todo lo demás: a los handlers síncronos de bot.py ----
+
+    @abot.message_handler(func=lambda m: True, content_types=telebot.util.content_type_message)
+    async def to_sync_message(message):
+        sync_bot.process_new_messages([message])
+
+    @abot.callback_query_handler(func=lambda c: True)
+    async def to_sync_callback(call):
+        if isinstance(call.data, str) and call.data.startswith("tr:"):
+            if await handle_transmission_callback_async(abot, call):
+                return
+        sync_bot.process_new_callback_query([call])
+
+    return abot
+
+
+def run(token: str, sync_bot: telebot.TeleBot, admin_ids: list[int], get_payload_fn, oled_interval: int = 2):
+    """Arranca el polling asíncrono y la tarea de refresco del OLED."""
+    abot = build_async_bot(token, sync_bot, admin_ids)
+
+    async def _main():
+        oled_task = asyncio.create_task(run_auto_update_async(get_payload_fn, interval=oled_interval))
+        try:
+            await abot.infinity_polling(timeout=20, request_timeout=30, skip_pending=True)
+        finally:
+            oled_task.cancel()
+            await abot.close_session()
+
+    logging.info("Arrancando en modo asyncio")
+    asyncio.run(_main())
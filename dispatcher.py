@@ -0,0 +1,163 @@
+# dispatcher.py
+#
+# Capa de despacho para TeleBot:
+# - Dos carriles con su propio pool de hilos: "fast" y "slow". Los comandos
+#   marcados como lentos (docker, Transmission, backup...) van a "slow", así
+#   /ping y /status siempre encuentran un hilo libre.
+# - Dentro de cada carril, las actualizaciones de un mismo chat se ejecutan
+#   en orden y de una en una; chats distintos corren en paralelo.
+# - Profundidad de cola y tiempos de espera visibles en /diag.
+
+import os
+import time
+import logging
+import threading
+from collections import deque
+from typing import Callable, Iterable, Optional
+
+import telebot
+
+BOT_WORKERS = int(os.getenv("BOT_WORKERS", "4"))
+BOT_SLOW_WORKERS = int(os.getenv("BOT_SLOW_WORKERS", "2"))
+
+
+def slow(fn: Callable) -> Callable:
+    """Marca una función (p.ej. un next-step handler) para que corra en el carril lento."""
+    fn._slow = True
+    return fn
+
+
+class _Lane:
+    """Pool de hilos con una cola FIFO por clave (chat)."""
+
+    def __init__(self, name: str, workers: int):
+        self.name = name
+        self.workers = max(1, workers)
+        self._cond = threading.Condition()
+        self._queues: dict = {}        # clave -> deque[(fn, args, kwargs, t_encolado)]
+        self._ready: deque = deque()   # claves con trabajo y sin tarea en curso
+        self._busy: set = set()
+        self.pending = 0
+        self.processed = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.run_max = 0.0
+        for i in range(self.workers):
+            threading.Thread(target=self._worker, name=f"{name}-{i}", daemon=True).start()
+
+    def submit(self, key, fn: Callable, *args, **kwargs):
+        with self._cond:
+            q = self._queues.setdefault(key, deque())
+            q.append((fn, args, kwargs, time.monotonic()))
+            self.pending += 1
+            # Si el chat ya tiene algo en curso o en espera, su turno llegará al terminar
+            if len(q) == 1 and key not in self._busy:
+                self._ready.append(key)
+                self._cond.notify()
+
+    def _worker(self):
+        while True:
+            with self._cond:
+                while not self._ready:
+                    self._cond.wait()
+                key = self._ready.popleft()
+                self._busy.add(key)
+                fn, args, kwargs, enqueued = self._queues[key].popleft()
+                self.pending -= 1
+
+            started = time.monotonic()
+            try:
+                fn(*args, **kwargs)
+            except Exception:
+                logging.exception("dispatcher[%s]: handler falló", self.name)
+            finished = time.monotonic()
+
+            with self._cond:
+                wait = started - enqueued
+                self.processed += 1
+                self.wait_total += wait
+                self.wait_max = max(self.wait_max, wait)
+                self.run_max = max(self.run_max, finished - started)
+                self._busy.discard(key)
+                if self._queues[key]:
+                    self._ready.append(key)
+                    self._cond.notify()
+                else:
+                    del self._queues[key]
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {
+                "workers": self.workers,
+                "pending": self.pending,
+                "busy": len(self._busy),
+                "processed": self.processed,
+                "wait_avg": self.wait_total / self.processed if self.processed else 0.0,
+                "wait_max": self.wait_max,
+                "run_max": self.run_max,
+            }
+
+
+def _chat_key(obj):
+    chat = getattr(obj, "chat", None)
+    if chat is None:
+        msg = getattr(obj, "message", None)  # CallbackQuery
+        chat = getattr(msg, "chat", None)
+    if chat is not None:
+        return chat.id
+    user = getattr(obj, "from_user", None)
+    return user.id if user else None
+
+
+def _command_of(obj) -> Optional[str]:
+    text = getattr(obj, "text", None)
+    if not text or not text.startswith("/"):
+        return None
+    return text.split()[0][1:].split("@")[0].lower()
+
+
+class DispatchTeleBot(telebot.TeleBot):
+    """TeleBot que ejecuta los handlers en los carriles fast/slow en vez de su ThreadPool."""
+
+    def __init__(self, token: str, workers: int = BOT_WORKERS, slow_workers: int = BOT_SLOW_WORKERS, **kwargs):
+        # threaded=True mantiene el polling en su propio hilo; el pool interno queda ocioso
+        super().__init__(token, threaded=True, num_threads=1, **kwargs)
+        self._lanes = {"fast": _Lane("fast", workers), "slow": _Lane("slow", slow_workers)}
+        self._slow_commands: set[str] = set()
+        self._slow_callbacks: tuple[str, ...] = ()
+
+    def tag_slow(self, commands: Iterable[str] = (), callback_prefixes: Iterable[str] = ()):
+        """Comandos (sin '/') y prefijos de callback_data que deben ir al carril lento."""
+        self._slow_commands.update(c.lower() for c in commands)
+        self._slow_callbacks += tuple(callback_prefixes)
+
+    def _lane_for(self, task, obj) -> str:
+        if getattr(task, "_slow", False):
+            return "slow"
+        cmd = _command_of(obj)
+        if cmd and cmd in self._slow_commands:
+            return "slow"
+        data = getattr(obj, "data", None)
+        if isinstance(data, str) and data.startswith(self._slow_callbacks):
+            return "slow"
+        return "fast"
+
+    def _exec_task(self, task, *args, **kwargs):
+        obj = args[0] if args else None
+        self._lanes[self._lane_for(task, obj)].submit(_chat_key(obj), task, *args, **kwargs)
+
+    def run_slow(self, key, fn: Callable, *args, **kwargs):
+        """Encola fn en el carril lento con la clave (chat) dada, p.ej. desde un Timer."""
+        self._lanes["slow"].submit(key, fn, *args, **kwargs)
+
+    def stats(self) -> dict:
+        return {name: lane.stats() for name, lane in self._lanes.items()}
+
+    def stats_text(self) -> str:
+        lines = ["Handlers (hilos | en cola | ocupados | hechos | espera media/máx | ejecución máx):"]
+        for name, s in self.stats().items():
+            lines.append(
+                f"  {name}: {s['workers']} | {s['pending']} | {s['busy']} | {s['processed']} | "
+                f"{s['wait_avg'] * 1000:.0f}/{s['wait_max'] * 1000:.0f}ms | {s['run_max']:.1f}s"
+            )
+        return "\n".join(lines)
@@ -0,0 +1,262 @@
+# docker_api.py
+#
+# Cliente mínimo de la Docker Engine API sobre /var/run/docker.sock.
+# Una conexión HTTP persistente (keep-alive) en vez de arrancar el CLI de
+# docker (Go) en cada consulta, que en la Pi cuesta 100-300 ms por fork.
+
+import os
+import json
+import socket
+import struct
+import threading
+import http.client
+from typing import Iterator, Optional
+from urllib.parse import quote, urlencode
+
+DOCKER_SOCK = os.getenv("DOCKER_SOCK", "/var/run/docker.sock")
+DOCKER_API_TIMEOUT_S = float(os.getenv("DOCKER_API_TIMEOUT_S", "10"))
+
+
+class DockerError(Exception):
+    def __init__(self, status: int, message: str):
+        super().__init__(f"docker {status}: {message}")
+        self.status = status
+        self.message = message
+
+
+class _UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, path: str, timeout: Optional[float]):
+        super().__init__("localhost", timeout=timeout)
+        self._path = path
+
+    def connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        sock.connect(self._path)
+        self.sock = sock
+
+
+def _demux(data: bytes) -> tuple[bytes, bytes]:
+    """
+    Separa el stream multiplexado de logs/exec (cabecera de 8 bytes:
+    stream, 0, 0, 0, tamaño big-endian). Si no tiene ese formato (TTY), va entero a stdout.
+    """
+    out, err = bytearray(), bytearray()
+    i = 0
+    while i + 8 <= len(data):
+        stream, size = data[i], struct.unpack(">I", data[i + 4:i + 8])[0]
+        if stream not in (0, 1, 2) or data[i + 1:i + 4] != b"\0\0\0":
+            return data, b""
+        chunk = data[i + 8:i + 8 + size]
+        (err if stream == 2 else out).extend(chunk)
+        i += 8 + size
+    if i != len(data):
+        return data, b""
+    return bytes(out), bytes(err)
+
+
+class DockerClient:
+    def __init__(self, socket_path: str = DOCKER_SOCK, timeout: float = DOCKER_API_TIMEOUT_S):
+        self.socket_path = socket_path
+        self.timeout = timeout
+        self._conn: Optional[_UnixHTTPConnection] = None
+        self._lock = threading.Lock()
+
+    def _connection(self) -> _UnixHTTPConnection:
+        if self._conn is None:
+            self._conn = _UnixHTTPConnection(self.socket_path, self.timeout)
+        return self._conn
+
+    def _close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def _request(self, method: str, path: str, params: Optional[dict] = None, body=None,
+                 timeout: Optional[float] = None) -> tuple[int, bytes]:
+        if params:
+            path = f"{path}?{urlencode(params)}"
+        payload = json.dumps(body).encode() if body is not None else None
+        headers = {"Content-Type": "application/json"} if payload is not None else {}
+
+        with self._lock:
+            for attempt in (1, 2):
+                conn = self._connection()
+                try:
+                    if conn.sock is not None:
+                        conn.sock.settimeout(timeout or self.timeout)
+                    conn.timeout = timeout or self.timeout
+                    conn.request(method, path, body=payload, headers=headers)
+                    resp = conn.getresponse()
+                    data = resp.read()
+                    if resp.will_close:
+                        self._close()
+                    return resp.status, data
+                except (http.client.RemoteDisconnected, BrokenPipeError, ConnectionResetError):
+                    # keep-alive cerrado por dockerd entre peticiones: reintento una vez
+                    self._close()
+                    if attempt == 2:
+                        raise
+                except Exception:
+                    self._close()
+                    raise
+        raise RuntimeError("unreachable")
+
+    def _json(self, method: str, path: str, params: Optional[dict] = None, body=None,
+              timeout: Optional[float] = None):
+        status, data = self._request(method, path, params=params, body=body, timeout=timeout)
+        if status >= 400:
+            try:
+                message = json.loads(data).get("message", "")
+            except Exception:
+                message = data.decode("utf-8", "replace")
+            raise DockerError(status, message)
+        return json.loads(data) if data else None
+
+    # ---- API ----
+
+    def version(self) -> dict:
+        return self._json("GET", "/version")
+
+    def inspect(self, name: str) -> Optional[dict]:
+        """docker inspect; None si el contenedor no existe."""
+        try:
+            return self._json("GET", f"/containers/{quote(name)}/json")
+        except DockerError as e:
+            if e.status == 404:
+                return None
+            raise
+
+    def list_containers(self, all: bool = True, filters: Optional[dict] = None) -> list[dict]:
+        """docker ps [-a] [--filter]. Cada item trae Names, State y Status ("Up 2 minutes (healthy)")."""
+        params = {"all": "1" if all else "0"}
+        if filters:
+            params["filters"] = json.dumps(filters)
+        return self._json("GET", "/containers/json", params=params) or []
+
+    def logs(self, name: str, tail: int = 100, stdout: bool = True, stderr: bool = False,
+             timestamps: bool = False) -> str:
+        params = {
+            "stdout": "1" if stdout else "0",
+            "stderr": "1" if stderr else "0",
+            "tail": str(tail),
+            "timestamps": "1" if timestamps else "0",
+        }
+        status, data = self._request("GET", f"/containers/{quote(name)}/logs", params=params, timeout=15)
+        if status >= 400:
+            raise DockerError(status, data.decode("utf-8", "replace"))
+        out, err = _demux(data)
+        return (out + err).decode("utf-8", "replace")
+
+    def logs_stream(self, name: str, since: Optional[float] = None, tail: Optional[int] = None,
+                    stdout: bool = True, stderr: bool = False, timestamps: bool = False) -> Iterator[str]:
+        """
+        docker logs -f: líneas según llegan, en una conexión propia sin timeout de lectura.
+        Termina cuando el contenedor se para o dockerd cierra la conexión.
+        """
+        info = self.inspect(name)
+        if info is None:
+            raise DockerError(404, f"No such container: {name}")
+        tty = bool((info.get("Config") or {}).get("Tty"))
+        params = {
+            "follow": "1",
+            "stdout": "1" if stdout else "0",
+            "stderr": "1" if stderr else "0",
+            "timestamps": "1" if timestamps else "0",
+            "tail": "all" if tail is None else str(tail),
+        }
+        if since is not None:
+            params["since"] = f"{since:.9f}"
+
+        conn = _UnixHTTPConnection(self.socket_path, timeout=None)
+        try:
+            conn.request("GET", f"/containers/{quote(name)}/logs?{urlencode(params)}")
+            resp = conn.getresponse()
+            if resp.status >= 400:
+                raise DockerError(resp.status, resp.read().decode("utf-8", "replace"))
+            pending = b""
+            while True:
+                if tty:
+                    chunk = resp.read1(65536)
+                else:
+                    # mismo formato multiplexado que _demux, trama a trama
+                    header = resp.read(8)
+                    if len(header) < 8:
+                        break
+                    chunk = resp.read(struct.unpack(">I", header[4:8])[0])
+                if not chunk:
+                    break
+                *lines, pending = (pending + chunk).split(b"\n")
+                for line in lines:
+                    yield line.rstrip(b"\r").decode("utf-8", "replace")
+            if pending:
+                yield pending.rstrip(b"\r").decode("utf-8", "replace")
+        finally:
+            conn.close()
+
+    def start(self, name: str):
+        status, data = self._request("POST", f"/containers/{quote(name)}/start", timeout=60)
+        if status not in (204, 304):
+            raise DockerError(status, data.decode("utf-8", "replace"))
+
+    def stop(self, name: str, t: int = 30):
+        status, data = self._request("POST", f"/containers/{quote(name)}/stop", params={"t": str(t)}, timeout=t + 15)
+        if status not in (204, 304):
+            raise DockerError(status, data.decode("utf-8", "replace"))
+
+    def exec(self, name: str, cmd: list[str], timeout: float = 30) -> tuple[int, str]:
+        """docker exec sin TTY. Devuelve (exit_code, stdout+stderr)."""
+        created = self._json("POST", f"/containers/{quote(name)}/exec", body={
+            "AttachStdout": True,
+            "AttachStderr": True,
+            "Cmd": cmd,
+        })
+        exec_id = created["Id"]
+        status, data = self._request("POST", f"/exec/{exec_id}/start", body={"Detach": False, "Tty": False},
+                                     timeout=timeout)
+        if status >= 400:
+            raise DockerError(status, data.decode("utf-8", "replace"))
+        out, err = _demux(data)
+        info = self._json("GET", f"/exec/{exec_id}/json") or {}
+        return info.get("ExitCode") or 0, (out + err).decode("utf-8", "replace")
+
+    def events(self, filters: Optional[dict] = None, since: Optional[int] = None) -> Iterator[dict]:
+        """
+        Stream de /events (una línea JSON por evento) en una conexión propia y sin
+        timeout de lectura. Termina si dockerd cierra la conexión; el llamador reconecta.
+        """
+        params = {}
+        if filters:
+            params["filters"] = json.dumps(filters)
+        if since is not None:
+            params["since"] = str(since)
+        path = "/events" + (f"?{urlencode(params)}" if params else "")
+
+        conn = _UnixHTTPConnection(self.socket_path, timeout=None)
+        try:
+            conn.request("GET", path)
+            resp = conn.getresponse()
+            if resp.status >= 400:
+                raise DockerError(resp.status, resp.read().decode("utf-8", "replace"))
+            while True:
+                line = resp.readline()
+                if not line:
+                    return
+                line = line.strip()
+                if line:
+                    yield json.loads(line)
+        finally:
+            conn.close()
+
+
+_client: Optional[DockerClient] = None
+_client_lock = threading.Lock()
+
+
+def get_client() -> DockerClient:
+    """Cliente compartido por todo el bot (una sola conexión persistente)."""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = DockerClient()
+        return _client
@@ -0,0 +1,345 @@
+# ha_api.py
+#
+# Cliente de Home Assistant:
+# - una requests.Session con keep-alive (pool de conexiones) para la API REST
+# - caché corta de estados para no repetir GETs en ráfaga
+# - espejo opcional por WebSocket (get_states + subscribe_events state_changed)
+#   que mantiene todos los estados en memoria; con él activo, las lecturas no
+#   tocan la red. websocket-client solo se importa si HA_WS=1.
+
+import os
+import re
+import json
+import time
+import logging
+import threading
+import unicodedata
+from typing import Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+HA_URL = os.getenv("HA_URL", "http://localhost:8123").rstrip("/")
+HA_TOKEN = os.getenv("HA_TOKEN")
+HA_TIMEOUT_S = float(os.getenv("HA_TIMEOUT_S", "5"))
+HA_CACHE_S = float(os.getenv("HA_CACHE_S", "5"))
+HA_WS = os.getenv("HA_WS", "0") == "1"
+# Sin mensajes durante este tiempo se manda un ping; sin respuesta, reconexión
+_WS_PING_S = 30
+
+
+class HAError(Exception):
+    pass
+
+
+_session_lock = threading.Lock()
+_session: Optional[requests.Session] = None
+
+_cache_lock = threading.Lock()
+_cache = {"states": {}, "all_ts": 0.0}   # entity_id -> (ts, estado)
+
+_mirror_lock = threading.Lock()
+_mirror = {"alive": False, "states": {}, "dirty": set(), "events": 0, "since": 0.0, "last_error": ""}
+_mirror_thread: Optional[threading.Thread] = None
+
+
+def headers() -> dict:
+    return {
+        "Authorization": f"Bearer {HA_TOKEN}",
+        "Content-Type": "application/json",
+    }
+
+
+def _get_session() -> requests.Session:
+    global _session
+    with _session_lock:
+        if _session is None:
+            s = requests.Session()
+            s.headers.update(headers())
+            # pocas conexiones: el bot habla con una sola instancia de HA
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=4)
+            s.mount("http://", adapter)
+            s.mount("https://", adapter)
+            _session = s
+        return _session
+
+
+def _request(method: str, path: str, payload: Optional[dict] = None):
+    try:
+        r = _get_session().request(method, f"{HA_URL}{path}", json=payload, timeout=HA_TIMEOUT_S)
+    except requests.RequestException as e:
+        raise HAError(f"HA no responde: {e}") from e
+    if r.status_code == 404:
+        return None
+    if r.status_code >= 400:
+        raise HAError(f"HA {r.status_code}: {r.text[:200]}")
+    return r.json() if r.content else None
+
+
+# ---------------------------------------------------------------------------
+# Lecturas: espejo WS si está vivo; si no, REST con caché corta
+# ---------------------------------------------------------------------------
+
+def mirror_alive() -> bool:
+    return _mirror["alive"]
+
+
+def get_state(entity_id: str, max_age: float = HA_CACHE_S) -> Optional[dict]:
+    """Estado completo de la entidad (state, attributes...) o None si no existe."""
+    if _mirror["alive"]:
+        with _mirror_lock:
+            return _mirror["states"].get(entity_id)
+
+    now = time.monotonic()
+    with _cache_lock:
+        hit = _cache["states"].get(entity_id)
+    if hit and now - hit[0] < max_age:
+        return hit[1]
+    state = _request("GET", f"/api/states/{entity_id}")
+    with _cache_lock:
+        _cache["states"][entity_id] = (now, state)
+    return state
+
+
+def states(max_age: float = HA_CACHE_S) -> dict[str, dict]:
+    """Todas las entidades: entity_id -> estado."""
+    if _mirror["alive"]:
+        with _mirror_lock:
+            return dict(_mirror["states"])
+
+    now = time.monotonic()
+    with _cache_lock:
+        if now - _cache["all_ts"] < max_age:
+            return {k: v for k, (_, v) in _cache["states"].items() if v is not None}
+    result = {s["entity_id"]: s for s in _request("GET", "/api/states") or []}
+    with _cache_lock:
+        _cache["states"] = {k: (now, v) for k, v in result.items()}
+        _cache["all_ts"] = now
+    return result
+
+
+def call_service(domain: str, service: str, data: Optional[dict] = None) -> list:
+    """POST /api/services/<domain>/<service>; devuelve los estados que cambiaron."""
+    changed = _request("POST", f"/api/services/{domain}/{service}", data or {}) or []
+    now = time.monotonic()
+    with _cache_lock:
+        for st in changed:
+            if st.get("entity_id") in _cache["states"]:
+                _cache["states"][st["entity_id"]] = (now, st)
+    return changed
+
+
+# ---------------------------------------------------------------------------
+# Espejo WebSocket
+# ---------------------------------------------------------------------------
+
+def _ws_url() -> str:
+    if HA_URL.startswith("https://"):
+        return "wss://" + HA_URL[len("https://"):] + "/api/websocket"
+    return "ws://" + HA_URL.split("://", 1)[-1] + "/api/websocket"
+
+
+def _put_state(entity_id: str, state: Optional[dict]):
+    with _mirror_lock:
+        _mirror["dirty"].add(entity_id)
+        if state is None:
+            _mirror["states"].pop(entity_id, None)
+            return
+        cur = _mirror["states"].get(entity_id)
+        # get_states y los eventos pueden cruzarse: gana el más reciente
+        if cur is None or state.get("last_updated", "") >= cur.get("last_updated", ""):
+            _mirror["states"][entity_id] = state
+
+
+def _ws_session(websocket):
+    ws = websocket.create_connection(_ws_url(), timeout=HA_TIMEOUT_S)
+    try:
+        if json.loads(ws.recv()).get("type") != "auth_required":
+            raise HAError("saludo WebSocket inesperado")
+        ws.send(json.dumps({"type": "auth", "access_token": HA_TOKEN}))
+        if json.loads(ws.recv()).get("type") != "auth_ok":
+            raise HAError("token rechazado por HA")
+
+        # primero suscribirse, luego el volcado: así no se pierde ningún cambio
+        ws.send(json.dumps({"id": 1, "type": "subscribe_events", "event_type": "state_changed"}))
+        ws.send(json.dumps({"id": 2, "type": "get_states"}))
+        ws.settimeout(_WS_PING_S)
+        msg_id, ping_pending = 2, False
+        while True:
+            try:
+                msg = json.loads(ws.recv())
+            except websocket.WebSocketTimeoutException:
+                if ping_pending:
+                    raise HAError("HA no contesta al ping")
+                msg_id += 1
+                ws.send(json.dumps({"id": msg_id, "type": "ping"}))
+                ping_pending = True
+                continue
+            ping_pending = False
+
+            kind = msg.get("type")
+            if kind == "event":
+                data = msg["event"].get("data", {})
+                _put_state(data.get("entity_id"), data.get("new_state"))
+                _mirror["events"] += 1
+            elif kind == "result" and msg.get("id") == 2:
+                if not msg.get("success"):
+                    raise HAError(f"get_states falló: {msg.get('error')}")
+                result = msg.get("result") or []
+                # entidades que desaparecieron mientras estábamos desconectados
+                for eid in set(_mirror["states"]) - {st["entity_id"] for st in result}:
+                    _put_state(eid, None)
+                for st in result:
+                    _put_state(st["entity_id"], st)
+                _mirror["alive"] = True
+                _mirror["since"] = time.time()
+                logging.info("HA: espejo WebSocket activo (%d entidades)", len(_mirror["states"]))
+            elif kind == "result" and not msg.get("success"):
+                raise HAError(f"HA rechazó la petición {msg.get('id')}: {msg.get('error')}")
+    finally:
+        _mirror["alive"] = False
+        ws.close()
+
+
+def _ws_loop():
+    try:
+        import websocket  # websocket-client, solo si se activa el espejo
+    except ImportError:
+        logging.warning("HA_WS=1 pero falta websocket-client (pip install websocket-client); solo REST")
+        return
+
+    backoff = 1
+    while True:
+        started = time.monotonic()
+        try:
+            _ws_session(websocket)
+        except Exception as e:
+            _mirror["last_error"] = f"{type(e).__name__}: {e}"[:200]
+            logging.warning("HA WebSocket: %s", e)
+        if time.monotonic() - started > 60:
+            backoff = 1
+        time.sleep(backoff)
+        backoff = min(backoff * 2, 60)
+
+
+def start_mirror(force: bool = False):
+    """Arranca (una vez) el espejo WebSocket si HA_WS=1 (o force) y hay token."""
+    global _mirror_thread
+    if not (HA_WS or force) or not HA_TOKEN:
+        return
+    if _mirror_thread and _mirror_thread.is_alive():
+        return
+    _mirror_thread = threading.Thread(target=_ws_loop, name="ha-ws", daemon=True)
+    _mirror_thread.start()
+
+
+# ---------------------------------------------------------------------------
+# Índice de búsqueda: trigramas sobre entity_id + friendly_name. Se actualiza
+# solo con las entidades que cambiaron (eventos del espejo) o, en modo REST,
+# comparando con el último volcado de /api/states.
+# ---------------------------------------------------------------------------
+
+_index_lock = threading.Lock()
+_index = {
+    "source": None,    # "ws" o el ts del volcado REST indexado
+    "texts": {},       # entity_id -> texto normalizado
+    "trigrams": {},    # trigrama -> set(entity_id)
+}
+
+
+def _norm(text: str) -> str:
+    text = unicodedata.normalize("NFKD", text or "").encode("ascii", "ignore").decode().lower()
+    return re.sub(r"[^a-z0-9]+", " ", text).strip()
+
+
+def _trigrams(text: str) -> set[str]:
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+def friendly_name(state: dict) -> str:
+    return (state.get("attributes") or {}).get("friendly_name") or state.get("entity_id", "")
+
+
+def _index_update(snap: dict, ids) -> None:
+    texts, tri = _index["texts"], _index["trigrams"]
+    for eid in ids:
+        st = snap.get(eid)
+        text = _norm(f"{eid} {friendly_name(st)}") if st else None
+        old = texts.get(eid)
+        if text == old:
+            continue
+        if old is not None:
+            for g in _trigrams(old):
+                bucket = tri.get(g)
+                if bucket is not None:
+                    bucket.discard(eid)
+                    if not bucket:
+                        del tri[g]
+            del texts[eid]
+        if text is not None:
+            texts[eid] = text
+            for g in _trigrams(text):
+                tri.setdefault(g, set()).add(eid)
+
+
+def _sync_index() -> dict:
+    """Pone el índice al día y devuelve el snapshot de estados usado."""
+    if _mirror["alive"]:
+        with _mirror_lock:
+            snap = dict(_mirror["states"])
+            dirty, _mirror["dirty"] = _mirror["dirty"], set()
+        with _index_lock:
+            full = _index["source"] != "ws"
+            _index_update(snap, set(snap) | set(_index["texts"]) if full else dirty)
+            _index["source"] = "ws"
+        return snap
+
+    snap = states()
+    with _index_lock:
+        if _index["source"] != _cache["all_ts"]:
+            _index_update(snap, set(snap) | set(_index["texts"]))
+            _index["source"] = _cache["all_ts"]
+    return snap
+
+
+def search(query: str) -> list[str]:
+    """
+    entity_ids que contienen todas las palabras de la búsqueda; primero los
+    que las tienen a principio de palabra, luego por entity_id.
+    """
+    snap = _sync_index()
+    words = _norm(query).split()
+    with _index_lock:
+        texts, tri = _index["texts"], _index["trigrams"]
+        found = None
+        for word in words:
+            grams = _trigrams(word)
+            if grams:
+                cands = None
+                for g in sorted(grams, key=lambda g: len(tri.get(g, ()))):
+                    cands = set(tri.get(g, ())) if cands is None else cands & tri.get(g, set())
+                    if not cands:
+                        break
+                matches = {eid for eid in cands if word in texts[eid]}
+            else:
+                matches = {eid for eid, t in texts.items() if word in t}
+            found = matches if found is None else found & matches
+            if not found:
+                return []
+        if found is None:
+            found = set(texts)
+
+        def _rank(eid):
+            text = " " + texts[eid]
+            return (-sum(1 for w in words if " " + w in text), eid)
+
+        return [eid for eid in sorted(found, key=_rank) if eid in snap]
+
+
+def status_text() -> str:
+    if _mirror["alive"]:
+        up = int(time.time() - _mirror["since"])
+        return f"HA: espejo WebSocket activo ({len(_mirror['states'])} entidades, {_mirror['events']} eventos, {up}s)"
+    if _mirror_thread is not None:
+        return f"HA: espejo WebSocket caído, usando REST ({_mirror['last_error'] or 'conectando'})"
+    return "HA: REST con caché de estados"
@@ -1,7 +1,7 @@
 # handlers/basic_commands.py
 
 from oled_display import actualizar_pantalla
-from utils import obtener_ip, llamadaSistema
+import runner
 import logging
 from logger import log_action
 
@@ -41,7 +41,7 @@ def ping(bot, message):
     actualizar_pantalla("Ping recibido")
 
 def fecha(bot, message):
-    fecha = llamadaSistema("date")  # Llamada al sistema
+    fecha = runner.run(["date"], timeout=5).text  # Llamada al sistema
     bot.reply_to(message, fecha)  # Respondemos al comando con el mensaje
     logging.info("fecha")
     log_action(_user(message), "/fecha")
@@ -53,20 +53,29 @@ def comandos(bot, message):
         "*Sistema*\n"
         "/status — CPU, RAM, disco y temperatura\n"
         "/ip — IP local de la Raspberry\n"
+        "/historial — Histórico: `/historial temp anoche`, `/historial ram 7d`\n"
         "/fecha — Fecha y hora del sistema\n"
         "/ping — Comprueba que el bot está vivo\n\n"
         "*Servicios*\n"
         "/plex — Estado de Plex (`on`/`off` solo admins)\n"
-        "/zerotier — Estado de ZeroTier (`on`/`off` solo admins)\n\n"
+        "/zerotier — Estado de ZeroTier (`on`/`off` solo admins)\n"
+        "/servicios — Estado, memoria, CPU y uptime de todos los servicios\n\n"
         "*Minecraft*\n"
         "/minecraft — Panel: arrancar, parar, ver estado\n"
         "/online — Jugadores conectados ahora\n"
-        "/last — Última actividad\n\n"
+        "/last — Última actividad\n"
+        "/mc\\_stats — Tiempo jugado y picos (`/mc_stats <jugador>`)\n"
+        "/mc\\_top — Ranking de tiempo jugado\n\n"
         "*Torrents*\n"
-        "/torrents — Gestión de Transmission\n\n"
+        "/torrents — Gestión de Transmission\n"
+        "/torrents buscar <texto> — Buscar por nombre (`activos`/`todos` para filtrar)\n"
+        "/torrents pausar|reanudar|limpiar — Acciones sobre todos los torrents\n"
+        "Envía ficheros .torrent como documento para añadirlos\n\n"
         "*Solo admins*\n"
         "/admin — Panel de administración\n"
         "/logs — Ultimas 20 lineas del log (acepta numero: /logs 30)\n"
+        "/diag — Diagnóstico interno del bot\n"
+        "/ha <texto> — Buscar y controlar entidades de Home Assistant\n"
         "/apagar — Apaga la Raspberry Pi (pide confirmacion)"
     )
     bot.reply_to(message, respuuesta, parse_mode="Markdown")
@@ -1,36 +1,31 @@
 import os
+import hashlib
 import logging
-import requests
+import secrets
+from datetime import datetime
 import telebot
 
-HA_URL   = os.getenv("HA_URL", "http://localhost:8123")
-HA_TOKEN = os.getenv("HA_TOKEN")
+import ha_api
+from logger import log_action
+from ha_api import HA_URL
 
 # Entity ID de la automatización en Home Assistant
 ROUTER_AUTOMATION_ID = os.getenv("HA_ROUTER_AUTOMATION", "automation.reboot_router")
 
 
 # ---------------------------------------------------------------------------
-# Cliente HA
+# Cliente HA (sesión keep-alive + espejo WebSocket opcional en ha_api)
 # ---------------------------------------------------------------------------
 
 def _ha_headers() -> dict:
-    return {
-        "Authorization": f"Bearer {HA_TOKEN}",
-        "Content-Type":  "application/json",
-    }
+    return ha_api.headers()
 
 
 def ha_run_automation(automation_id: str) -> bool:
     """Dispara una automatización de HA por su entity_id."""
     try:
-        r = requests.post(
-            f"{HA_URL}/api/services/automation/trigger",
-            headers=_ha_headers(),
-            json={"entity_id": automation_id},
-            timeout=5,
-        )
-        return r.status_code == 200
+        ha_api.call_service("automation", "trigger", {"entity_id": automation_id})
+        return True
     except Exception as e:
         logging.error("ha_run_automation error: %s", e)
         return False
@@ -39,15 +34,55 @@ def ha_run_automation(automation_id: str) -> bool:
 def ha_get_state(entity_id: str) -> str | None:
     """Devuelve el estado actual de una entidad ('on', 'off', ...) o None si falla."""
     try:
-        r = requests.get(
-            f"{HA_URL}/api/states/{entity_id}",
+        st = ha_api.get_state(entity_id)
+        return st.get("state") if st else None
+    except Exception as e:
+        logging.error("ha_get_state error: %s", e)
+    return None
+
+
+# ---------------------------------------------------------------------------
+# Cliente HA asíncrono (modo asyncio). aiohttp viene con AsyncTeleBot.
+# ---------------------------------------------------------------------------
+
+_aio_session = None
+
+
+async def _get_aio_session():
+    global _aio_session
+    if _aio_session is None or _aio_session.closed:
+        import aiohttp
+        _aio_session = aiohttp.ClientSession(
             headers=_ha_headers(),
-            timeout=5,
+            timeout=aiohttp.ClientTimeout(total=5),
         )
-        if r.status_code == 200:
-            return r.json().get("state")
+    return _aio_session
+
+
+async def ha_run_automation_async(automation_id: str) -> bool:
+    try:
+        session = await _get_aio_session()
+        async with session.post(
+            f"{HA_URL}/api/services/automation/trigger",
+            json={"entity_id": automation_id},
+        ) as r:
+            return r.status == 200
     except Exception as e:
-        logging.error("ha_get_state error: %s", e)
+        logging.error("ha_run_automation_async error: %s", e)
+        return False
+
+
+async def ha_get_state_async(entity_id: str) -> str | None:
+    if ha_api.mirror_alive():
+        st = ha_api.get_state(entity_id)
+        return st.get("state") if st else None
+    try:
+        session = await _get_aio_session()
+        async with session.get(f"{HA_URL}/api/states/{entity_id}") as r:
+            if r.status == 200:
+                return (await r.json()).get("state")
+    except Exception as e:
+        logging.error("ha_get_state_async error: %s", e)
     return None
 
 
@@ -55,31 +90,217 @@ def ha_get_state(entity_id: str) -> str | None:
 # Handlers del bot
 # ---------------------------------------------------------------------------
 
+def _router_switch_id() -> str:
+    return ROUTER_AUTOMATION_ID.replace("automation.", "switch.")
+
+
+def _router_prompt(state: str | None):
+    state_txt = ""
+    if state:
+        state_txt = f"\nEstado actual del router: {state}"
+
+    markup = telebot.types.InlineKeyboardMarkup(row_width=2)
+    markup.add(
+        telebot.types.InlineKeyboardButton("Si, reiniciar", callback_data="router:confirm"),
+        telebot.types.InlineKeyboardButton("Cancelar",      callback_data="router:cancel"),
+    )
+    text = (
+        f"Vas a reiniciar el router.\n"
+        f"Se apagara y volvera solo automaticamente.{state_txt}\n\n"
+        f"Confirmas?"
+    )
+    return text, markup
+
+
+# ---------------------------------------------------------------------------
+# /ha <búsqueda>: navegador de entidades sobre el índice de ha_api
+# ---------------------------------------------------------------------------
+
+_HA_PAGE = 8
+# dominio -> (dominio del servicio, servicio, texto del botón)
+_HA_ACTIONS = {
+    "light": ("homeassistant", "toggle", "Alternar"),
+    "switch": ("homeassistant", "toggle", "Alternar"),
+    "fan": ("homeassistant", "toggle", "Alternar"),
+    "input_boolean": ("homeassistant", "toggle", "Alternar"),
+    "cover": ("cover", "toggle", "Abrir/cerrar"),
+    "media_player": ("media_player", "toggle", "Encender/apagar"),
+    "automation": ("automation", "trigger", "Ejecutar"),
+    "script": ("script", "turn_on", "Ejecutar"),
+    "scene": ("scene", "turn_on", "Activar"),
+    "button": ("button", "press", "Pulsar"),
+    "input_button": ("input_button", "press", "Pulsar"),
+}
+# chat_id -> {"token": str, "query": str, "ids": [entity_id]}. La paginación
+# lleva el token de la búsqueda (una búsqueda nueva invalida los mensajes
+# anteriores); ficha y acción llevan el entity_id, nunca una posición.
+_ha_views: dict[int, dict] = {}
+# "#<hash>" -> entity_id, para los ids que no caben en los 64 bytes de callback_data
+_ha_refs: dict[str, str] = {}
+_HA_REFS_MAX = 512
+
+
+def _entity_ref(prefix: str, eid: str) -> str:
+    if len((prefix + eid).encode()) <= 64:
+        return eid
+    ref = "#" + hashlib.sha1(eid.encode()).hexdigest()[:16]
+    _ha_refs.pop(ref, None)
+    _ha_refs[ref] = eid
+    while len(_ha_refs) > _HA_REFS_MAX:   # se olvidan primero los más antiguos
+        del _ha_refs[next(iter(_ha_refs))]
+    return ref
+
+
+def _resolve_ref(ref: str) -> str | None:
+    if ref.startswith("#"):
+        return _ha_refs.get(ref)
+    return ref if "." in ref else None   # botones antiguos llevaban una posición
+
+
+def _state_text(st: dict) -> str:
+    unit = (st.get("attributes") or {}).get("unit_of_measurement")
+    return f"{st.get('state')} {unit}" if unit else str(st.get("state"))
+
+
+def _fmt_changed(value: str | None) -> str:
+    try:
+        return datetime.fromisoformat(value).astimezone().strftime("%d/%m %H:%M")
+    except (TypeError, ValueError):
+        return "?"
+
+
+def ha_search_view(chat_id: int, query: str):
+    # aleatorio: un contador repetiría tokens tras reiniciar el bot
+    token = secrets.token_hex(3)
+    _ha_views[chat_id] = {"token": token, "query": query, "ids": ha_api.search(query)}
+    return ha_page_view(chat_id, token, 0)
+
+
+def ha_page_view(chat_id: int, token: str, page: int):
+    view = _ha_views.get(chat_id)
+    if not view or view["token"] != token:
+        return "Búsqueda caducada. Usa /ha <texto> otra vez.", None
+    ids = view["ids"]
+    if not ids:
+        return f"Sin entidades para «{view['query']}».", None
+
+    pages = (len(ids) + _HA_PAGE - 1) // _HA_PAGE
+    page = max(0, min(page, pages - 1))
+    snap = ha_api.states()
+    markup = telebot.types.InlineKeyboardMarkup(row_width=1)
+    for i in range(page * _HA_PAGE, min(len(ids), (page + 1) * _HA_PAGE)):
+        st = snap.get(ids[i])
+        label = f"{ha_api.friendly_name(st)} · {_state_text(st)}" if st else ids[i]
+        prefix = f"ha:e:{token}:"
+        markup.add(telebot.types.InlineKeyboardButton(
+            label[:60], callback_data=prefix + _entity_ref(prefix, ids[i])))
+    nav = []
+    if page > 0:
+        nav.append(telebot.types.InlineKeyboardButton("<< Anterior", callback_data=f"ha:p:{token}:{page - 1}"))
+    if page < pages - 1:
+        nav.append(telebot.types.InlineKeyboardButton("Siguiente >>", callback_data=f"ha:p:{token}:{page + 1}"))
+    if nav:
+        markup.row(*nav)
+    return f"HA «{view['query']}»: {len(ids)} entidades (página {page + 1}/{pages})", markup
+
+
+def ha_entity_view(chat_id: int, token: str, eid: str):
+    st = ha_api.get_state(eid)
+    if st is None:
+        return f"{eid} ya no existe en Home Assistant.", None
+
+    text = (
+        f"{ha_api.friendly_name(st)}\n{eid}\n"
+        f"Estado: {_state_text(st)}\n"
+        f"Último cambio: {_fmt_changed(st.get('last_changed'))}"
+    )
+    markup = telebot.types.InlineKeyboardMarkup(row_width=2)
+    buttons = []
+    action = _HA_ACTIONS.get(eid.split(".", 1)[0])
+    if action:
+        buttons.append(telebot.types.InlineKeyboardButton(
+            action[2], callback_data="ha:do:" + _entity_ref("ha:do:", eid)))
+    view = _ha_views.get(chat_id)
+    if view and view["token"] == token and eid in view["ids"]:
+        page = view["ids"].index(eid) // _HA_PAGE
+        buttons.append(telebot.types.InlineKeyboardButton("Volver", callback_data=f"ha:p:{token}:{page}"))
+    markup.add(*buttons)
+    return text, markup
+
+
+def ha_entity_action(eid: str) -> str:
+    action = _HA_ACTIONS.get(eid.split(".", 1)[0])
+    if not action:
+        return f"{eid} no tiene acción desde aquí."
+    changed = ha_api.call_service(action[0], action[1], {"entity_id": eid})
+    new = next((st for st in changed if st.get("entity_id") == eid), None)
+    return f"Hecho: {eid} → {_state_text(new)}" if new else f"Hecho: {action[1]} {eid}"
+
+
 def register_ha_handlers(bot: telebot.TeleBot, admin_ids: list[int]):
 
+    @bot.message_handler(commands=["ha"])
+    def handle_ha(message):
+        if message.from_user.id not in admin_ids:
+            bot.reply_to(message, "No tienes permiso para usar Home Assistant.")
+            return
+        parts = (message.text or "").split(maxsplit=1)
+        if len(parts) < 2:
+            bot.reply_to(message, "Uso: /ha <texto>  (p.ej. /ha luz salon)")
+            return
+        log_action(message.from_user.username or str(message.from_user.id), "/ha", parts[1])
+        try:
+            text, markup = ha_search_view(message.chat.id, parts[1])
+        except Exception as e:
+            logging.error("ha search error: %s", e)
+            text, markup = f"Error contactando Home Assistant: {e}", None
+        bot.reply_to(message, text, reply_markup=markup)
+
+    @bot.callback_query_handler(func=lambda c: isinstance(c.data, str) and c.data.startswith("ha:"))
+    def handle_ha_callback(call):
+        try:
+            bot.answer_callback_query(call.id)
+        except Exception:
+            pass
+        if call.from_user.id not in admin_ids:
+            bot.send_message(call.message.chat.id, "No autorizado.")
+            return
+
+        # ha:p:<token>:<página> | ha:e:<token>:<entidad> | ha:do:<entidad>
+        _, kind, rest = (call.data.split(":", 2) + ["", ""])[:3]
+        chat_id = call.message.chat.id
+        try:
+            if kind == "p":
+                token, _, page = rest.partition(":")
+                if not page.isdigit():
+                    return
+                text, markup = ha_page_view(chat_id, token, int(page))
+            elif kind in ("e", "do"):
+                token, ref = rest.split(":", 1) if kind == "e" and ":" in rest else ("", rest)
+                eid = _resolve_ref(ref)
+                if eid is None:
+                    text, markup = "Búsqueda caducada. Usa /ha <texto> otra vez.", None
+                elif kind == "e":
+                    text, markup = ha_entity_view(chat_id, token, eid)
+                else:
+                    log_action(call.from_user.username or str(call.from_user.id), "ha:do", eid)
+                    text, markup = ha_entity_action(eid), None
+            else:
+                return
+        except Exception as e:
+            logging.error("ha callback error: %s", e)
+            text, markup = f"Error contactando Home Assistant: {e}", None
+        bot.send_message(chat_id, text, reply_markup=markup)
+
     @bot.message_handler(commands=["reboot_router", "router"])
     def handle_reboot_router(message):
         if message.from_user.id not in admin_ids:
             bot.reply_to(message, "No tienes permiso para reiniciar el router.")
             return
 
-        state = ha_get_state(ROUTER_AUTOMATION_ID.replace("automation.", "switch."))
-        state_txt = ""
-        if state:
-            state_txt = f"\nEstado actual del router: {state}"
-
-        markup = telebot.types.InlineKeyboardMarkup(row_width=2)
-        markup.add(
-            telebot.types.InlineKeyboardButton("Si, reiniciar", callback_data="router:confirm"),
-            telebot.types.InlineKeyboardButton("Cancelar",      callback_data="router:cancel"),
-        )
-        bot.reply_to(
-            message,
-            f"Vas a reiniciar el router.\n"
-            f"Se apagara y volvera solo automaticamente.{state_txt}\n\n"
-            f"Confirmas?",
-            reply_markup=markup,
-        )
+        state = ha_get_state(_router_switch_id())
+        text, markup = _router_prompt(state)
+        bot.reply_to(message, text, reply_markup=markup)
 
     @bot.callback_query_handler(func=lambda c: c.data in ("router:confirm", "router:cancel"))
     def handle_router_callback(call):
@@ -112,4 +333,48 @@ def register_ha_handlers(bot: telebot.TeleBot, admin_ids: list[int]):
                     )
             bot.send_message(call.message.chat.id, "Reiniciando router... vuelve solo en unos segundos.")
         else:
-            bot.send_message(call.message.chat.id, "Error contactando Home Assistant. Esta encendido?")
\ No newline at end of file
+            bot.send_message(call.message.chat.id, "Error contactando Home Assistant. Esta encendido?")
+
+
+def register_ha_handlers_async(abot, admin_ids: list[int]):
+    """Mismos handlers del router sobre AsyncTeleBot, con HTTP asíncrono."""
+
+    @abot.message_handler(commands=["reboot_router", "router"])
+    async def handle_reboot_router(message):
+        if message.from_user.id not in admin_ids:
+            await abot.reply_to(message, "No tienes permiso para reiniciar el router.")
+            return
+        state = await ha_get_state_async(_router_switch_id())
+        text, markup = _router_prompt(state)
+        await abot.reply_to(message, text, reply_markup=markup)
+
+    @abot.callback_query_handler(func=lambda c: c.data in ("router:confirm", "router:cancel"))
+    async def handle_router_callback(call):
+        try:
+            await abot.answer_callback_query(call.id)
+        except Exception:
+            pass
+
+        if call.from_user.id not in admin_ids:
+            await abot.send_message(call.message.chat.id, "No autorizado.")
+            return
+
+        if call.data == "router:cancel":
+            await abot.send_message(call.message.chat.id, "Reinicio del router cancelado.")
+            return
+
+        logging.warning(
+            "action user=%s cmd=reboot_router CONFIRMED",
+            call.from_user.username or call.from_user.id,
+        )
+
+        if await ha_run_automation_async(ROUTER_AUTOMATION_ID):
+            for admin_id in admin_ids:
+                if admin_id != call.from_user.id:
+                    await abot.send_message(
+                        admin_id,
+                        f"[HA] @{call.from_user.username or call.from_user.id} reinicio el router.",
+                    )
+            await abot.send_message(call.message.chat.id, "Reiniciando router... vuelve solo en unos segundos.")
+        else:
+            await abot.send_message(call.message.chat.id, "Error contactando Home Assistant. Esta encendido?")
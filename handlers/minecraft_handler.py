@@ -1,16 +1,31 @@
 # handlers/minecraft_handler.py
+import io
 import os
+import asyncio
 import time
+import json
+import socket
+import struct
 import logging
-from typing import Optional, Tuple
+import threading
+from datetime import datetime, timezone
+from typing import Callable, NamedTuple, Optional, Tuple
 from telebot.types import InlineKeyboardMarkup, InlineKeyboardButton
 import re
 
-from utils import llamadaSistema
+import rcon
+import runner
+import mc_sessions
+import mc_stats
+import docker_api
 from logger import log_action
 
 _MC_CACHE = {"ts": 0.0, "state": "off", "status": ""}
+_COMPOSE_V2 = {"checked": False, "ok": False}
 _MC_PLAYERS_CACHE = {"ts": 0.0, "count": 0, "names": []}
+_RCON = {"client": None}
+_SLP_CACHE = {"ts": 0.0, "status": None}
+_RCON_LOCK = threading.Lock()
 
 def _user(obj):
     u = getattr(obj, "from_user", None)
@@ -26,8 +41,11 @@ def _compose_file():
     return cf if cf else None
 
 def _has_docker_compose_v2():
-    out = llamadaSistema("docker compose version 2>/dev/null").strip()
-    return bool(out)
+    # Solo se comprueba una vez por proceso
+    if not _COMPOSE_V2["checked"]:
+        _COMPOSE_V2["ok"] = runner.run(["docker", "compose", "version"], timeout=10).ok
+        _COMPOSE_V2["checked"] = True
+    return _COMPOSE_V2["ok"]
 
 def _compose_cmd():
     cf = _compose_file()
@@ -35,33 +53,130 @@ def _compose_cmd():
         return None
     # prefer v2
     if _has_docker_compose_v2():
-        return f"docker compose -f {cf}"
+        return ["docker", "compose", "-f", cf]
     # fallback v1
-    return f"docker-compose -f {cf}"
+    return ["docker-compose", "-f", cf]
 
-def mc_status_text():
-    name = _container_name()
-    status = llamadaSistema(
-        f"docker ps -a --filter name={name} --format '{{{{.Status}}}}'"
-    ).strip()
+def _docker():
+    return docker_api.get_client()
+
+def _find_container(name: str):
+    """Item de `docker ps -a --filter name=...` (coincidencia exacta si la hay) o None."""
+    items = _docker().list_containers(all=True, filters={"name": [name]})
+    for c in items:
+        if f"/{name}" in c.get("Names", []):
+            return c
+    return items[0] if items else None
 
+def _docker_ps_status(name: str) -> str:
+    # p.ej. "Up 2 minutes (healthy)"; "" si no existe o docker no responde
+    try:
+        c = _find_container(name)
+    except Exception as e:
+        logging.warning("docker ps %s: %s", name, e)
+        return ""
+    return c.get("Status", "") if c else ""
+
+def _status_text(name: str, status: str):
     if not status:
         return f"Contenedor `{name}` no encontrado.", False
 
     running = status.lower().startswith("up")
     return f"{name}: {status}", running
 
+def mc_status_text():
+    name = _container_name()
+    if _MC_WATCH["alive"]:
+        return _status_text(name, _watch_status_text())
+    return _status_text(name, _docker_ps_status(name))
+
 def mc_start():
     comp = _compose_cmd()
     if comp:
-        return llamadaSistema(f"{comp} up -d").strip() or "OK"
-    return llamadaSistema(f"docker start {_container_name()}").strip() or "OK"
+        return _start_result(runner.run(comp + ["up", "-d"], timeout=120))
+    try:
+        _docker().start(_container_name())
+        return "OK"
+    except Exception as e:
+        logging.warning("docker start: %s", e)
+        return f"Error: {e}"
+
+def _start_result(r):
+    if r.timed_out:
+        return "Docker no respondió a tiempo."
+    if not r.ok:
+        return r.stderr.strip() or f"Error (rc={r.rc})"
+    return r.text or "OK"
+
+def _rcon_exec(*args) -> str:
+    try:
+        _, out = _docker().exec(_container_name(), ["rcon-cli", *args], timeout=30)
+        return out.strip()
+    except Exception as e:
+        logging.warning("docker exec rcon-cli %s: %s", " ".join(args), e)
+        return ""
+
+def _rcon_target():
+    """
+    (host, port, password) para RCON: MC_RCON_HOST/MC_RCON_PASSWORD o, si faltan,
+    la IP del contenedor y RCON_PASSWORD/RCON_PORT de su entorno (imagen itzg). None si no hay datos.
+    """
+    host = os.getenv("MC_RCON_HOST", "").strip()
+    password = os.getenv("MC_RCON_PASSWORD", "").strip()
+    port = rcon.MC_RCON_PORT
+    if host and password:
+        return host, port, password
+
+    info = _docker().inspect(_container_name()) or {}
+    env = dict(e.split("=", 1) for e in (info.get("Config") or {}).get("Env") or [] if "=" in e)
+    password = password or env.get("RCON_PASSWORD", "")
+    if not os.getenv("MC_RCON_PORT") and env.get("RCON_PORT", "").isdigit():
+        port = int(env["RCON_PORT"])
+    if not host:
+        nets = (info.get("NetworkSettings") or {}).get("Networks") or {}
+        host = next((n["IPAddress"] for n in nets.values() if n.get("IPAddress")), "")
+    if not host or not password:
+        return None
+    return host, port, password
+
+def _rcon_client() -> Optional[rcon.RconClient]:
+    with _RCON_LOCK:
+        if _RCON["client"] is None:
+            target = _rcon_target()
+            if target is None:
+                return None
+            host, port, password = target
+            _RCON["client"] = rcon.RconClient(host, password, port=port)
+        return _RCON["client"]
+
+def _reset_rcon():
+    # p.ej. tras reiniciar el contenedor: la IP puede cambiar
+    with _RCON_LOCK:
+        client, _RCON["client"] = _RCON["client"], None
+    if client is not None:
+        client.close()
+
+def _rcon_command(*args) -> str:
+    """Comando por la conexión RCON persistente; si no es accesible, `docker exec rcon-cli`."""
+    cmd = " ".join(args)
+    try:
+        client = _rcon_client()
+        if client is not None:
+            return client.command(cmd).strip()
+    except rcon.RconSentError as e:
+        # ya salió por RCON: repetirlo por rcon-cli podría mandar `stop` dos veces
+        logging.warning("RCON %s: %s", cmd, e)
+        _reset_rcon()
+        return ""
+    except Exception as e:
+        logging.warning("RCON %s: %s", cmd, e)
+        _reset_rcon()
+    return _rcon_exec(*args)
 
 def mc_stop():
-    name = _container_name()
     if _is_running():
-        llamadaSistema(f"docker exec {name} rcon-cli save-all 2>/dev/null")
-        llamadaSistema(f"docker exec {name} rcon-cli stop 2>/dev/null")
+        _rcon_command("save-all")
+        _rcon_command("stop")
         time.sleep(2)
         return "Envié stop por RCON (apaga guardando)."
     return "Servidor ya estaba apagado."
@@ -70,14 +185,26 @@ def mc_detail():
     name = _container_name()
     comp = _compose_cmd()
 
-    if comp:
-        ps = llamadaSistema(f"{comp} ps").strip()
-    else:
-        ps = llamadaSistema(f"docker ps -a --filter name={name}").strip()
+    ps = runner.run(comp + ["ps"], timeout=20).text if comp else _ps_table(name)
+    return f"{ps}\n\n--- logs (tail 30) ---\n{_logs_tail(name, 30)}"
 
-    logs = llamadaSistema(f"docker logs --tail 30 {name}").strip()
-    out = f"{ps}\n\n--- logs (tail 30) ---\n{logs}"
-    return out
+def _ps_table(name: str) -> str:
+    try:
+        items = _docker().list_containers(all=True, filters={"name": [name]})
+    except Exception as e:
+        return f"docker no responde: {e}"
+    rows = ["NAMES\tIMAGE\tSTATUS"]
+    for c in items:
+        names = ",".join(n.lstrip("/") for n in c.get("Names", []))
+        rows.append(f"{names}\t{c.get('Image', '')}\t{c.get('Status', '')}")
+    return "\n".join(rows)
+
+def _logs_tail(name: str, tail: int) -> str:
+    try:
+        return _docker().logs(name, tail=tail).strip()
+    except Exception as e:
+        logging.warning("docker logs %s: %s", name, e)
+        return ""
 
 def gen_markup_mc():
     markup = InlineKeyboardMarkup(row_width=3)
@@ -92,16 +219,57 @@ def gen_markup_mc():
     )
     return markup
 
-def minecraft(bot, message):
-    text, running = mc_status_text()
+def _panel_text(text, players=None, info=""):
     extra = ""
-    if running:
-        _, count, names = mc_players_online()
+    if info:
+        extra += f"\n{info}"
+    if players is not None:
+        _, count, names = players
         if count > 0:
-            extra = f"\n\nOnline ({count}): " + ", ".join(names)
+            shown, rest = ", ".join(names), count - len(names)
+            if rest > 0:
+                shown = f"{shown} y {rest} más" if names else "(el servidor oculta los nombres)"
+            extra += f"\n\nOnline ({count}): " + shown
         else:
-            extra = "\n\nOnline: 0"
-    bot.send_message(message.chat.id, f"Estado Minecraft:\n{text}{extra}", reply_markup=gen_markup_mc())
+            extra += "\n\nOnline: 0"
+    return f"Estado Minecraft:\n{text}{extra}"
+
+def _panel_players():
+    """(players, info) para /mc: Server List Ping; si no responde, log/RCON."""
+    st = mc_slp_status()
+    if st is None:
+        return mc_players_online(), ""
+    names = st.sample
+    # sample viene recortado (vanilla: 12) o vacío si el servidor oculta jugadores
+    if len(names) < st.online:
+        full = mc_players_online()[2]
+        if len(full) > len(names):
+            names = full
+    return ("", st.online, names), f"Versión {st.version} · ping {st.latency_ms:.0f} ms"
+
+def _online_text(players):
+    text, count, names = players
+    if count == 0:
+        return text
+    return "Online:\n- " + "\n- ".join(names)
+
+def online_reply_text(players):
+    """Respuesta de /online a partir de (texto, count, names)."""
+    text, count, names = players
+    if count == 0:
+        return "No hay jugadores conectados ahora.\n" + text
+    return f"Jugadores conectados ({count}):\n- " + "\n- ".join(names)
+
+def _detail_text(out):
+    # Telegram limita longitud; recortamos por seguridad
+    if len(out) > 3500:
+        out = out[-3500:]
+    return f"Detalle:\n{out}"
+
+def minecraft(bot, message):
+    text, running = mc_status_text()
+    players, info = _panel_players() if running else (None, "")
+    bot.send_message(message.chat.id, _panel_text(text, players, info), reply_markup=gen_markup_mc())
 
 def handle_minecraft_callback(bot, call):
     # call.data: mc:stop | mc:start | mc:detalle
@@ -119,17 +287,9 @@ def handle_minecraft_callback(bot, call):
         out = mc_start()
         msg = f"Start:\n{out}"
     elif action == "mc:detalle":
-        out = mc_detail()
-        # Telegram limita longitud; recortamos por seguridad
-        if len(out) > 3500:
-            out = out[-3500:]
-        msg = f"Detalle:\n{out}"
+        msg = _detail_text(mc_detail())
     elif action == "mc:online":
-        text, count, names = mc_players_online()
-        if count == 0:
-            msg = text
-        else:
-            msg = "Online:\n- " + "\n- ".join(names)
+        msg = _online_text(mc_players_online())
     elif action == "mc:last":
         msg = "Ultima actividad:\n" + mc_last_activity()
     else:
@@ -140,79 +300,92 @@ def handle_minecraft_callback(bot, call):
     bot.send_message(call.message.chat.id, msg)
     
 def _is_running():
-    name = _container_name()
-    out = llamadaSistema(f"docker inspect -f '{{{{.State.Running}}}}' {name} 2>/dev/null").strip()
-    return out == "true"
+    if _MC_WATCH["alive"]:
+        return _MC_WATCH["state"] != "off"
+    try:
+        info = _docker().inspect(_container_name())
+    except Exception as e:
+        logging.warning("docker inspect: %s", e)
+        return False
+    return bool(info and info.get("State", {}).get("Running"))
     
+def _parse_players(out: str):
+    # "There are 0 of a max of 20 players online: "
+    p = rcon.parse_list(out)
+    if p is None:
+        return "No pude leer jugadores (RCON).", 0, []
+    return out, p.count, p.names
+
 def mc_players_online():
     if not _is_running():
         return "Servidor apagado.", 0, []
-    name = _container_name()
-    # "There are 0 of a max of 20 players online: "
-    out = llamadaSistema(f"docker exec {name} rcon-cli list 2>/dev/null").strip()
-    m = re.search(r"There are (\d+) of a max of \d+ players online(?:: (.*))?", out)
-    if not m:
-        return "No pude leer jugadores (RCON).", 0, []
-    count = int(m.group(1))
-    names = []
-    if m.group(2):
-        names = [x.strip() for x in m.group(2).split(",") if x.strip()]
-    return out, count, names
+    if mc_sessions.is_alive():
+        names = mc_sessions.online()
+        return "(según el log del servidor)", len(names), names
+    return _parse_players(_rcon_command("list"))
 
-def mc_last_activity():
-    name = _container_name()
-    lines = llamadaSistema(f"docker logs --tail 500 {name} 2>/dev/null").splitlines()
-    if not lines:
-        return "Sin logs."
+def _rcon_online_names():
+    return _parse_players(_rcon_command("list"))[2]
 
-    patterns = [
-        re.compile(r".*\bjoined the game\b.*", re.IGNORECASE),
-        re.compile(r".*\bleft the game\b.*", re.IGNORECASE),
-        re.compile(r".*\blogged in with entity id\b.*", re.IGNORECASE),
-        re.compile(r".*\blost connection\b.*", re.IGNORECASE),
-    ]
+_ACTIVITY_PATTERNS = [
+    re.compile(r".*\bjoined the game\b.*", re.IGNORECASE),
+    re.compile(r".*\bleft the game\b.*", re.IGNORECASE),
+    re.compile(r".*\blogged in with entity id\b.*", re.IGNORECASE),
+    re.compile(r".*\blost connection\b.*", re.IGNORECASE),
+]
 
-    # Ignorar errores ruidosos de log4j
-    ignore = re.compile(r"Unable to locate appender|TerminalConsole", re.IGNORECASE)
+# Ignorar errores ruidosos de log4j
+_ACTIVITY_IGNORE = re.compile(r"Unable to locate appender|TerminalConsole", re.IGNORECASE)
+
+def _last_activity_from_lines(lines):
+    if not lines:
+        return "Sin logs."
 
     for line in reversed(lines):
-        if ignore.search(line):
+        if _ACTIVITY_IGNORE.search(line):
             continue
-        for rx in patterns:
+        for rx in _ACTIVITY_PATTERNS:
             if rx.search(line):
                 return line
 
     # fallback: última línea no ignorada
     for line in reversed(lines):
-        if not ignore.search(line):
+        if not _ACTIVITY_IGNORE.search(line):
             return line
 
     return lines[-1]
 
+def mc_last_activity():
+    if mc_sessions.is_alive() or mc_sessions.last_event() is not None:
+        return mc_sessions.last_activity()
+    return _last_activity_from_lines(_logs_tail(_container_name(), 500).splitlines())
+
+def _state_from_status(status: str) -> str:
+    if not status:
+        return "off"
+    s = status.lower()
+    if s.startswith("up"):
+        # ejemplos: "Up 2 minutes (healthy)" / "Up 30 seconds (health: starting)"
+        if ("health: starting" in s or "starting" in s) and "healthy" not in s:
+            return "starting"
+        return "on"
+    return "off"
+
 def _mc_state_cached(cache_seconds: int = 5) -> Tuple[str, str]:
     """
     state: off | starting | on
     status: texto (docker ps status)
+    Con el watcher de eventos vivo se lee de memoria; si no, docker ps cada cache_seconds.
     """
+    if _MC_WATCH["alive"]:
+        return _MC_WATCH["state"], _watch_status_text()
+
     now = time.time()
     if now - _MC_CACHE["ts"] < cache_seconds:
         return _MC_CACHE["state"], _MC_CACHE["status"]
 
-    name = os.getenv("MC_CONTAINER", "minecraft").strip()
-    status = llamadaSistema(f"docker ps -a --filter name={name} --format '{{{{.Status}}}}'").strip()
-
-    if not status:
-        state = "off"
-    else:
-        s = status.lower()
-        if s.startswith("up"):
-            # ejemplos: "Up 2 minutes (healthy)" / "Up 30 seconds (health: starting)"
-            if ("health: starting" in s or "starting" in s) and "healthy" not in s:
-                state = "starting"
-            else:
-                state = "on"
-        else:
-            state = "off"
+    status = _docker_ps_status(_container_name())
+    state = _state_from_status(status)
 
     _MC_CACHE.update({"ts": now, "state": state, "status": status})
     return state, status
@@ -222,10 +395,416 @@ def _mc_players_cached(cache_seconds: int = 10):
     if now - _MC_PLAYERS_CACHE["ts"] < cache_seconds:
         return _MC_PLAYERS_CACHE["count"], _MC_PLAYERS_CACHE["names"]
     try:
-        text, count, names = mc_players_online()  # tu función (usa rcon-cli)
+        st = mc_slp_status()
+        if st is not None:
+            count, names = st.online, st.sample
+        else:
+            text, count, names = mc_players_online()  # log / RCON si el ping no responde
         _MC_PLAYERS_CACHE.update({"ts": now, "count": count, "names": names})
         return count, names
     except Exception:
         _MC_PLAYERS_CACHE.update({"ts": now, "count": 0, "names": []})
         return 0, []
 
+
+# ---------------------------------------------------------------------------
+# Server List Ping (puerto 25565): jugadores, versión y latencia en un solo
+# ida y vuelta TCP, sin autenticación y sin pasar por docker ni RCON.
+# ---------------------------------------------------------------------------
+
+class SlpStatus(NamedTuple):
+    online: int
+    max: int
+    sample: list[str]     # el servidor manda como mucho ~12 nombres
+    version: str
+    motd: str
+    latency_ms: float
+
+def _mc_host():
+    return os.getenv("MC_HOST", "127.0.0.1").strip()
+
+def _mc_port():
+    return int(os.getenv("MC_PORT", "25565"))
+
+def _varint(n: int) -> bytes:
+    n &= 0xFFFFFFFF
+    out = bytearray()
+    while True:
+        b = n & 0x7F
+        n >>= 7
+        if n:
+            out.append(b | 0x80)
+        else:
+            out.append(b)
+            return bytes(out)
+
+def _read_varint(f) -> int:
+    n = 0
+    for i in range(5):
+        b = f.read(1)
+        if not b:
+            raise ConnectionError("SLP: conexión cerrada")
+        n |= (b[0] & 0x7F) << (7 * i)
+        if not b[0] & 0x80:
+            return n - (1 << 32) if n & 0x80000000 else n
+    raise ValueError("SLP: VarInt demasiado largo")
+
+def _packet(packet_id: int, payload: bytes = b"") -> bytes:
+    body = _varint(packet_id) + payload
+    return _varint(len(body)) + body
+
+def _read_packet(f) -> tuple[int, io.BytesIO]:
+    length = _read_varint(f)
+    data = f.read(length)
+    if len(data) < length:
+        raise ConnectionError("SLP: paquete incompleto")
+    body = io.BytesIO(data)
+    return _read_varint(body), body
+
+def _motd_text(desc) -> str:
+    # description puede ser texto o un componente de chat {"text": ..., "extra": [...]}
+    if isinstance(desc, str):
+        return desc
+    if isinstance(desc, dict):
+        extra = desc.get("extra")
+        return _motd_text(desc.get("text", "")) + _motd_text(extra if isinstance(extra, list) else [])
+    if isinstance(desc, list):
+        return "".join(_motd_text(x) for x in desc)
+    return ""
+
+def slp_query(host: str, port: int, timeout: float = 2.0) -> SlpStatus:
+    """Handshake + status request + ping (protocolo 1.7+)."""
+    host_b = host.encode("utf-8")
+    handshake = _packet(0x00, _varint(-1) + _varint(len(host_b)) + host_b + struct.pack(">H", port) + _varint(1))
+    with socket.create_connection((host, port), timeout=timeout) as sock:
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        f = sock.makefile("rb")
+        sock.sendall(handshake + _packet(0x00))
+        pid, body = _read_packet(f)
+        if pid != 0x00:
+            raise ValueError(f"SLP: respuesta inesperada (id {pid})")
+        info = json.loads(body.read(_read_varint(body)).decode("utf-8"))
+
+        t0 = time.perf_counter()
+        sock.sendall(_packet(0x01, struct.pack(">q", 1)))
+        _read_packet(f)
+        latency = (time.perf_counter() - t0) * 1000
+
+    # servidores modificados/proxies mandan a veces JSON con otra forma
+    if not isinstance(info, dict):
+        raise ValueError("SLP: respuesta JSON no es un objeto")
+    players = info.get("players")
+    players = players if isinstance(players, dict) else {}
+    sample = players.get("sample")
+    version = info.get("version")
+    return SlpStatus(
+        online=int(players.get("online") or 0),
+        max=int(players.get("max") or 0),
+        sample=[str(p["name"]) for p in sample if isinstance(p, dict) and p.get("name")]
+        if isinstance(sample, list) else [],
+        version=str(version.get("name", "")) if isinstance(version, dict) else "",
+        motd=_motd_text(info.get("description")).strip(),
+        latency_ms=latency,
+    )
+
+def mc_slp_status(ttl: float = 5) -> Optional[SlpStatus]:
+    """SLP a MC_HOST:MC_PORT con cache corta; None si el servidor no responde."""
+    now = time.time()
+    if now - _SLP_CACHE["ts"] < ttl:
+        return _SLP_CACHE["status"]
+    try:
+        st = slp_query(_mc_host(), _mc_port())
+    except (OSError, ValueError, ConnectionError, AttributeError, TypeError, KeyError) as e:
+        logging.debug("SLP %s:%s: %s", _mc_host(), _mc_port(), e)
+        st = None
+    _SLP_CACHE.update({"ts": now, "status": st})
+    return st
+
+
+# ---------------------------------------------------------------------------
+# Estadísticas de juego (/mc_stats, /mc_top) desde mc_stats
+# ---------------------------------------------------------------------------
+
+def _fmt_duration(seconds: float) -> str:
+    minutes = int(seconds // 60)
+    if minutes < 60:
+        return f"{minutes}m"
+    return f"{minutes // 60}h {minutes % 60:02d}m"
+
+def _fmt_date(ts) -> str:
+    return time.strftime("%d/%m/%Y %H:%M", time.localtime(ts)) if ts else "—"
+
+def mc_stats_text(player: Optional[str] = None) -> str:
+    if player:
+        st = mc_stats.player_stats(player)
+        if st is None:
+            return f"Sin registros de {player}."
+        lines = [
+            f"Estadísticas de {st['player']}",
+            f"Tiempo total: {_fmt_duration(st['seconds'])} en {st['sessions']} sesiones",
+            f"Sesión más larga: {_fmt_duration(st['longest'])}",
+            f"Primera vez: {_fmt_date(st['first_seen'])}",
+            f"Última vez: {_fmt_date(st['last_seen'])}",
+        ]
+        if st["online_for"] is not None:
+            lines.append(f"Conectado ahora ({_fmt_duration(st['online_for'])})")
+        if st["per_day"]:
+            lines += ["", "Últimos 7 días:"]
+            lines += [f"  {day[5:]}: {_fmt_duration(secs)}" for day, secs in st["per_day"]]
+        return "\n".join(lines)
+
+    st = mc_stats.summary()
+    lines = [
+        "Estadísticas Minecraft",
+        f"Jugadores: {st['players']}",
+        f"Tiempo total: {_fmt_duration(st['seconds'])} en {st['sessions']} sesiones",
+    ]
+    if st["peak"]:
+        peak, at = st["peak"]
+        lines.append(f"Pico de conectados: {peak} ({_fmt_date(at)})")
+    if st["online"]:
+        lines.append("Online: " + ", ".join(st["online"]))
+    if st["per_day"]:
+        lines += ["", "Últimos 7 días (tiempo | jugadores):"]
+        lines += [f"  {day[5:]}: {_fmt_duration(secs)} | {n}" for day, secs, n in st["per_day"]]
+    return "\n".join(lines)
+
+def mc_top_text(limit: int = 10) -> str:
+    rows = mc_stats.top(limit)
+    if not rows:
+        return "Todavía no hay sesiones registradas."
+    # en 7 días juegan pocos: se piden todos para no dejar a nadie del top total en 0
+    week = dict(mc_stats.top(limit=1000, days=7))
+    lines = ["Top jugadores (total | últimos 7 días):"]
+    for i, (name, secs) in enumerate(rows, 1):
+        lines.append(f"{i}. {name}: {_fmt_duration(secs)} | {_fmt_duration(week.get(name, 0))}")
+    return "\n".join(lines)
+
+
+# ---------------------------------------------------------------------------
+# Watcher de eventos de docker: estado off/starting/on en memoria, actualizado
+# al llegar start/die/health_status en vez de preguntar a docker cada 5 s.
+# ---------------------------------------------------------------------------
+
+_MC_WATCH = {
+    "alive": False,       # stream de eventos conectado y estado sincronizado
+    "exists": False,
+    "state": "off",
+    "health": "",         # "", starting, healthy, unhealthy
+    "has_health": False,  # el contenedor define healthcheck
+    "started_at": 0.0,
+    "exit_code": None,
+}
+_MC_WATCH_LOCK = threading.Lock()
+_MC_WATCH_THREAD: Optional[threading.Thread] = None
+
+# Salidas "normales": stop por RCON (0) o SIGTERM de docker stop (143)
+_CLEAN_EXIT_CODES = {0, 143}
+
+
+def _parse_docker_time(value: str) -> float:
+    # "2024-05-01T12:34:56.123456789Z"; "0001-01-01T00:00:00Z" si nunca arrancó
+    try:
+        dt = datetime.strptime(value[:19], "%Y-%m-%dT%H:%M:%S").replace(tzinfo=timezone.utc)
+        return max(0.0, dt.timestamp())
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def _fmt_uptime(seconds: float) -> str:
+    seconds = int(max(0, seconds))
+    for size, unit in ((86400, "day"), (3600, "hour"), (60, "minute")):
+        if seconds >= size:
+            n = seconds // size
+            return f"{n} {unit}{'s' if n > 1 else ''}"
+    return f"{seconds} seconds"
+
+
+def _watch_status_text() -> str:
+    """Equivalente al Status de docker ps ("Up 5 minutes (healthy)") a partir del estado en memoria."""
+    w = _MC_WATCH
+    if not w["exists"]:
+        return ""
+    if w["state"] == "off":
+        code = w["exit_code"]
+        return f"Exited ({code})" if code is not None else "Exited"
+    text = f"Up {_fmt_uptime(time.time() - w['started_at'])}"
+    if w["health"] == "starting":
+        text += " (health: starting)"
+    elif w["health"]:
+        text += f" ({w['health']})"
+    return text
+
+
+def _sync_from_inspect():
+    info = _docker().inspect(_container_name())
+    with _MC_WATCH_LOCK:
+        if not info:
+            _MC_WATCH.update({"exists": False, "state": "off", "health": "", "has_health": False,
+                              "started_at": 0.0, "exit_code": None})
+            return
+        st = info.get("State", {})
+        health = (st.get("Health") or {}).get("Status", "")
+        has_health = bool((info.get("Config") or {}).get("Healthcheck")) or bool(health)
+        if st.get("Running"):
+            state = "starting" if health == "starting" else "on"
+        else:
+            state = "off"
+        _MC_WATCH.update({
+            "exists": True,
+            "state": state,
+            "health": health,
+            "has_health": has_health,
+            "started_at": _parse_docker_time(st.get("StartedAt", "")),
+            "exit_code": st.get("ExitCode"),
+        })
+
+
+def _apply_event(ev: dict) -> Optional[str]:
+    """Actualiza _MC_WATCH con un evento de contenedor. Devuelve un aviso para admins o None."""
+    action = ev.get("Action") or ev.get("status") or ""
+    attrs = (ev.get("Actor") or {}).get("Attributes") or {}
+    name = _container_name()
+    ts = ev.get("time") or time.time()
+
+    with _MC_WATCH_LOCK:
+        w = _MC_WATCH
+        if action == "start":
+            w.update({"exists": True, "started_at": float(ts), "exit_code": None})
+            if w["has_health"]:
+                w.update({"state": "starting", "health": "starting"})
+            else:
+                w.update({"state": "on", "health": ""})
+                return f"✅ Minecraft `{name}` arrancó."
+        elif action.startswith("health_status"):
+            health = action.split(":", 1)[1].strip() if ":" in action else ""
+            prev = w["health"]
+            w.update({"health": health, "has_health": True})
+            if w["state"] != "off":
+                w["state"] = "starting" if health == "starting" else "on"
+            if health == "healthy" and prev != "healthy":
+                return f"✅ Minecraft `{name}` listo (healthy)."
+            if health == "unhealthy" and prev != "unhealthy":
+                return f"⚠️ Minecraft `{name}` unhealthy."
+        elif action == "die":
+            try:
+                code = int(attrs.get("exitCode", 0))
+            except (TypeError, ValueError):
+                code = None
+            w.update({"state": "off", "health": "", "exit_code": code})
+            if code is not None and code not in _CLEAN_EXIT_CODES:
+                return f"💥 Minecraft `{name}` se cayó (exit {code})."
+        elif action == "destroy":
+            w.update({"exists": False, "state": "off", "health": "", "exit_code": None})
+    return None
+
+
+def _mc_watch_loop(notify: Optional[Callable[[str], None]]):
+    backoff = 1
+    filters = {"type": ["container"], "container": [_container_name()],
+               "event": ["start", "die", "destroy", "health_status"]}
+    while True:
+        since = int(time.time())
+        try:
+            _sync_from_inspect()
+            _MC_WATCH["alive"] = True
+            backoff = 1
+            # since: no perder eventos entre el inspect y la conexión del stream
+            for ev in _docker().events(filters=filters, since=since):
+                if ev.get("Action") == "start":
+                    _reset_rcon()
+                msg = _apply_event(ev)
+                if msg and notify:
+                    try:
+                        notify(msg)
+                    except Exception:
+                        logging.exception("mc watcher: aviso falló")
+            logging.warning("mc watcher: dockerd cerró el stream de eventos")
+        except Exception as e:
+            logging.warning("mc watcher: %s", e)
+        _MC_WATCH["alive"] = False  # mientras tanto, _mc_state_cached vuelve a docker ps
+        time.sleep(backoff)
+        backoff = min(backoff * 2, 60)
+
+
+def start_mc_watcher(notify: Optional[Callable[[str], None]] = None):
+    """Arranca (una vez) el hilo que sigue /events del contenedor de Minecraft."""
+    global _MC_WATCH_THREAD
+    if _MC_WATCH_THREAD and _MC_WATCH_THREAD.is_alive():
+        return
+    _MC_WATCH_THREAD = threading.Thread(target=_mc_watch_loop, args=(notify,), name="mc-watcher", daemon=True)
+    _MC_WATCH_THREAD.start()
+
+
+def start_mc_log_follower():
+    """Sigue el log del contenedor (mc_sessions); las sesiones abiertas al arrancar salen de RCON."""
+    mc_sessions.start_follower(_container_name, _is_running, seed=_rcon_online_names)
+
+
+# ---------------------------------------------------------------------------
+# Modo asyncio (bot_async). Las llamadas a la API de docker son unos ms por
+# el socket unix y van a un hilo; docker compose sigue siendo subprocess async.
+# ---------------------------------------------------------------------------
+
+async def mc_status_text_async():
+    return await asyncio.to_thread(mc_status_text)
+
+async def mc_players_online_async():
+    return await asyncio.to_thread(mc_players_online)
+
+async def mc_last_activity_async():
+    return await asyncio.to_thread(mc_last_activity)
+
+async def mc_start_async():
+    comp = _compose_cmd()
+    if comp:
+        return _start_result(await runner.arun(comp + ["up", "-d"], timeout=120))
+    return await asyncio.to_thread(mc_start)
+
+async def mc_stop_async():
+    if await asyncio.to_thread(_is_running):
+        await asyncio.to_thread(_rcon_command, "save-all")
+        await asyncio.to_thread(_rcon_command, "stop")
+        await asyncio.sleep(2)
+        return "Envié stop por RCON (apaga guardando)."
+    return "Servidor ya estaba apagado."
+
+async def mc_detail_async():
+    name = _container_name()
+    comp = _compose_cmd()
+    if comp:
+        ps = (await runner.arun(comp + ["ps"], timeout=20)).text
+    else:
+        ps = await asyncio.to_thread(_ps_table, name)
+    logs = await asyncio.to_thread(_logs_tail, name, 30)
+    return f"{ps}\n\n--- logs (tail 30) ---\n{logs}"
+
+async def minecraft_async(abot, message):
+    text, running = await mc_status_text_async()
+    players, info = await asyncio.to_thread(_panel_players) if running else (None, "")
+    await abot.send_message(message.chat.id, _panel_text(text, players, info), reply_markup=gen_markup_mc())
+
+async def handle_minecraft_callback_async(abot, call):
+    try:
+        await abot.answer_callback_query(call.id)
+    except Exception:
+        pass
+
+    action = call.data
+
+    if action == "mc:stop":
+        msg = f"Stop:\n{await mc_stop_async()}"
+    elif action == "mc:start":
+        msg = f"Start:\n{await mc_start_async()}"
+    elif action == "mc:detalle":
+        msg = _detail_text(await mc_detail_async())
+    elif action == "mc:online":
+        msg = _online_text(await mc_players_online_async())
+    elif action == "mc:last":
+        msg = "Ultima actividad:\n" + await mc_last_activity_async()
+    else:
+        msg = "Comando desconocido."
+
+    logging.info("minecraft action=%s", action)
+    log_action(_user(call), action)
+    await abot.send_message(call.message.chat.id, msg)
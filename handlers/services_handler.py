@@ -1,35 +1,131 @@
 # handlers/services_handler.py
 
+import os
+import time
 import subprocess
 import logging
+from typing import Callable, Optional
 
 from telebot.types import InlineKeyboardMarkup, InlineKeyboardButton
 from logger import log_action
+import systemd_api
+from sysmetrics import fmt_bytes
 
 SERVICES = {
     "plex": "plexmediaserver",
     "zerotier": "zerotier-one",
+    "transmission": "transmission-daemon",
+    "docker": "docker",
+    "bot": os.getenv("BOT_SERVICE", "bot_telegram"),
 }
+# Solo se consultan: parar el propio bot o docker desde un botón no tiene vuelta atrás
+_READ_ONLY = {"bot", "docker"}
+
+SVC_ALERT_COOLDOWN_S = int(os.getenv("SVC_ALERT_COOLDOWN_S", "900"))
+# Tras un start/stop desde el bot, los cambios de esa unidad no se avisan
+_QUIET_S = 60
+_alerts = {"sent": {}, "down": set(), "quiet": {}}   # unidad -> ts / unidades avisadas caídas
 
 def _service_status(service_name: str) -> str:
-    result = subprocess.run(
-        ["systemctl", "is-active", service_name],
-        capture_output=True, text=True
-    )
-    return result.stdout.strip()  # "active" | "inactive" | "failed"
+    return systemd_api.unit_active(service_name)  # "active" | "inactive" | "failed"
 
 def _service_action(action: str, service_name: str) -> int:
+    # antes de lanzarlo: el watcher puede ver el "Stopped" mientras systemctl aún no ha vuelto
+    _alerts["quiet"][service_name] = time.time() + _QUIET_S
     result = subprocess.run(
         ["sudo", "systemctl", action, service_name],
         capture_output=True, text=True
     )
+    _alerts["quiet"][service_name] = time.time() + _QUIET_S
+    systemd_api.invalidate(service_name)
     return result.returncode
 
+def _fmt_uptime(seconds: float) -> str:
+    minutes = int(seconds // 60)
+    days, minutes = divmod(minutes, 1440)
+    hours, minutes = divmod(minutes, 60)
+    if days:
+        return f"{days}d {hours}h"
+    if hours:
+        return f"{hours}h {minutes}m"
+    return f"{minutes}m"
+
+def _status_line(cmd: str, st) -> str:
+    if st is None or st.load == "not-found":
+        return f"⚪ {cmd}: no instalado"
+    icon = {"active": "🟢", "failed": "🔴", "activating": "🟡", "reloading": "🟡"}.get(st.active, "⚫")
+    parts = [f"{st.active} ({st.sub})" if st.sub else st.active]
+    if st.uptime is not None:
+        parts.append(_fmt_uptime(st.uptime))
+    if st.memory is not None:
+        parts.append(fmt_bytes(st.memory))
+    if st.cpu_pct is not None:
+        parts.append(f"CPU {st.cpu_pct:.1f}%")
+    if st.restarts:
+        parts.append(f"{st.restarts} reinicios")
+    return f"{icon} {cmd}: " + " · ".join(parts)
+
+def services_dashboard_text() -> str:
+    """Todos los servicios de SERVICES a partir de un solo `systemctl show`."""
+    try:
+        units = systemd_api.status(list(SERVICES.values()))
+    except systemd_api.SystemdError as e:
+        return f"No pude consultar systemd: {e}"
+    lines = ["Servicios"]
+    lines += [_status_line(cmd, units.get(unit)) for cmd, unit in SERVICES.items()]
+    return "\n".join(lines)
+
+def _dashboard_markup() -> InlineKeyboardMarkup:
+    markup = InlineKeyboardMarkup(row_width=1)
+    markup.add(InlineKeyboardButton("Actualizar", callback_data="svc:all:status"))
+    return markup
+
+def _alert_text(unit: str, prev, st) -> Optional[str]:
+    """Texto del aviso para un cambio de estado, o None si no hay que avisar."""
+    cmd = next((c for c, u in SERVICES.items() if u == unit), unit)
+    if cmd == "bot" or prev is None:
+        return None
+    now = time.time()
+    if now < _alerts["quiet"].get(unit, 0):
+        return None
+
+    if st.active in ("failed", "inactive") and prev.active not in ("failed", "inactive"):
+        last = _alerts["sent"].get(unit)
+        if last is not None and now - last < SVC_ALERT_COOLDOWN_S:
+            return None
+        _alerts["sent"][unit] = now
+        _alerts["down"].add(unit)
+        if st.active == "failed":
+            why = f" ({st.result})" if st.result and st.result != "success" else ""
+            return f"🔴 {cmd} ({unit}) ha fallado{why}."
+        return f"⚫ {cmd} ({unit}) se ha parado."
+
+    if st.active == "active" and unit in _alerts["down"]:
+        _alerts["down"].discard(unit)
+        return f"🟢 {cmd} ({unit}) vuelve a estar activo."
+    return None
+
+def start_service_watcher(notify: Callable[[str], None]):
+    """Sigue los cambios de estado de SERVICES (journal) y avisa con notify(texto)."""
+    def _on_change(unit, prev, st):
+        text = _alert_text(unit, prev, st)
+        if text:
+            notify(text)
+
+    systemd_api.watch_units(list(SERVICES.values()), _on_change)
+
+def servicios(bot, message):
+    log_action(_user(message), "/servicios")
+    bot.reply_to(message, services_dashboard_text(), reply_markup=_dashboard_markup())
+
 def _user(message):
     return message.from_user.username or str(message.from_user.id)
 
 def _gen_markup(cmd: str) -> InlineKeyboardMarkup:
     markup = InlineKeyboardMarkup(row_width=3)
+    if cmd in _READ_ONLY:
+        markup.add(InlineKeyboardButton("Estado", callback_data=f"svc:{cmd}:status"))
+        return markup
     markup.add(
         InlineKeyboardButton("Estado",   callback_data=f"svc:{cmd}:status"),
         InlineKeyboardButton("Encender", callback_data=f"svc:{cmd}:start"),
@@ -48,6 +144,10 @@ def services(bot, message, ADMIN_IDS):
 
     service_name = SERVICES[cmd]
 
+    if action in ("on", "off", "start", "stop") and cmd in _READ_ONLY:
+        bot.reply_to(message, f"{cmd} solo se puede consultar desde aquí.")
+        return
+
     if action in ("on", "off", "start", "stop") and message.from_user.id not in ADMIN_IDS:
         logging.warning("action user=%s cmd=/%s action=%s DENIED (not admin)", _user(message), cmd, action)
         bot.reply_to(message, "No tienes permiso para hacer eso.")
@@ -92,12 +192,21 @@ def handle_service_callback(bot, call, ADMIN_IDS):
 
     _, cmd, action = parts
 
+    if cmd == "all":
+        log_action(_user(call), "svc:all")
+        bot.send_message(call.message.chat.id, services_dashboard_text(), reply_markup=_dashboard_markup())
+        return
+
     if cmd not in SERVICES:
         bot.send_message(call.message.chat.id, f"Servicio desconocido: {cmd}")
         return
 
     service_name = SERVICES[cmd]
 
+    if action in ("start", "stop") and cmd in _READ_ONLY:
+        bot.send_message(call.message.chat.id, f"{cmd} solo se puede consultar desde aquí.")
+        return
+
     if action in ("start", "stop") and call.from_user.id not in ADMIN_IDS:
         logging.warning("action user=%s svc:%s:%s DENIED (not admin)", _user(call), cmd, action)
         bot.answer_callback_query(call.id, "No autorizado", show_alert=True)
@@ -2,11 +2,15 @@
 
 import os
 import re
-from utils import llamadaSistema, obtener_ip
+from utils import obtener_ip
+import sysmetrics
+import sampler
+import tsdb
+import netinfo
+import runner
 from oled_display import actualizar_pantalla
 from logger import log_action
 import logging
-import subprocess
 import threading
 import time
 from datetime import datetime
@@ -20,68 +24,44 @@ def _bar(pct: int, width: int = 10) -> str:
     filled = int(pct * width / 100)
     return "█" * filled + "░" * (width - filled)
 
-def status(bot, message):
-    try:
-        cpu_line = llamadaSistema("top -bn1 | grep 'Cpu(s)'")
-        memory_usage = llamadaSistema("free -m")
-        disk_usage = llamadaSistema("df -h /")
-        temp = llamadaSistema("vcgencmd measure_temp")
-
-        # CPU %
-        cpu_pct = None
-        for part in cpu_line.split(","):
-            if "id" in part:
-                try:
-                    idle = float(part.strip().split()[0])
-                    cpu_pct = int(100 - idle)
-                except ValueError:
-                    pass
-
-        # RAM
-        memoria_datos = memory_usage.splitlines()[1].split()
-        mem_total = int(memoria_datos[1])
-        mem_usada = int(memoria_datos[2])
-        mem_libre  = int(memoria_datos[3])
-        mem_pct = int(mem_usada * 100 / mem_total) if mem_total else 0
-
-        # Disco /
-        disk_line = disk_usage.splitlines()[-1].split()
-        disk_size  = disk_line[1]
-        disk_used  = disk_line[2]
-        disk_avail = disk_line[3]
-        disk_pct   = int(disk_line[4].replace("%", ""))
-
-        # Disco /media/disco
-        disk2_raw = llamadaSistema("df -h /media/disco")
-        disk2_line = disk2_raw.splitlines()[-1].split()
-        disk2_size  = disk2_line[1]
-        disk2_used  = disk2_line[2]
-        disk2_avail = disk2_line[3]
-        disk2_pct   = int(disk2_line[4].replace("%", ""))
-
-        # Temp
-        temp_val = temp.replace("temp=", "").replace("'C", " °C")
-
-        cpu_bar   = _bar(cpu_pct) if cpu_pct is not None else "N/A"
-        mem_bar   = _bar(mem_pct)
-        disk_bar  = _bar(disk_pct)
-        disk2_bar = _bar(disk2_pct)
-
-        cpu_str = f"{cpu_bar} {cpu_pct}%" if cpu_pct is not None else "N/A"
-
-        respuesta = (
-            "*Estado del sistema*\n\n"
-            f"*Temperatura:* `{temp_val}`\n\n"
-            f"*CPU:*\n`{cpu_str}`\n\n"
-            f"*RAM:*\n`{mem_bar} {mem_pct}%`\n"
-            f"  Usada: {mem_usada} MB / {mem_total} MB  •  Libre: {mem_libre} MB\n\n"
-            f"*Disco (/):*\n`{disk_bar} {disk_pct}%`\n"
-            f"  Usado: {disk_used} / {disk_size}  •  Libre: {disk_avail}\n\n"
-            f"*Disco (/media/disco):*\n`{disk2_bar} {disk2_pct}%`\n"
-            f"  Usado: {disk2_used} / {disk2_size}  •  Libre: {disk2_avail}"
+def status_text() -> str:
+    """Texto Markdown de /status a partir de la última muestra del sampler."""
+    snap = sampler.latest()
+    cpu_pct = snap["cpu"]
+    mem = snap["mem"]
+    temp = snap["temp"]
+
+    temp_val = f"{temp:.1f} °C" if temp is not None else "N/A"
+    cpu_str = f"{_bar(cpu_pct)} {cpu_pct}%" if cpu_pct is not None else "N/A"
+
+    if mem:
+        mem_str = (
+            f"`{_bar(mem['percent'])} {mem['percent']}%`\n"
+            f"  Usada: {mem['used']} MB / {mem['total']} MB  •  Libre: {mem['free']} MB"
+        )
+    else:
+        mem_str = "`N/A`"
+
+    partes = [
+        "*Estado del sistema*\n\n",
+        f"*Temperatura:* `{temp_val}`\n\n",
+        f"*CPU:*\n`{cpu_str}`\n\n",
+        f"*RAM:*\n{mem_str}",
+    ]
+    for path, d in snap["disks"].items():
+        if not d:
+            partes.append(f"\n\n*Disco ({path}):*\n`N/A`")
+            continue
+        partes.append(
+            f"\n\n*Disco ({path}):*\n`{_bar(d['percent'])} {d['percent']}%`\n"
+            f"  Usado: {sysmetrics.fmt_bytes(d['used'])} / {sysmetrics.fmt_bytes(d['size'])}"
+            f"  •  Libre: {sysmetrics.fmt_bytes(d['avail'])}"
         )
+    return "".join(partes)
 
-        bot.reply_to(message, respuesta, parse_mode="Markdown")
+def status(bot, message):
+    try:
+        bot.reply_to(message, status_text(), parse_mode="Markdown")
         log_action(_user(message), "/status")
         actualizar_pantalla("Estado del sistema mostrado")
     except Exception as e:
@@ -99,18 +79,12 @@ _IFACE_LABELS = {
 def _get_labeled_ips() -> list[tuple[str, str]]:
     """
     Devuelve lista de (label, ip) para interfaces conocidas.
-    Usa `ip -o -4 addr` para obtener interfaz + IP.
+    Usa la cache de netinfo (ioctl + netlink, sin forks).
     """
-    raw = llamadaSistema("ip -o -4 addr")
     result = []
     seen = set()
-    for line in raw.splitlines():
-        # formato: "2: eth0    inet 192.168.1.10/24 ..."
-        m = re.match(r"\d+:\s+(\S+)\s+inet\s+([\d.]+)", line)
-        if not m:
-            continue
-        iface, addr = m.group(1), m.group(2)
-        if addr in seen or addr.startswith("127."):
+    for iface, addr in netinfo.ipv4_addresses():
+        if addr in seen:
             continue
         seen.add(addr)
         # Detectar ZeroTier (interfaz tipo zt...)
@@ -122,15 +96,17 @@ def _get_labeled_ips() -> list[tuple[str, str]]:
     return result
 
 
-def ip(bot, message):
-    entries = _get_labeled_ips()
+def ip_text(entries=None) -> str:
+    entries = _get_labeled_ips() if entries is None else entries
     if not entries:
-        texto = "*IP de la Raspberry:*\nNo se encontraron interfaces activas."
-    else:
-        lineas = "\n".join(f"  {label}: `{addr}`" for label, addr in entries)
-        texto = f"*IPs de la Raspberry:*\n{lineas}"
+        return "*IP de la Raspberry:*\nNo se encontraron interfaces activas."
+    lineas = "\n".join(f"  {label}: `{addr}`" for label, addr in entries)
+    return f"*IPs de la Raspberry:*\n{lineas}"
 
-    bot.reply_to(message, texto, parse_mode="Markdown")
+
+def ip(bot, message):
+    entries = _get_labeled_ips()
+    bot.reply_to(message, ip_text(entries), parse_mode="Markdown")
     log_action(_user(message), "/ip")
     first_ip = entries[0][1] if entries else "?"
     actualizar_pantalla(f"IP: {first_ip}")
@@ -163,6 +139,102 @@ def logs(bot, message, log_path: str = "log/bot.log", n: int = 20):
     except Exception as e:
         bot.reply_to(message, f"Error al leer el log: {e}")
         
+# =======================================
+# ============== historial ==============
+# =======================================
+
+_HIST_METRICS = {
+    "temp": ("temp", "Temperatura", "°C"),
+    "temperatura": ("temp", "Temperatura", "°C"),
+    "cpu": ("cpu", "CPU", "%"),
+    "ram": ("mem", "RAM", "%"),
+    "mem": ("mem", "RAM", "%"),
+    "disco": ("disk_root", "Disco (/)", "%"),
+    "disco2": ("disk_media", "Disco (/media/disco)", "%"),
+}
+
+_WINDOW_UNITS = {"m": 60, "h": 3600, "d": 86400, "s": 7 * 86400}
+_SPARK = "▁▂▃▄▅▆▇█"
+
+
+def _parse_window(arg: str, now: float) -> tuple[int, int, str] | None:
+    """'24h', '30m', '7d', '2s' (semanas), 'hoy', 'ayer' o 'anoche' -> (inicio, fin, etiqueta)."""
+    arg = arg.lower()
+    lt = time.localtime(now)
+    midnight = time.mktime((lt.tm_year, lt.tm_mon, lt.tm_mday, 0, 0, 0, 0, 0, -1))
+    if arg == "hoy":
+        return int(midnight), int(now), "hoy"
+    if arg == "ayer":
+        return int(midnight - 86400), int(midnight), "ayer"
+    if arg == "anoche":
+        # 22:00 -> 08:00; si aún es de noche, la noche en curso hasta ahora
+        start = midnight - 2 * 3600 if lt.tm_hour < 22 else midnight + 22 * 3600
+        end = min(start + 10 * 3600, now)
+        return int(start), int(end), "anoche"
+    m = re.fullmatch(r"(\d+)([mhds])", arg)
+    if not m or int(m.group(1)) <= 0:
+        return None
+    span = int(m.group(1)) * _WINDOW_UNITS[m.group(2)]
+    return int(now - span), int(now), f"últimas {arg}"
+
+
+def _sparkline(values: list[float], width: int = 24) -> str:
+    if not values:
+        return ""
+    # Agrupa en `width` columnas tomando el máximo de cada grupo
+    step = max(1, -(-len(values) // width))
+    cols = [max(values[i:i + step]) for i in range(0, len(values), step)]
+    lo, hi = min(cols), max(cols)
+    if hi - lo < 1e-6:
+        return _SPARK[0] * len(cols)
+    return "".join(_SPARK[int((v - lo) * (len(_SPARK) - 1) / (hi - lo))] for v in cols)
+
+
+def historial(bot, message):
+    """/historial <metrica> <ventana>  p.ej. /historial temp anoche, /historial ram 7d"""
+    parts = (message.text or "").strip().split()
+    metric_arg = parts[1].lower() if len(parts) > 1 else "temp"
+    window_arg = parts[2] if len(parts) > 2 else "24h"
+
+    if metric_arg not in _HIST_METRICS:
+        bot.reply_to(message, "Uso: /historial <temp|cpu|ram|disco|disco2> <30m|24h|7d|hoy|ayer|anoche>")
+        return
+    metric, label, unit = _HIST_METRICS[metric_arg]
+
+    now = time.time()
+    window = _parse_window(window_arg, now)
+    if not window:
+        bot.reply_to(message, "Ventana no válida. Ejemplos: 30m, 24h, 7d, 2s, hoy, ayer, anoche")
+        return
+    start, end, window_label = window
+
+    try:
+        rows = tsdb.query(metric, start, end)
+    except Exception as e:
+        logging.exception("Error en /historial: %s", e)
+        bot.reply_to(message, f"Error leyendo el historial: {e}")
+        return
+
+    log_action(_user(message), "/historial", f"{metric} {window_arg}")
+    if not rows:
+        bot.reply_to(message, f"Sin datos de {label} para {window_label}.")
+        return
+
+    lo = min(rows, key=lambda r: r[1])
+    hi = max(rows, key=lambda r: r[2])
+    avg = sum(r[3] for r in rows) / len(rows)
+    fmt_t = lambda ts: time.strftime("%d/%m %H:%M", time.localtime(ts))
+
+    texto = (
+        f"*{label} — {window_label}*\n"
+        f"Mín `{lo[1]:.1f} {unit}` ({fmt_t(lo[0])})\n"
+        f"Media `{avg:.1f} {unit}`\n"
+        f"Máx `{hi[2]:.1f} {unit}` ({fmt_t(hi[0])})\n\n"
+        f"`{_sparkline([r[2] for r in rows])}`\n"
+        f"{fmt_t(rows[0][0])} → {fmt_t(rows[-1][0])}"
+    )
+    bot.reply_to(message, texto, parse_mode="Markdown")
+
 # =======================================
 # =========== backup image pi ===========
 # =======================================
@@ -217,12 +289,11 @@ def run_backup_thread(bot, chat_id, ADMIN_IDS):
 
         status_file = f"/tmp/backup_done_{session}"
 
-        cmd = (
-            f"tmux new-session -d -s {session} "
-            f"'sudo dd if=/dev/mmcblk0 bs=4M status=progress | gzip > {filename} "
-            f"&& echo OK > {status_file} || echo FAIL > {status_file}'"
+        shell_cmd = (
+            f"sudo dd if=/dev/mmcblk0 bs=4M status=progress | gzip > {filename} "
+            f"&& echo OK > {status_file} || echo FAIL > {status_file}"
         )
-        subprocess.run(cmd, shell=True)
+        runner.run(["tmux", "new-session", "-d", "-s", session, shell_cmd], timeout=10)
 
         bot.send_message(chat_id,
             f"Backup iniciado en tmux session `{session}`\n"
@@ -233,8 +304,8 @@ def run_backup_thread(bot, chat_id, ADMIN_IDS):
         # Esperar a que termine
         while True:
             time.sleep(30)
-            r = subprocess.run(f"tmux has-session -t {session}", shell=True)
-            if r.returncode != 0:
+            r = runner.run(["tmux", "has-session", "-t", session], timeout=10)
+            if r.rc == 1:
                 # Sesión terminada — leer resultado
                 success = False
                 if os.path.exists(status_file):
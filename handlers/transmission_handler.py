@@ -1,21 +1,28 @@
 # handlers/transmission_handler.py
 import os
+import re
+import asyncio
+import time
 import logging
+import threading
+import unicodedata
+from types import SimpleNamespace
+from concurrent.futures import ThreadPoolExecutor
 from typing import Optional, Callable
 
+import requests
 import transmission_rpc
+from transmission_rpc.error import TransmissionConnectError
 from telebot.types import InlineKeyboardMarkup, InlineKeyboardButton
 
-import time
-_last_oled = None
-_last_oled_ts = 0.0
-
 from logger import log_action
+from dispatcher import slow
 
 # Opcional: restringir acciones al admin
 ADMIN_ID = int(os.getenv("ADMIN_ID", "0"))
 
 _client: Optional[transmission_rpc.Client] = None
+_client_lock = threading.Lock()
 
 
 def _user(obj) -> str:
@@ -32,29 +39,590 @@ def _is_admin(obj) -> bool:
     return bool(u and u.id == ADMIN_ID)
 
 
+# ---------------------------------------------------------------------------
+# Conexión: un único cliente (sesión HTTP + X-Transmission-Session-Id) que se
+# reutiliza sin sondear antes de cada uso. Si una llamada real falla por red se
+# reconecta y se reintenta una vez; con Transmission caído, backoff exponencial.
+# ---------------------------------------------------------------------------
+
+class TransmissionDown(Exception):
+    pass
+
+
+_RPC_BACKOFF_MAX_S = 60
+_rpc_lock = threading.Lock()
+_rpc_stats = {
+    "calls": 0,
+    "errors": 0,
+    "retries": 0,
+    "lat_total": 0.0,
+    "lat_max": 0.0,
+    "last_error": "",
+    "backoff_until": 0.0,
+    "backoff_s": 0.0,
+}
+
+
 def _get_client() -> transmission_rpc.Client:
     """
     Lazy init: evita fallos al importar si env vars no existen,
     y permite que systemd cargue .env antes.
-    Si el cliente cacheado falla, lo descarta y reconecta.
     """
     global _client
+    with _client_lock:
+        if _client is None:
+            host = os.getenv("TRANSMISSION_HOST", "localhost")
+            port = int(os.getenv("TRANSMISSION_PORT", "9091"))
+            username = os.getenv("TRANSMISSION_USER") or None
+            password = os.getenv("TRANSMISSION_PASSWORD") or None
+            _client = transmission_rpc.Client(host=host, port=port, username=username, password=password)
+        return _client
+
+
+def _drop_client():
+    global _client
+    with _client_lock:
+        _client = None
+
+
+def _record_rpc(elapsed: float, error: Optional[Exception] = None):
+    with _rpc_lock:
+        _rpc_stats["calls"] += 1
+        _rpc_stats["lat_total"] += elapsed
+        _rpc_stats["lat_max"] = max(_rpc_stats["lat_max"], elapsed)
+        if error is not None:
+            _rpc_stats["errors"] += 1
+            _rpc_stats["last_error"] = f"{type(error).__name__}: {error}"[:200]
+
+
+def _check_backoff():
+    wait = _rpc_stats["backoff_until"] - time.time()
+    if wait > 0:
+        raise TransmissionDown(f"Transmission no responde; siguiente intento en {wait:.0f}s")
+
+
+def _mark_down():
+    with _rpc_lock:
+        delay = min(max(_rpc_stats["backoff_s"] * 2, 1.0), _RPC_BACKOFF_MAX_S)
+        _rpc_stats["backoff_s"] = delay
+        _rpc_stats["backoff_until"] = time.time() + delay
+
 
-    if _client is not None:
+def _mark_up():
+    if _rpc_stats["backoff_s"]:
+        with _rpc_lock:
+            _rpc_stats["backoff_s"] = 0.0
+            _rpc_stats["backoff_until"] = 0.0
+
+
+def _rpc(method: str, *args, **kwargs):
+    """Llama a Client.<method>(...) con reintento, backoff y métricas de latencia."""
+    _check_backoff()
+    for attempt in (1, 2):
+        t0 = time.perf_counter()
         try:
-            _client.session_stats()
-            return _client
-        except Exception:
-            logging.warning("Transmission: cliente cacheado no responde, reconectando...")
-            _client = None
+            result = getattr(_get_client(), method)(*args, **kwargs)
+        except (TransmissionConnectError, requests.RequestException) as e:
+            _record_rpc(time.perf_counter() - t0, e)
+            _drop_client()
+            if attempt == 1:
+                with _rpc_lock:
+                    _rpc_stats["retries"] += 1
+                continue
+            _mark_down()
+            raise
+        except Exception as e:
+            _record_rpc(time.perf_counter() - t0, e)
+            raise
+        _record_rpc(time.perf_counter() - t0)
+        _mark_up()
+        return result
+    raise RuntimeError("unreachable")
 
-    host = os.getenv("TRANSMISSION_HOST", "localhost")
-    port = int(os.getenv("TRANSMISSION_PORT", "9091"))
-    username = os.getenv("TRANSMISSION_USER") or None
-    password = os.getenv("TRANSMISSION_PASSWORD") or None
 
-    _client = transmission_rpc.Client(host=host, port=port, username=username, password=password)
-    return _client
+def rpc_stats() -> dict:
+    with _rpc_lock:
+        s = dict(_rpc_stats)
+    s["lat_avg"] = s["lat_total"] / s["calls"] if s["calls"] else 0.0
+    s["down"] = s["backoff_until"] > time.time()
+    return s
+
+
+def rpc_stats_text() -> str:
+    s = rpc_stats()
+    err_pct = 100.0 * s["errors"] / s["calls"] if s["calls"] else 0.0
+    text = (
+        f"Transmission RPC: {s['calls']} llamadas | errores {s['errors']} ({err_pct:.1f}%) | "
+        f"reintentos {s['retries']} | latencia media/máx {s['lat_avg'] * 1000:.0f}/{s['lat_max'] * 1000:.0f}ms"
+    )
+    if s["down"]:
+        text += f"\n  caído (backoff {s['backoff_s']:.0f}s): {s['last_error']}"
+    return text
+
+
+# ---------------------------------------------------------------------------
+# Snapshot compartido de torrents: solo los campos que se muestran, refresco
+# incremental con "recently-active" y una copia para OLED, lista y borrado.
+# ---------------------------------------------------------------------------
+
+_TORRENT_FIELDS = [
+    "id", "name", "status", "percentDone", "rateDownload", "rateUpload", "eta",
+    "error", "errorString", "totalSize", "addedDate",
+]
+# Cada cuánto se pide la lista completa aunque haya refresco incremental
+_SNAPSHOT_FULL_S = 300
+
+_STATUS_NAMES = {
+    0: "stopped",
+    1: "check pending",
+    2: "checking",
+    3: "download pending",
+    4: "downloading",
+    5: "seed pending",
+    6: "seeding",
+}
+
+_snapshot_lock = threading.Lock()
+_snapshot = {"ts": 0.0, "full_ts": 0.0, "torrents": {}, "version": 0}
+_snapshot_listeners: list[Callable[[dict], None]] = []
+
+
+def _torrent_view(f: dict) -> SimpleNamespace:
+    """Torrent (campos RPC crudos) con los atributos que usan las vistas."""
+    status = f.get("status")
+    return SimpleNamespace(
+        id=f.get("id"),
+        name=f.get("name", "Sin nombre"),
+        percent_done=f.get("percentDone"),
+        eta=f.get("eta"),
+        rateDownload=f.get("rateDownload"),
+        rateUpload=f.get("rateUpload"),
+        status=_STATUS_NAMES.get(status, str(status)) if isinstance(status, int) else str(status or ""),
+        error=f.get("error") or 0,
+        error_string=f.get("errorString") or "",
+        size=f.get("totalSize") or 0,
+        added=f.get("addedDate") or 0,
+    )
+
+
+def torrent_snapshot(max_age: float = 5) -> list:
+    """
+    Lista de torrents ordenada por id, como mucho de hace max_age segundos.
+    Entre refrescos completos solo se piden los torrents con actividad reciente.
+    """
+    refreshed = None
+    with _snapshot_lock:
+        now = time.time()
+        snap = _snapshot
+        if now - snap["ts"] >= max_age:
+            if not snap["full_ts"] or now - snap["full_ts"] >= _SNAPSHOT_FULL_S:
+                torrents = _rpc("get_torrents", arguments=_TORRENT_FIELDS)
+                snap["torrents"] = {t.fields["id"]: _torrent_view(t.fields) for t in torrents}
+                snap["full_ts"] = now
+            else:
+                active, removed = _rpc("get_recently_active_torrents", arguments=_TORRENT_FIELDS)
+                for t in active:
+                    snap["torrents"][t.fields["id"]] = _torrent_view(t.fields)
+                for tid in removed:
+                    snap["torrents"].pop(tid, None)
+            snap["ts"] = now
+            snap["version"] += 1
+            refreshed = dict(snap["torrents"])
+        result = [snap["torrents"][k] for k in sorted(snap["torrents"])]
+
+    # fuera del lock: los listeners pueden mandar mensajes
+    if refreshed is not None:
+        for fn in list(_snapshot_listeners):
+            try:
+                fn(refreshed)
+            except Exception:
+                logging.exception("Transmission: listener del snapshot falló")
+    return result
+
+
+def add_snapshot_listener(fn: Callable[[dict], None]):
+    """fn(id -> torrent) tras cada refresco real del snapshot (no en lecturas de cache)."""
+    _snapshot_listeners.append(fn)
+
+
+def invalidate_snapshot(full: bool = False):
+    """Fuerza refresco en la próxima lectura (tras añadir o borrar)."""
+    with _snapshot_lock:
+        _snapshot["ts"] = 0.0
+        if full:
+            _snapshot["full_ts"] = 0.0
+
+
+# ---------------------------------------------------------------------------
+# Índice en memoria sobre el snapshot: órdenes precalculados por versión y
+# búsqueda por trigramas del nombre. Paginar, ordenar o buscar no hace RPC.
+# ---------------------------------------------------------------------------
+
+# clave -> (etiqueta del botón, clave de orden, descendente)
+_SORTS = {
+    "id": ("ID", lambda t: t.id, False),
+    "progress": ("%", lambda t: t.percent_done or 0, True),
+    "speed": ("Vel", lambda t: (t.rateDownload or 0) + (t.rateUpload or 0), True),
+    "size": ("Tamaño", lambda t: t.size, True),
+    "added": ("Fecha", lambda t: t.added, True),
+}
+_SORT_NAMES = {"id": "id", "progress": "progreso", "speed": "velocidad", "size": "tamaño", "added": "fecha"}
+
+_index_lock = threading.Lock()
+_index = {
+    "version": -1,
+    "torrents": {},    # id -> torrent (copia del snapshot de esa versión)
+    "names": {},       # id -> nombre normalizado
+    "trigrams": {},    # trigrama -> set(ids)
+    "sorted": {},      # clave de orden -> [ids] (se calcula al pedirlo)
+}
+# chat_id -> vista de /torrents: búsqueda, filtro, orden e ids resultantes
+_views: dict[int, dict] = {}
+
+
+def _norm(text: str) -> str:
+    text = unicodedata.normalize("NFKD", text or "").encode("ascii", "ignore").decode().lower()
+    return re.sub(r"[\s._\-\[\]()]+", " ", text).strip()
+
+
+def _trigrams(text: str) -> set[str]:
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+def _sync_index():
+    """Pone el índice al día con el snapshot; solo reindexa nombres nuevos o cambiados."""
+    with _snapshot_lock:
+        version = _snapshot["version"]
+        if _index["version"] == version:
+            return
+        torrents = dict(_snapshot["torrents"])
+
+    with _index_lock:
+        if _index["version"] == version:
+            return
+        names, tri = _index["names"], _index["trigrams"]
+        for tid in list(names):
+            t = torrents.get(tid)
+            if t is None or _norm(t.name) != names[tid]:
+                for g in _trigrams(names.pop(tid)):
+                    ids = tri.get(g)
+                    if ids is not None:
+                        ids.discard(tid)
+                        if not ids:
+                            del tri[g]
+        for tid, t in torrents.items():
+            if tid not in names:
+                n = names[tid] = _norm(t.name)
+                for g in _trigrams(n):
+                    tri.setdefault(g, set()).add(tid)
+        _index.update({"version": version, "torrents": torrents, "sorted": {}})
+
+
+def _sorted_ids(key: str) -> list:
+    ids = _index["sorted"].get(key)
+    if ids is None:
+        _, keyfn, desc = _SORTS[key]
+        ids = [t.id for t in sorted(_index["torrents"].values(), key=keyfn, reverse=desc)]
+        _index["sorted"][key] = ids
+    return ids
+
+
+def _search_ids(query: str) -> set:
+    """Ids cuyo nombre contiene todas las palabras de la búsqueda."""
+    names, tri = _index["names"], _index["trigrams"]
+    result = None
+    for word in _norm(query).split():
+        grams = _trigrams(word)
+        if grams:
+            # candidatos por trigramas (del más raro al más común) y verificación final
+            cands = None
+            for g in sorted(grams, key=lambda g: len(tri.get(g, ()))):
+                cands = set(tri.get(g, ())) if cands is None else cands & tri.get(g, set())
+                if not cands:
+                    break
+            matches = {tid for tid in cands if word in names[tid]}
+        else:
+            matches = {tid for tid, n in names.items() if word in n}
+        result = matches if result is None else result & matches
+        if not result:
+            return set()
+    return result if result is not None else set(names)
+
+
+def _is_active(t) -> bool:
+    return t.status in ("downloading", "checking") or bool((t.rateDownload or 0) + (t.rateUpload or 0))
+
+
+def _view_ids(view: dict) -> list:
+    """Ids de la vista (en orden), recalculados solo si cambió el índice."""
+    with _index_lock:
+        if view.get("version") != _index["version"]:
+            ids = _sorted_ids(view["sort"])
+            if view["query"]:
+                found = _search_ids(view["query"])
+                ids = [tid for tid in ids if tid in found]
+            if view["filter"] == "active":
+                ids = [tid for tid in ids if _is_active(_index["torrents"][tid])]
+            view["ids"] = ids
+            view["version"] = _index["version"]
+        return view["ids"]
+
+
+def open_view(chat_id: int, query: Optional[str] = None, only_active: bool = False, sort: Optional[str] = None):
+    """Nueva vista de lista para el chat (refresca el snapshot si está viejo)."""
+    prev = _views.get(chat_id) or {}
+    _views[chat_id] = {
+        "query": query,
+        "filter": "active" if only_active else "all",
+        "sort": sort or prev.get("sort", "id"),
+    }
+    torrent_snapshot()
+    return list_page(chat_id, 0)
+
+
+def set_view_sort(chat_id: int, sort: str):
+    view = _views.setdefault(chat_id, {"query": None, "filter": "all", "sort": "id"})
+    if sort in _SORTS:
+        view["sort"] = sort
+        view.pop("version", None)
+    return list_page(chat_id, 0)
+
+
+def list_page(chat_id: int, page: int, page_size: int = 10):
+    """Texto + botones de una página de la vista del chat, solo desde memoria."""
+    view = _views.setdefault(chat_id, {"query": None, "filter": "all", "sort": "id"})
+    if _snapshot["version"] == 0:
+        torrent_snapshot()
+    _sync_index()
+    ids = _view_ids(view)
+    torrents = _index["torrents"]
+
+    title = "Lista de torrents"
+    if view["query"]:
+        title = f"Búsqueda «{view['query']}»"
+    elif view["filter"] == "active":
+        title = "Torrents activos"
+    header = f"{title}: {len(ids)} (orden: {_SORT_NAMES[view['sort']]})"
+
+    if not ids:
+        return header + "\nSin resultados.", _menu_markup()
+    start = page * page_size
+    chunk = [torrents[tid] for tid in ids[start:start + page_size] if tid in torrents]
+    return _list_view(chunk, page, page_size, total=len(ids), header=header, sort=view["sort"])
+
+
+# ---------------------------------------------------------------------------
+# Watcher: compara snapshots sucesivos (mismo ritmo que el OLED, sin RPC extra)
+# y avisa de torrents completados, con error o atascados en un solo mensaje.
+# ---------------------------------------------------------------------------
+
+TR_STALL_S = int(os.getenv("TR_STALL_S", "1800"))
+TR_ALERT_COOLDOWN_S = int(os.getenv("TR_ALERT_COOLDOWN_S", "3600"))
+
+_watch_lock = threading.Lock()
+_watch = {"primed": False, "torrents": {}, "sent": {}}
+
+
+def _cooldown_ok(key, now: float) -> bool:
+    last = _watch["sent"].get(key)
+    if last is not None and now - last < TR_ALERT_COOLDOWN_S:
+        return False
+    _watch["sent"][key] = now
+    return True
+
+
+def _diff_snapshot(torrents: dict, now: float) -> tuple[list, list, list]:
+    """(completados, con error, atascados) respecto al snapshot anterior."""
+    done, errored, stalled = [], [], []
+    with _watch_lock:
+        state = _watch["torrents"]
+        primed = _watch["primed"]
+        for tid, t in torrents.items():
+            pd = t.percent_done or 0
+            st = state.get(tid)
+            if st is None:
+                # el primer snapshot solo fija la base: no se avisa de lo que ya estaba
+                base_err = (t.error, t.error_string) if not primed else (0, "")
+                st = state[tid] = {"pd": pd, "progress_ts": now, "error": base_err}
+            if pd > st["pd"]:
+                st["progress_ts"] = now
+            if pd >= 1 and st["pd"] < 1:
+                done.append(t)
+            st["pd"] = pd
+
+            err = (t.error, t.error_string)
+            if t.error and err != st["error"] and _cooldown_ok((tid, "error"), now):
+                errored.append(t)
+            st["error"] = err
+
+            if (t.status == "downloading" and pd < 1 and now - st["progress_ts"] >= TR_STALL_S
+                    and _cooldown_ok((tid, "stall"), now)):
+                stalled.append(t)
+
+        for tid in set(state) - set(torrents):
+            del state[tid]
+        _watch["primed"] = True
+    if not primed:
+        return [], [], []
+    return done, errored, stalled
+
+
+def _watch_text(done: list, errored: list, stalled: list) -> str:
+    lines = ["Torrents"]
+    if done:
+        lines += ["", "✅ Completados:"] + [f"- {t.name}" for t in done]
+    if errored:
+        lines += ["", "⚠️ Con error:"] + [f"- {t.name}: {t.error_string or t.error}" for t in errored]
+    if stalled:
+        lines += ["", f"🐢 Sin progreso en {TR_STALL_S // 60} min:"]
+        lines += [f"- {t.name} ({int((t.percent_done or 0) * 100)}%)" for t in stalled]
+    return "\n".join(lines)
+
+
+def start_torrent_watcher(notify: Callable[[str], None]):
+    """Engancha el watcher al snapshot compartido; notify(texto) recibe un mensaje por ciclo."""
+    def _on_snapshot(torrents: dict):
+        done, errored, stalled = _diff_snapshot(torrents, time.time())
+        if done or errored or stalled:
+            notify(_watch_text(done, errored, stalled))
+
+    add_snapshot_listener(_on_snapshot)
+
+
+# ---------------------------------------------------------------------------
+# Operaciones masivas: varios enlaces o .torrent por mensaje (añadidos en
+# paralelo con un pool acotado) y pausar/reanudar/quitar completados con una
+# sola RPC por lista de ids sacada del snapshot.
+# ---------------------------------------------------------------------------
+
+TR_ADD_WORKERS = int(os.getenv("TR_ADD_WORKERS", "4"))
+# Tamaño máximo de un .torrent subido por Telegram (se descarga en memoria)
+TR_TORRENT_MAX_KB = int(os.getenv("TR_TORRENT_MAX_KB", "2048"))
+# Espera para juntar los documentos de un mismo envío (media group)
+_UPLOAD_BATCH_S = 1.5
+
+_LINK_RE = re.compile(r"magnet:\?\S+|https?://\S+", re.IGNORECASE)
+
+# acción -> (método RPC, filtro de torrents, texto del resumen)
+_BULK = {
+    "pause": ("stop_torrent", lambda t: t.status != "stopped", "pausados"),
+    "resume": ("start_torrent", lambda t: t.status == "stopped", "reanudados"),
+    "clean": ("remove_torrent", lambda t: (t.percent_done or 0) >= 1, "quitados (archivos conservados)"),
+}
+
+
+def parse_links(text: str) -> list[str]:
+    """Magnets/URLs del mensaje, sin repetir; si no hay ninguno, el texto tal cual."""
+    links = list(dict.fromkeys(_LINK_RE.findall(text or "")))
+    if links:
+        return links
+    text = (text or "").strip()
+    return [text] if text else []
+
+
+def add_torrents(items: list) -> tuple[list[str], list[tuple[str, str]]]:
+    """
+    Añade en paralelo enlaces (str) o ficheros .torrent ((nombre, bytes)).
+    Devuelve (nombres añadidos, [(enlace o fichero, error)]).
+    """
+    def _add(item):
+        payload = item[1] if isinstance(item, tuple) else item
+        return _rpc("add_torrent", payload).name
+
+    added, failed = [], []
+    with ThreadPoolExecutor(max_workers=max(1, min(TR_ADD_WORKERS, len(items)))) as pool:
+        futures = [(item, pool.submit(_add, item)) for item in items]
+        for item, fut in futures:
+            label = item[0] if isinstance(item, tuple) else item
+            try:
+                added.append(fut.result())
+            except Exception as e:
+                logging.warning("add_torrent %s: %s", label[:60], e)
+                failed.append((label, str(e)))
+    if added:
+        invalidate_snapshot(full=True)
+    return added, failed
+
+
+def is_torrent_document(doc) -> bool:
+    name = (getattr(doc, "file_name", None) or "").lower()
+    return name.endswith(".torrent") or getattr(doc, "mime_type", None) == "application/x-bittorrent"
+
+
+def fetch_torrent_file(url: str, size_hint: Optional[int] = None) -> bytes:
+    """
+    Descarga el .torrent a memoria por trozos, cortando al pasar del límite.
+    Nada se escribe en la SD.
+    La URL de Telegram lleva el token del bot: los errores de requests la
+    incluyen, así que se sustituyen por un mensaje genérico.
+    """
+    limit = TR_TORRENT_MAX_KB * 1024
+    if size_hint and size_hint > limit:
+        raise ValueError(f"el fichero supera {TR_TORRENT_MAX_KB} KB")
+    buf = bytearray()
+    try:
+        with requests.get(url, stream=True, timeout=20) as r:
+            if r.status_code >= 400:
+                raise ValueError(f"descarga falló (HTTP {r.status_code})")
+            for chunk in r.iter_content(chunk_size=64 * 1024):
+                buf += chunk
+                if len(buf) > limit:
+                    raise ValueError(f"el fichero supera {TR_TORRENT_MAX_KB} KB")
+    except requests.RequestException as e:
+        raise ValueError(f"descarga falló ({type(e).__name__})") from None
+    return bytes(buf)
+
+
+_BOT_TOKEN_RE = re.compile(r"bot\d+:[\w-]+")
+
+
+def redact_token(text: str) -> str:
+    """Quita el token del bot (bot<id>:<secreto>) de un texto para log/chat."""
+    return _BOT_TOKEN_RE.sub("bot<TOKEN>", text)
+
+
+def add_summary(added: list[str], failed: list[tuple[str, str]]) -> str:
+    total = len(added) + len(failed)
+    if total == 1 and added:
+        return f"Torrent agregado: {added[0]}"
+    lines = [f"Agregados {len(added)}/{total} torrents."]
+    lines += [f"• {name}" for name in added]
+    if failed:
+        lines += ["", "Errores:"]
+        lines += [f"• {link[:50]}{'…' if len(link) > 50 else ''}: {err}" for link, err in failed]
+    return "\n".join(lines)
+
+
+def bulk_targets(action: str) -> list:
+    """Torrents del snapshot a los que afecta la acción masiva."""
+    _, match, _ = _BULK[action]
+    return [t for t in torrent_snapshot() if match(t)]
+
+
+def bulk_action(action: str) -> str:
+    """Ejecuta la acción sobre todos los torrents que aplican en una sola RPC."""
+    method, _, done = _BULK[action]
+    ids = [t.id for t in bulk_targets(action)]
+    if not ids:
+        return "No hay torrents a los que aplicar la acción."
+    if method == "remove_torrent":
+        _rpc(method, ids, delete_data=False)
+    else:
+        _rpc(method, ids)
+    # refresco completo: los torrents ociosos no salen en recently-active
+    invalidate_snapshot(full=True)
+    return f"{len(ids)} torrents {done}."
+
+
+def _bulk_markup() -> InlineKeyboardMarkup:
+    markup = InlineKeyboardMarkup(row_width=2)
+    markup.add(
+        InlineKeyboardButton("Pausar todo", callback_data="tr:bulk:pause"),
+        InlineKeyboardButton("Reanudar todo", callback_data="tr:bulk:resume"),
+        InlineKeyboardButton("Quitar completados", callback_data="tr:bulk:clean"),
+        InlineKeyboardButton("Menu", callback_data="tr:status"),
+    )
+    return markup
 
 
 def _menu_markup() -> InlineKeyboardMarkup:
@@ -62,8 +630,9 @@ def _menu_markup() -> InlineKeyboardMarkup:
     markup.add(
         InlineKeyboardButton("Agregar", callback_data="tr:add"),
         InlineKeyboardButton("Estado", callback_data="tr:status"),
-        InlineKeyboardButton("Listar", callback_data="tr:list:0"),
+        InlineKeyboardButton("Listar", callback_data="tr:ls"),
         InlineKeyboardButton("Eliminar", callback_data="tr:delete"),
+        InlineKeyboardButton("Masivo", callback_data="tr:bulk"),
     )
     return markup
 
@@ -115,6 +684,51 @@ def _fmt_torrent_line(t) -> str:
     return f"{tid:>3} | {progress:>3}% | DL {_fmt_rate(rate_dl)} UL {_fmt_rate(rate_ul)} | ETA {eta_txt} | {short}"
 
 
+def _status_text(stats) -> str:
+    # Campos típicos:
+    down = getattr(stats, "downloadSpeed", None)
+    up = getattr(stats, "uploadSpeed", None)
+    active = getattr(stats, "activeTorrentCount", None)
+    paused = getattr(stats, "pausedTorrentCount", None)
+    total = getattr(stats, "torrentCount", None)
+
+    return (
+        "Transmission\n"
+        f"- Torrents: {total} (activos {active}, pausados {paused})\n"
+        f"- Velocidad: DL {_fmt_rate(down)} | UL {_fmt_rate(up)}\n"
+    )
+
+
+def _list_view(chunk, page: int, page_size: int = 10, total: int = 0,
+               header: str = "Lista de torrents", sort: str = "id"):
+    """Texto + botones de navegación y orden para una página ya recortada de la lista."""
+    end = page * page_size + len(chunk)
+
+    lines = [header, "ID | % | DL/UL | ETA | nombre"]
+    for t in chunk:
+        lines.append(_fmt_torrent_line(t))
+
+    nav = InlineKeyboardMarkup(row_width=3)
+    prev_btn = InlineKeyboardButton("<< Anterior", callback_data=f"tr:list:{max(0, page-1)}")
+    next_btn = InlineKeyboardButton("Siguiente >>", callback_data=f"tr:list:{page+1}")
+    menu_btn = InlineKeyboardButton("Menu", callback_data="tr:status")
+
+    # Solo mostrar next si hay más
+    btns = []
+    if page > 0:
+        btns.append(prev_btn)
+    if end < total:
+        btns.append(next_btn)
+    btns.append(menu_btn)
+    nav.row(*btns)
+    nav.row(*[
+        InlineKeyboardButton(("• " if key == sort else "") + label, callback_data=f"tr:sort:{key}")
+        for key, (label, _, _) in _SORTS.items()
+    ])
+
+    return "\n".join(lines), nav
+
+
 def _safe_send(bot, chat_id: int, text: str, reply_markup=None):
     # Telegram ~4096 chars; recortamos
     if len(text) > 3800:
@@ -139,7 +753,93 @@ def register_transmission_handlers(bot, on_activity: Optional[Callable[[str], No
             bot.reply_to(message, "No tienes permiso para usar torrents.")
             return
         activity(message, "/torrents")
-        _safe_send(bot, message.chat.id, "Torrents: elige una opcion", reply_markup=_menu_markup())
+        parts = (message.text or "").split(maxsplit=2)
+        sub = parts[1].lower() if len(parts) > 1 else ""
+        if sub in ("buscar", "search"):
+            if len(parts) < 3:
+                bot.reply_to(message, "Uso: /torrents buscar <texto>")
+                return
+            _handle_view(message.chat.id, query=parts[2])
+        elif sub in ("activos", "active"):
+            _handle_view(message.chat.id, only_active=True)
+        elif sub in ("todos", "all", "lista"):
+            _handle_view(message.chat.id)
+        elif sub in ("pausar", "reanudar", "limpiar"):
+            action = {"pausar": "pause", "reanudar": "resume", "limpiar": "clean"}[sub]
+            _handle_bulk(message.chat.id, action, confirmed=action != "clean")
+        else:
+            _safe_send(bot, message.chat.id, "Torrents: elige una opcion", reply_markup=_menu_markup())
+
+    # Subidas de .torrent: los documentos de un mismo envío (media group) se juntan
+    # y se añaden en un solo lote con un único resumen.
+    uploads_lock = threading.Lock()
+    # (chat_id, media_group_id) -> {"items": [...], "pending": descargas en curso, "timer": Timer}
+    uploads: dict = {}
+
+    def _flush_uploads(key):
+        with uploads_lock:
+            batch = uploads.pop(key, None)
+        if batch:
+            _add_uploads(key[0], batch["items"])
+
+    def _schedule_flush(key):
+        # el Timer solo encola: el alta corre en el carril lento del chat, como los handlers
+        run_slow = getattr(bot, "run_slow", None)
+        if run_slow:
+            run_slow(key[0], _flush_uploads, key)
+        else:
+            _flush_uploads(key)
+
+    def _add_uploads(chat_id: int, items: list):
+        files = [it for it in items if isinstance(it[1], bytes)]
+        errors = [it for it in items if not isinstance(it[1], bytes)]
+        added, failed = add_torrents(files) if files else ([], [])
+        _safe_send(bot, chat_id, add_summary(added, errors + failed), reply_markup=_menu_markup())
+
+    @bot.message_handler(content_types=["document"], func=lambda m: is_torrent_document(m.document))
+    @slow
+    def _doc_torrent(message):
+        if not _is_admin(message):
+            bot.reply_to(message, "No tienes permiso para usar torrents.")
+            return
+        doc = message.document
+        activity(message, "tr:upload")
+        name = doc.file_name or "fichero.torrent"
+        group = getattr(message, "media_group_id", None)
+        key = (message.chat.id, group)
+        if group:
+            # el lote se reserva antes de descargar: una descarga lenta no debe
+            # dejar que el temporizador cierre el álbum a medias
+            with uploads_lock:
+                batch = uploads.setdefault(key, {"items": [], "pending": 0, "timer": None})
+                batch["pending"] += 1
+                if batch["timer"]:
+                    batch["timer"].cancel()
+                    batch["timer"] = None
+        try:
+            item = (name, fetch_torrent_file(bot.get_file_url(doc.file_id), doc.file_size))
+        except ValueError as e:
+            logging.warning("No pude descargar %s: %s", name, redact_token(str(e)))
+            item = (name, redact_token(str(e)))
+        except Exception as e:
+            # get_file también puede fallar con la URL (y el token) en el mensaje
+            logging.warning("No pude descargar %s: %s", name, redact_token(f"{type(e).__name__}: {e}"))
+            item = (name, "no pude descargar el fichero de Telegram")
+
+        if not group:
+            _add_uploads(message.chat.id, [item])
+            return
+        with uploads_lock:
+            batch = uploads.setdefault(key, {"items": [], "pending": 0, "timer": None})
+            batch["items"].append(item)
+            batch["pending"] = max(0, batch["pending"] - 1)
+            if batch["timer"]:
+                batch["timer"].cancel()
+                batch["timer"] = None
+            if not batch["pending"]:
+                batch["timer"] = threading.Timer(_UPLOAD_BATCH_S, _schedule_flush, args=(key,))
+                batch["timer"].daemon = True
+                batch["timer"].start()
 
     @bot.callback_query_handler(func=lambda c: isinstance(c.data, str) and c.data.startswith("tr:"))
     def _cb_transmission(call):
@@ -160,7 +860,7 @@ def register_transmission_handlers(bot, on_activity: Optional[Callable[[str], No
         # ---- ADD ----
         if data == "tr:add":
             activity(call, "tr:add")
-            _safe_send(bot, call.message.chat.id, "Envíame el magnet/link del torrent:")
+            _safe_send(bot, call.message.chat.id, "Envíame el magnet/link del torrent (o varios, uno por línea). También puedes mandar ficheros .torrent:")
             bot.register_next_step_handler(call.message, _step_add)
             return
 
@@ -171,6 +871,11 @@ def register_transmission_handlers(bot, on_activity: Optional[Callable[[str], No
             return
 
         # ---- LIST ----
+        if data == "tr:ls":
+            activity(call, "tr:list")
+            _handle_view(call.message.chat.id)
+            return
+
         if data.startswith("tr:list:"):
             activity(call, "tr:list")
             try:
@@ -180,6 +885,26 @@ def register_transmission_handlers(bot, on_activity: Optional[Callable[[str], No
             _handle_list(call.message.chat.id, page=page)
             return
 
+        if data.startswith("tr:sort:"):
+            activity(call, "tr:sort")
+            _handle_list(call.message.chat.id, sort=data.split(":")[2])
+            return
+
+        # ---- BULK ----
+        if data == "tr:bulk":
+            activity(call, "tr:bulk")
+            _safe_send(bot, call.message.chat.id, "Acciones sobre todos los torrents:", reply_markup=_bulk_markup())
+            return
+
+        if data.startswith("tr:bulk:"):
+            action, _, ok = data[len("tr:bulk:"):].partition(":")
+            if action not in _BULK:
+                _safe_send(bot, call.message.chat.id, "Acción desconocida.")
+                return
+            activity(call, f"tr:bulk:{action}")
+            _handle_bulk(call.message.chat.id, action, confirmed=action != "clean" or ok == "ok")
+            return
+
         # ---- DELETE (menu) ----
         if data == "tr:delete":
             activity(call, "tr:delete")
@@ -223,88 +948,78 @@ def register_transmission_handlers(bot, on_activity: Optional[Callable[[str], No
         # fallback
         _safe_send(bot, call.message.chat.id, "Acción desconocida.")
 
+    @slow
     def _step_add(message):
         if not _is_admin(message):
             bot.reply_to(message, "No autorizado.")
             return
 
-        url = (message.text or "").strip()
+        if getattr(message, "document", None) and is_torrent_document(message.document):
+            _doc_torrent(message)
+            return
+
+        links = parse_links(message.text)
         activity(message, "tr:add_step")
 
-        if not url:
+        if not links:
             bot.reply_to(message, "No recibí ningún enlace. Usa /torrents otra vez.")
             return
 
-        try:
-            tc = _get_client()
-            t = tc.add_torrent(url)
-            bot.reply_to(message, f"Torrent agregado: {t.name}")
-        except Exception as e:
-            logging.exception("Error add_torrent")
-            bot.reply_to(message, f"Error al agregar torrent: {e}")
+        added, failed = add_torrents(links)
+        if len(links) == 1 and failed:
+            bot.reply_to(message, f"Error al agregar torrent: {failed[0][1]}")
+        else:
+            bot.reply_to(message, add_summary(added, failed))
 
         _safe_send(bot, message.chat.id, "Menu torrents:", reply_markup=_menu_markup())
 
     def _handle_status(chat_id: int):
         try:
-            tc = _get_client()
-            stats = tc.session_stats()
-            # Campos típicos:
-            down = getattr(stats, "downloadSpeed", None)
-            up = getattr(stats, "uploadSpeed", None)
-            active = getattr(stats, "activeTorrentCount", None)
-            paused = getattr(stats, "pausedTorrentCount", None)
-            total = getattr(stats, "torrentCount", None)
-
-            msg = (
-                "Transmission\n"
-                f"- Torrents: {total} (activos {active}, pausados {paused})\n"
-                f"- Velocidad: DL {_fmt_rate(down)} | UL {_fmt_rate(up)}\n"
-            )
+            msg = _status_text(SimpleNamespace(**_rpc("session_stats").fields))
             _safe_send(bot, chat_id, msg, reply_markup=_menu_markup())
         except Exception as e:
             logging.exception("Error status")
             _safe_send(bot, chat_id, f"Error al obtener estado: {e}", reply_markup=_menu_markup())
 
-    def _handle_list(chat_id: int, page: int = 0, page_size: int = 10):
+    def _handle_view(chat_id: int, query: Optional[str] = None, only_active: bool = False):
         try:
-            tc = _get_client()
-            torrents = tc.get_torrents()
-            if not torrents:
-                _safe_send(bot, chat_id, "No hay torrents en cola.", reply_markup=_menu_markup())
-                return
+            text, nav = open_view(chat_id, query=query, only_active=only_active)
+            _safe_send(bot, chat_id, text, reply_markup=nav)
+        except Exception as e:
+            logging.exception("Error list")
+            _safe_send(bot, chat_id, f"Error al listar torrents: {e}", reply_markup=_menu_markup())
 
-            start = max(0, page * page_size)
-            end = min(len(torrents), start + page_size)
-            chunk = torrents[start:end]
-
-            lines = ["Lista de torrents (ID | % | DL/UL | ETA | nombre)"]
-            for t in chunk:
-                lines.append(_fmt_torrent_line(t))
-
-            nav = InlineKeyboardMarkup(row_width=3)
-            prev_btn = InlineKeyboardButton("<< Anterior", callback_data=f"tr:list:{max(0, page-1)}")
-            next_btn = InlineKeyboardButton("Siguiente >>", callback_data=f"tr:list:{page+1}")
-            menu_btn = InlineKeyboardButton("Menu", callback_data="tr:status")
-
-            # Solo mostrar next si hay más
-            btns = []
-            if page > 0:
-                btns.append(prev_btn)
-            if end < len(torrents):
-                btns.append(next_btn)
-            btns.append(menu_btn)
-            nav.add(*btns)
-
-            _safe_send(bot, chat_id, "\n".join(lines), reply_markup=nav)
+    def _handle_list(chat_id: int, page: int = 0, sort: Optional[str] = None):
+        try:
+            text, nav = set_view_sort(chat_id, sort) if sort else list_page(chat_id, page)
+            _safe_send(bot, chat_id, text, reply_markup=nav)
         except Exception as e:
             logging.exception("Error list")
             _safe_send(bot, chat_id, f"Error al listar torrents: {e}", reply_markup=_menu_markup())
 
+    def _handle_bulk(chat_id: int, action: str, confirmed: bool = True):
+        try:
+            if not confirmed:
+                n = len(bulk_targets(action))
+                if not n:
+                    _safe_send(bot, chat_id, "No hay torrents completados.", reply_markup=_menu_markup())
+                    return
+                markup = InlineKeyboardMarkup(row_width=2)
+                markup.add(
+                    InlineKeyboardButton(f"Quitar {n}", callback_data=f"tr:bulk:{action}:ok"),
+                    InlineKeyboardButton("Cancelar", callback_data="tr:bulk"),
+                )
+                _safe_send(bot, chat_id, f"Quitar {n} torrents completados de la lista? Los archivos se conservan.",
+                           reply_markup=markup)
+                return
+            _safe_send(bot, chat_id, bulk_action(action), reply_markup=_menu_markup())
+        except Exception as e:
+            logging.exception("Error bulk %s", action)
+            _safe_send(bot, chat_id, f"Error en la acción masiva: {e}", reply_markup=_menu_markup())
+
     def _handle_delete_menu(chat_id: int):
         try:
-            tc = _get_client()
-            torrents = tc.get_torrents()
+            torrents = torrent_snapshot()
             if not torrents:
                 _safe_send(bot, chat_id, "No hay torrents para eliminar.", reply_markup=_menu_markup())
                 return
@@ -330,8 +1045,8 @@ def register_transmission_handlers(bot, on_activity: Optional[Callable[[str], No
 
     def _handle_delete_id(chat_id: int, tid: int, delete_data: bool):
         try:
-            tc = _get_client()
-            tc.remove_torrent(tid, delete_data=delete_data)
+            _rpc("remove_torrent", tid, delete_data=delete_data)
+            invalidate_snapshot(full=True)
             if delete_data:
                 _safe_send(bot, chat_id, f"Torrent {tid} eliminado + datos borrados.", reply_markup=_menu_markup())
             else:
@@ -363,69 +1078,131 @@ def register_transmission_handlers(bot, on_activity: Optional[Callable[[str], No
 
 def get_oled_torrent_status(cache_seconds: int = 5) -> Optional[dict]:
     """
-    Devuelve un resumen pequeño para OLED.
-    - Usa cache para no consultar Transmission en cada refresh.
-    - Retorna None si no hay actividad o Transmission no está disponible.
+    Devuelve un resumen pequeño para OLED a partir del snapshot compartido.
+    Retorna None si no hay actividad o Transmission no está disponible.
     """
-    global _last_oled, _last_oled_ts
-
-    now = time.time()
+    try:
+        torrents = torrent_snapshot(max_age=cache_seconds)
+    except Exception:
+        # con Transmission caído el backoff evita spamear errores cada 2s
+        return None
+
+    # "activos": descargando o subiendo
+    active = [t for t in torrents if t.status in ("downloading", "seeding")]
+    if not active:
+        return None
+
+    # elegir el "principal" para mostrar (prioriza downloading)
+    active.sort(key=lambda t: (0 if t.status == "downloading" else 1, -(t.percent_done or 0)))
+    t = active[0]
+
+    return {
+        "count": len(active),
+        "name": t.name,
+        "progress": int((t.percent_done or 0) * 100),
+        "dl": int(t.rateDownload or 0),
+        "ul": int(t.rateUpload or 0),
+        "status": t.status,
+    }
+
+# ---------------------------------------------------------------------------
+# RPC asíncrono (modo asyncio). aiohttp viene con AsyncTeleBot.
+# ---------------------------------------------------------------------------
+
+_aio = {"session": None, "session_id": ""}
+
+
+async def _rpc_async(method: str, arguments: Optional[dict] = None) -> dict:
+    """Llamada JSON-RPC a Transmission con manejo del X-Transmission-Session-Id (409)."""
+    import aiohttp
+
+    session = _aio["session"]
+    if session is None or session.closed:
+        user = os.getenv("TRANSMISSION_USER") or None
+        password = os.getenv("TRANSMISSION_PASSWORD") or None
+        session = aiohttp.ClientSession(
+            auth=aiohttp.BasicAuth(user, password or "") if user else None,
+            timeout=aiohttp.ClientTimeout(total=15),
+        )
+        _aio["session"] = session
 
-    # 1) Si tenemos cache reciente, devolverlo
-    if (now - _last_oled_ts) < cache_seconds:
-        return _last_oled
+    host = os.getenv("TRANSMISSION_HOST", "localhost")
+    port = int(os.getenv("TRANSMISSION_PORT", "9091"))
+    url = f"http://{host}:{port}/transmission/rpc"
+    payload = {"method": method, "arguments": arguments or {}}
 
-    # 2) Si no hay cache reciente, consultamos Transmission
+    _check_backoff()
+    t0 = time.perf_counter()
     try:
-        tc = _get_client()
-        torrents = tc.get_torrents()
-        if not torrents:
-            _last_oled = None
-            _last_oled_ts = now
-            return None
-
-        # "activos": descargando o subiendo
-        active = [t for t in torrents if getattr(t, "status", "") in ("downloading", "seeding")]
-        if not active:
-            _last_oled = None
-            _last_oled_ts = now
-            return None
-
-        # elegir el "principal" para mostrar (prioriza downloading)
-        active.sort(
-            key=lambda t: (
-                0 if getattr(t, "status", "") == "downloading" else 1,
-                -float(getattr(t, "progress", 0) or 0),
-            )
-        )
-        t = active[0]
-
-        name = getattr(t, "name", "torrent")
-
-        progress = getattr(t, "progress", None)
-        if progress is None:
-            pd = getattr(t, "percent_done", None)
-            progress = int(pd * 100) if isinstance(pd, (int, float)) else 0
-
-        rate_dl = int(getattr(t, "rateDownload", 0) or 0)
-        rate_ul = int(getattr(t, "rateUpload", 0) or 0)
-
-        result = {
-            "count": len(active),
-            "name": name,
-            "progress": int(progress),
-            "dl": rate_dl,
-            "ul": rate_ul,
-            "status": getattr(t, "status", ""),
-        }
-
-        # 3) Guardar cache
-        _last_oled = result
-        _last_oled_ts = now
-        return result
+        for _ in range(2):
+            headers = {"X-Transmission-Session-Id": _aio["session_id"]}
+            async with session.post(url, json=payload, headers=headers) as r:
+                if r.status == 409:
+                    _aio["session_id"] = r.headers.get("X-Transmission-Session-Id", "")
+                    continue
+                r.raise_for_status()
+                data = await r.json(content_type=None)
+            if data.get("result") != "success":
+                raise RuntimeError(data.get("result") or "respuesta RPC inválida")
+            _record_rpc(time.perf_counter() - t0)
+            _mark_up()
+            return data.get("arguments", {})
+        raise RuntimeError("Transmission rechazó el session-id")
+    except aiohttp.ClientConnectionError as e:
+        _record_rpc(time.perf_counter() - t0, e)
+        _mark_down()
+        raise
+    except Exception as e:
+        _record_rpc(time.perf_counter() - t0, e)
+        raise
+
+
+async def session_stats_async():
+    return SimpleNamespace(**await _rpc_async("session-stats"))
+
+
+async def handle_transmission_callback_async(abot, call) -> bool:
+    """
+    Atiende tr:status y la lista (tr:ls, tr:list:N, tr:sort:K). La lista sale del
+    snapshot en memoria; solo el refresco (si toca) va a un hilo. Devuelve False si
+    la acción debe ir a los handlers síncronos (add/delete usan next-step handlers).
+    """
+    data = call.data
+    if data != "tr:status" and data != "tr:ls" and not data.startswith(("tr:list:", "tr:sort:")):
+        return False
 
+    if not _is_admin(call):
+        try:
+            await abot.answer_callback_query(call.id, "No autorizado", show_alert=True)
+        except Exception:
+            pass
+        return True
+
+    try:
+        await abot.answer_callback_query(call.id)
     except Exception:
-        # si falla, cacheamos "None" para no spamear errores cada 2s
-        _last_oled = None
-        _last_oled_ts = now
-        return None
\ No newline at end of file
+        pass
+
+    chat_id = call.message.chat.id
+    log_action(_user(call), "tr:status" if data == "tr:status" else "tr:list")
+    try:
+        if data == "tr:status":
+            text, markup = _status_text(await session_stats_async()), _menu_markup()
+        elif data == "tr:ls":
+            text, markup = await asyncio.to_thread(open_view, chat_id)
+        elif data.startswith("tr:sort:"):
+            text, markup = await asyncio.to_thread(set_view_sort, chat_id, data.split(":")[2])
+        else:
+            try:
+                page = int(data.split(":")[2])
+            except Exception:
+                page = 0
+            text, markup = await asyncio.to_thread(list_page, chat_id, page)
+    except Exception as e:
+        logging.exception("Error %s (async)", data)
+        text, markup = f"Error consultando Transmission: {e}", _menu_markup()
+
+    if len(text) > 3800:
+        text = text[:3800] + "\n…(recortado)"
+    await abot.send_message(chat_id, text, reply_markup=markup)
+    return True
@@ -0,0 +1,230 @@
+# mc_sessions.py
+#
+# Seguidor del log del servidor de Minecraft (docker logs -f) con un índice en
+# memoria de sesiones por jugador. Cada línea se parsea una vez al llegar; /last,
+# /online y el OLED consultan el índice sin volver a leer el log.
+
+import re
+import time
+import logging
+import threading
+from datetime import datetime, timezone
+from typing import Callable, NamedTuple, Optional
+
+import docker_api
+
+# Líneas de log previas al arranque que se leen para saber la última actividad
+MC_LOG_BACKLOG = 500
+
+
+class PlayerEvent(NamedTuple):
+    ts: float
+    player: str
+    kind: str     # join | leave | login | lost
+    line: str
+
+
+# "[12:34:56] [Server thread/INFO]: Steve joined the game"
+# "[12:34:56 INFO]: Steve[/172.17.0.1:50000] logged in with entity id 123 at (...)"
+_EVENT_RE = re.compile(
+    r"\]:\s+(?P<player>[A-Za-z0-9_]{1,16})(?:\[[^\]]*\])?\s+"
+    r"(?P<what>joined the game|left the game|logged in with entity id|lost connection)"
+)
+_KINDS = {
+    "joined the game": "join",
+    "left the game": "leave",
+    "logged in with entity id": "login",
+    "lost connection": "lost",
+}
+# Ignorar errores ruidosos de log4j
+_IGNORE = re.compile(r"Unable to locate appender|TerminalConsole", re.IGNORECASE)
+
+_lock = threading.Lock()
+_players: dict[str, dict] = {}       # nombre -> {"last": PlayerEvent, "since": ts de la sesión abierta o None}
+_state = {
+    "alive": False,
+    "last_event": None,              # último PlayerEvent (cualquier jugador)
+    "last_line": "",                 # última línea no ignorada, por si no hubo eventos
+    "last_ts": None,                 # timestamp docker de la última línea procesada
+}
+_listeners: list[Callable[[PlayerEvent], None]] = []
+_thread: Optional[threading.Thread] = None
+
+
+def _parse_ts(value: str) -> Optional[float]:
+    # "2024-05-01T12:34:56.123456789Z" (docker logs --timestamps)
+    try:
+        base, _, frac = value.rstrip("Z").partition(".")
+        dt = datetime.strptime(base, "%Y-%m-%dT%H:%M:%S").replace(tzinfo=timezone.utc)
+        return dt.timestamp() + (float(f"0.{frac}") if frac.isdigit() else 0.0)
+    except ValueError:
+        return None
+
+
+def parse_event(line: str, ts: float) -> Optional[PlayerEvent]:
+    m = _EVENT_RE.search(line)
+    if not m:
+        return None
+    return PlayerEvent(ts, m.group("player"), _KINDS[m.group("what")], line)
+
+
+def _emit(ev: PlayerEvent):
+    for fn in list(_listeners):
+        try:
+            fn(ev)
+        except Exception:
+            logging.exception("mc_sessions: listener falló")
+
+
+def _apply(ev: PlayerEvent, live: bool) -> Optional[PlayerEvent]:
+    """
+    Actualiza el índice. Las líneas del backlog (live=False) solo cuentan para la
+    última actividad. Devuelve el evento a notificar o None.
+    """
+    with _lock:
+        p = _players.setdefault(ev.player, {"last": None, "since": None})
+        p["last"] = ev
+        _state["last_event"] = ev
+        if not live:
+            return None
+        if ev.kind == "join":
+            p["since"] = ev.ts
+            return ev
+        if ev.kind in ("leave", "lost") and p["since"] is not None:
+            # "lost connection" y "left the game" llegan juntos: solo cierra el primero
+            p["since"] = None
+            return PlayerEvent(ev.ts, ev.player, "leave", ev.line)
+    return None
+
+
+def _handle_line(raw: str, live: bool):
+    ts_text, _, line = raw.partition(" ")
+    ts = _parse_ts(ts_text)
+    if ts is None:
+        ts, line = time.time(), raw
+    if _state["last_ts"] is not None and ts <= _state["last_ts"]:
+        return  # ya procesada (reconexión con since)
+    _state["last_ts"] = ts
+    if not line.strip() or _IGNORE.search(line):
+        return
+    _state["last_line"] = line
+
+    ev = parse_event(line, ts)
+    if ev is None:
+        return
+    out = _apply(ev, live)
+    if out is not None:
+        _emit(out)
+
+
+def _close_all(reason: str):
+    """El servidor se paró: cierra las sesiones abiertas."""
+    now = time.time()
+    with _lock:
+        closed = [name for name, p in _players.items() if p["since"] is not None]
+        for name in closed:
+            _players[name]["since"] = None
+    for name in closed:
+        _emit(PlayerEvent(now, name, "leave", reason))
+
+
+def _seed(names: list[str], since: float):
+    """Abre sesión a los jugadores que RCON dice conectados y el log no vio entrar."""
+    opened = []
+    with _lock:
+        for name in names:
+            p = _players.setdefault(name, {"last": None, "since": None})
+            if p["since"] is None:
+                last = p["last"]
+                p["since"] = last.ts if last and last.kind in ("join", "login") else since
+                opened.append(PlayerEvent(p["since"], name, "join", ""))
+    for ev in opened:
+        _emit(ev)
+
+
+def _follow_loop(container: Callable[[], str], is_running: Callable[[], bool],
+                 seed: Optional[Callable[[], list[str]]]):
+    first = True
+    backoff = 1
+    while True:
+        try:
+            if not is_running():
+                time.sleep(2)
+                continue
+            client = docker_api.get_client()
+            started = time.time()
+            if first:
+                # backlog: solo para la última actividad; las sesiones abiertas las da RCON
+                for raw in client.logs(container(), tail=MC_LOG_BACKLOG, timestamps=True).splitlines():
+                    _handle_line(raw, live=False)
+                if seed:
+                    try:
+                        _seed(seed(), started)
+                    except Exception as e:
+                        logging.warning("mc_sessions: no pude sembrar sesiones: %s", e)
+                first = False
+
+            _state["alive"] = True
+            for raw in client.logs_stream(container(), since=_state["last_ts"] or started, timestamps=True):
+                _handle_line(raw, live=True)
+            backoff = 1
+            time.sleep(1)  # el stream termina al pararse el contenedor
+        except Exception as e:
+            logging.warning("mc_sessions: %s", e)
+            time.sleep(backoff)
+            backoff = min(backoff * 2, 60)
+        _state["alive"] = False
+        if not is_running():
+            _close_all("servidor detenido")
+
+
+def start_follower(container: Callable[[], str], is_running: Callable[[], bool],
+                   seed: Optional[Callable[[], list[str]]] = None):
+    """
+    Arranca (una vez) el hilo que sigue el log.
+    seed: devuelve los jugadores conectados (RCON) para abrir sus sesiones al arrancar el bot.
+    """
+    global _thread
+    if _thread and _thread.is_alive():
+        return
+    _thread = threading.Thread(target=_follow_loop, args=(container, is_running, seed),
+                               name="mc-log", daemon=True)
+    _thread.start()
+
+
+def add_listener(fn: Callable[[PlayerEvent], None]):
+    """fn(PlayerEvent) en cada join/leave en vivo (leave también al pararse el servidor)."""
+    _listeners.append(fn)
+
+
+def is_alive() -> bool:
+    return _state["alive"]
+
+
+def online() -> list[str]:
+    """Jugadores con sesión abierta, del que más lleva al que menos."""
+    with _lock:
+        return [n for n, p in sorted(_players.items(), key=lambda kv: kv[1]["since"] or 0)
+                if p["since"] is not None]
+
+
+def sessions() -> dict[str, float]:
+    """nombre -> inicio de la sesión abierta."""
+    with _lock:
+        return {n: p["since"] for n, p in _players.items() if p["since"] is not None}
+
+
+def last_event(player: Optional[str] = None) -> Optional[PlayerEvent]:
+    with _lock:
+        if player is None:
+            return _state["last_event"]
+        p = _players.get(player)
+        return p["last"] if p else None
+
+
+def last_activity() -> str:
+    """Línea de la última entrada/salida de un jugador; si no hubo, la última línea del log."""
+    ev = last_event()
+    if ev is not None:
+        return ev.line
+    return _state["last_line"] or "Sin logs."
@@ -0,0 +1,310 @@
+# mc_stats.py
+#
+# Estadísticas de juego de Minecraft en SQLite (modo WAL).
+# - Cada entrada/salida que detecta mc_sessions abre o cierra una fila en
+#   `sessions`.
+# - Al cerrar una sesión se acumula en `player_totals` y en `daily` (repartida
+#   por días locales), y `peaks` guarda la concurrencia máxima de cada día.
+# - Las consultas de /mc_stats y /mc_top leen esas tablas agregadas por índice,
+#   sin recorrer el histórico de sesiones: milisegundos aunque haya años de datos.
+
+import os
+import time
+import sqlite3
+import logging
+import threading
+from typing import Optional
+
+MC_STATS_DB = os.getenv("MC_STATS_DB", "data/mc_stats.db")
+# Cada cuánto se apunta que el bot sigue vivo (cierre de sesiones si se cae)
+HEARTBEAT_S = 60
+# Si un jugador vuelve a aparecer a menos de esto del cierre forzado, se reabre la sesión
+_REOPEN_GAP_S = 300
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    id     INTEGER PRIMARY KEY,
+    player TEXT NOT NULL,
+    start  REAL NOT NULL,
+    end    REAL,
+    forced INTEGER NOT NULL DEFAULT 0   -- 1: cerrada por _close_orphans, no por un leave
+);
+CREATE INDEX IF NOT EXISTS idx_sessions_player_start ON sessions(player, start);
+CREATE INDEX IF NOT EXISTS idx_sessions_start ON sessions(start);
+CREATE INDEX IF NOT EXISTS idx_sessions_open ON sessions(player) WHERE end IS NULL;
+
+CREATE TABLE IF NOT EXISTS player_totals (
+    player     TEXT PRIMARY KEY,
+    seconds    REAL NOT NULL DEFAULT 0,
+    sessions   INTEGER NOT NULL DEFAULT 0,
+    longest    REAL NOT NULL DEFAULT 0,
+    first_seen REAL,
+    last_seen  REAL
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_totals_seconds ON player_totals(seconds);
+
+CREATE TABLE IF NOT EXISTS daily (
+    day     TEXT NOT NULL,
+    player  TEXT NOT NULL,
+    seconds REAL NOT NULL DEFAULT 0,
+    PRIMARY KEY (day, player)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_daily_player_day ON daily(player, day);
+
+CREATE TABLE IF NOT EXISTS peaks (
+    day  TEXT PRIMARY KEY,
+    peak INTEGER NOT NULL,
+    at   REAL NOT NULL
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS meta (
+    key   TEXT PRIMARY KEY,
+    value REAL
+) WITHOUT ROWID;
+"""
+
+_lock = threading.Lock()
+_conn: Optional[sqlite3.Connection] = None
+_last_heartbeat = 0.0
+
+
+def _day(ts: float) -> str:
+    return time.strftime("%Y-%m-%d", time.localtime(ts))
+
+
+def _next_midnight(ts: float) -> float:
+    t = time.localtime(ts)
+    return time.mktime((t.tm_year, t.tm_mon, t.tm_mday + 1, 0, 0, 0, 0, 0, -1))
+
+
+def _db() -> sqlite3.Connection:
+    """Conexión única (con _lock tomado). La primera vez crea el esquema y cierra sesiones huérfanas."""
+    global _conn
+    if _conn is None:
+        d = os.path.dirname(MC_STATS_DB)
+        if d:
+            os.makedirs(d, exist_ok=True)
+        conn = sqlite3.connect(MC_STATS_DB, check_same_thread=False, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript(_SCHEMA)
+        cols = {row[1] for row in conn.execute("PRAGMA table_info(sessions)")}
+        if "forced" not in cols:  # bases creadas antes de la columna
+            conn.execute("ALTER TABLE sessions ADD COLUMN forced INTEGER NOT NULL DEFAULT 0")
+        _conn = conn
+        _close_orphans()
+    return _conn
+
+
+def _account(conn: sqlite3.Connection, player: str, start: float, end: float, sign: int = 1):
+    """Suma (o resta, sign=-1) una sesión cerrada a los agregados."""
+    dur = max(0.0, end - start)
+    conn.execute(
+        "INSERT INTO player_totals (player, seconds, sessions, longest, first_seen, last_seen) "
+        "VALUES (?, ?, ?, ?, ?, ?) "
+        "ON CONFLICT(player) DO UPDATE SET seconds = seconds + excluded.seconds, "
+        "sessions = sessions + excluded.sessions, "
+        "longest = MAX(longest, excluded.longest), "
+        "first_seen = MIN(first_seen, excluded.first_seen), "
+        "last_seen = MAX(last_seen, excluded.last_seen)",
+        (player, sign * dur, sign, dur if sign > 0 else 0, start, end),
+    )
+    t = start
+    while t < end:
+        cut = min(end, _next_midnight(t))
+        conn.execute(
+            "INSERT INTO daily (day, player, seconds) VALUES (?, ?, ?) "
+            "ON CONFLICT(day, player) DO UPDATE SET seconds = seconds + excluded.seconds",
+            (_day(t), player, sign * (cut - t)),
+        )
+        t = cut
+
+
+def _close_orphans():
+    """Sesiones abiertas de una ejecución anterior: se cierran en el último latido del bot."""
+    conn = _conn
+    row = conn.execute("SELECT value FROM meta WHERE key = 'heartbeat'").fetchone()
+    orphans = conn.execute("SELECT id, player, start FROM sessions WHERE end IS NULL").fetchall()
+    if not orphans:
+        return
+    conn.execute("BEGIN")
+    for sid, player, start in orphans:
+        end = max(start, row[0] if row and row[0] else start)
+        conn.execute("UPDATE sessions SET end = ?, forced = 1 WHERE id = ?", (end, sid))
+        _account(conn, player, start, end)
+    conn.execute("COMMIT")
+    logging.info("mc_stats: %d sesiones huérfanas cerradas", len(orphans))
+
+
+def _open_session(conn: sqlite3.Connection, player: str, ts: float):
+    if conn.execute("SELECT 1 FROM sessions WHERE player = ? AND end IS NULL", (player,)).fetchone():
+        return  # ya abierta (p.ej. sembrada desde RCON al reiniciar el bot)
+
+    last = conn.execute(
+        "SELECT id, start, end, forced FROM sessions WHERE player = ? ORDER BY start DESC LIMIT 1", (player,)
+    ).fetchone()
+    if last and last[3] and last[2] is not None and ts <= last[2] + _REOPEN_GAP_S:
+        # El bot se reinició durante la sesión: se deshace el cierre forzado.
+        # Un leave normal (o el cierre por servidor detenido) no entra aquí.
+        sid, start, end, _ = last
+        _account(conn, player, start, end, sign=-1)
+        conn.execute("UPDATE sessions SET end = NULL, forced = 0 WHERE id = ?", (sid,))
+    else:
+        conn.execute("INSERT INTO sessions (player, start) VALUES (?, ?)", (player, ts))
+
+    (online,) = conn.execute("SELECT COUNT(*) FROM sessions WHERE end IS NULL").fetchone()
+    conn.execute(
+        "INSERT INTO peaks (day, peak, at) VALUES (?, ?, ?) "
+        "ON CONFLICT(day) DO UPDATE SET peak = excluded.peak, at = excluded.at WHERE excluded.peak > peak",
+        (_day(ts), online, ts),
+    )
+
+
+def _close_session(conn: sqlite3.Connection, player: str, ts: float):
+    row = conn.execute(
+        "SELECT id, start FROM sessions WHERE player = ? AND end IS NULL", (player,)
+    ).fetchone()
+    if not row:
+        return
+    sid, start = row
+    end = max(start, ts)
+    conn.execute("UPDATE sessions SET end = ? WHERE id = ?", (end, sid))
+    _account(conn, player, start, end)
+
+
+def record(ev):
+    """
+    Listener de mc_sessions (PlayerEvent): join abre sesión, leave la cierra.
+    Pensado para mc_sessions.add_listener(mc_stats.record).
+    """
+    if ev.kind not in ("join", "leave"):
+        return
+    with _lock:
+        conn = _db()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            if ev.kind == "join":
+                _open_session(conn, ev.player, ev.ts)
+            else:
+                _close_session(conn, ev.player, ev.ts)
+            conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('heartbeat', ?)", (time.time(),))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            logging.exception("mc_stats: no pude registrar %s", ev)
+
+
+def heartbeat(_snapshot=None):
+    """
+    Apunta que el bot sigue vivo (como mucho cada HEARTBEAT_S) para poder cerrar
+    sesiones huérfanas tras una caída. Se puede colgar de sampler.add_listener.
+    """
+    global _last_heartbeat
+    now = time.time()
+    if now - _last_heartbeat < HEARTBEAT_S:
+        return
+    _last_heartbeat = now
+    with _lock:
+        try:
+            _db().execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('heartbeat', ?)", (now,))
+        except sqlite3.Error as e:
+            logging.warning("mc_stats: heartbeat: %s", e)
+
+
+# ---- Consultas ----
+
+def _open_seconds(conn: sqlite3.Connection, now: float, player: Optional[str] = None) -> dict[str, float]:
+    sql = "SELECT player, start FROM sessions WHERE end IS NULL"
+    args: tuple = ()
+    if player is not None:
+        sql += " AND player = ?"
+        args = (player,)
+    return {p: max(0.0, now - start) for p, start in conn.execute(sql, args)}
+
+
+def summary(days: int = 7) -> dict:
+    now = time.time()
+    since = _day(now - (days - 1) * 86400)
+    with _lock:
+        conn = _db()
+        players, seconds, sessions = conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(seconds), 0), COALESCE(SUM(sessions), 0) FROM player_totals"
+        ).fetchone()
+        peak = conn.execute("SELECT peak, at FROM peaks ORDER BY peak DESC, at LIMIT 1").fetchone()
+        per_day = conn.execute(
+            "SELECT day, SUM(seconds), COUNT(*) FROM daily WHERE day >= ? AND seconds > 0 GROUP BY day ORDER BY day",
+            (since,),
+        ).fetchall()
+        open_now = _open_seconds(conn, now)
+    return {
+        "players": players,
+        "seconds": seconds + sum(open_now.values()),
+        "sessions": sessions + len(open_now),
+        "peak": peak,
+        "per_day": per_day,
+        "online": sorted(open_now),
+    }
+
+
+def player_stats(player: str, days: int = 7) -> Optional[dict]:
+    now = time.time()
+    since = _day(now - (days - 1) * 86400)
+    with _lock:
+        conn = _db()
+        # Los nombres de Minecraft no distinguen mayúsculas
+        row = conn.execute(
+            "SELECT player, seconds, sessions, longest, first_seen, last_seen FROM player_totals "
+            "WHERE player = ? COLLATE NOCASE", (player,)
+        ).fetchone()
+        if row is None:
+            row = conn.execute(
+                "SELECT DISTINCT player, 0, 0, 0, NULL, NULL FROM sessions WHERE player = ? COLLATE NOCASE AND end IS NULL",
+                (player,),
+            ).fetchone()
+        if row is None:
+            return None
+        name, seconds, sessions, longest, first_seen, last_seen = row
+        per_day = conn.execute(
+            "SELECT day, seconds FROM daily WHERE player = ? AND day >= ? ORDER BY day", (name, since)
+        ).fetchall()
+        open_now = _open_seconds(conn, now, name).get(name)
+    if open_now is not None:
+        seconds += open_now
+        sessions += 1
+        longest = max(longest, open_now)
+        first_seen = first_seen or now - open_now
+    return {
+        "player": name,
+        "seconds": seconds,
+        "sessions": sessions,
+        "longest": longest,
+        "first_seen": first_seen,
+        "last_seen": now if open_now is not None else last_seen,
+        "online_for": open_now,
+        "per_day": per_day,
+    }
+
+
+def top(limit: int = 10, days: Optional[int] = None) -> list[tuple[str, float]]:
+    """Ranking por tiempo jugado (total, o de los últimos `days` días)."""
+    now = time.time()
+    with _lock:
+        conn = _db()
+        open_now = _open_seconds(conn, now)
+        if days is None:
+            totals = dict(conn.execute(
+                "SELECT player, seconds FROM player_totals ORDER BY seconds DESC LIMIT ?", (limit,)
+            ))
+            # los conectados pueden entrar al ranking con la sesión en curso
+            for p in open_now:
+                if p not in totals:
+                    row = conn.execute("SELECT seconds FROM player_totals WHERE player = ?", (p,)).fetchone()
+                    totals[p] = row[0] if row else 0.0
+        else:
+            totals = dict(conn.execute(
+                "SELECT player, SUM(seconds) FROM daily WHERE day >= ? GROUP BY player",
+                (_day(now - (days - 1) * 86400),),
+            ))
+    for p, s in open_now.items():
+        totals[p] = totals.get(p, 0.0) + s
+    return sorted(totals.items(), key=lambda kv: kv[1], reverse=True)[:limit]
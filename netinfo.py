@@ -0,0 +1,121 @@
+# netinfo.py
+#
+# Direcciones IPv4 por interfaz sin forks (ioctl SIOCGIFADDR), con cache.
+# Un hilo escucha netlink (RTMGRP_LINK | RTMGRP_IPV4_IFADDR) e invalida la
+# cache cuando cambia un enlace o una dirección; el TTL es solo un respaldo.
+
+import os
+import time
+import fcntl
+import socket
+import struct
+import logging
+import threading
+from typing import Optional
+
+SIOCGIFFLAGS = 0x8913
+SIOCGIFADDR = 0x8915
+IFF_UP = 0x1
+
+RTMGRP_LINK = 0x1
+RTMGRP_IPV4_IFADDR = 0x10
+
+NET_TTL_S = float(os.getenv("NET_TTL_S", "300"))
+_FALLBACK_TTL_S = 15.0  # si netlink no está disponible
+
+_lock = threading.Lock()
+_cache: dict = {"ts": 0.0, "gen": 0, "entries": []}
+_watcher: Optional[threading.Thread] = None
+_watcher_lock = threading.Lock()   # el OLED y un handler pueden llegar a la vez la primera vez
+_netlink_ok = False
+_netlink_failed = False       # sin netlink en esta máquina: no se reintenta
+_netlink_retry_at = 0.0       # el watcher murió: no relanzarlo antes de esto
+_NETLINK_RETRY_S = 60.0
+
+
+def _ioctl_ifreq(sock: socket.socket, request: int, ifname: str) -> bytes:
+    return fcntl.ioctl(sock.fileno(), request, struct.pack("256s", ifname.encode()[:15]))
+
+
+def _read_addresses() -> list[tuple[str, str]]:
+    """(interfaz, ip) de las interfaces levantadas con IPv4, en orden de ifindex."""
+    entries = []
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as s:
+        for _, name in sorted(socket.if_nameindex()):
+            try:
+                flags = struct.unpack("H", _ioctl_ifreq(s, SIOCGIFFLAGS, name)[16:18])[0]
+                if not flags & IFF_UP:
+                    continue
+                addr = socket.inet_ntoa(_ioctl_ifreq(s, SIOCGIFADDR, name)[20:24])
+            except OSError:
+                continue  # sin IPv4 asignada
+            entries.append((name, addr))
+    return entries
+
+
+def _invalidate():
+    with _lock:
+        _cache["ts"] = 0.0
+        _cache["gen"] += 1
+
+
+def _watch_netlink():
+    global _netlink_ok, _netlink_failed, _netlink_retry_at
+    try:
+        if not hasattr(socket, "AF_NETLINK"):
+            raise OSError("plataforma sin AF_NETLINK")
+        sock = socket.socket(socket.AF_NETLINK, socket.SOCK_RAW, socket.NETLINK_ROUTE)
+        sock.bind((0, RTMGRP_LINK | RTMGRP_IPV4_IFADDR))
+    except (OSError, AttributeError) as e:
+        _netlink_failed = True
+        logging.warning("netinfo: netlink no disponible (%s), uso TTL de %ss", e, _FALLBACK_TTL_S)
+        return
+    _netlink_ok = True
+    try:
+        while True:
+            # No hace falta parsear: cualquier mensaje de enlace/dirección invalida
+            sock.recv(65536)
+            _invalidate()
+    except OSError:
+        logging.exception("netinfo: watcher netlink terminó")
+    finally:
+        _netlink_ok = False
+        _netlink_retry_at = time.monotonic() + _NETLINK_RETRY_S
+        _invalidate()
+        sock.close()
+
+
+def _ensure_watcher():
+    global _watcher
+    if _netlink_failed:
+        return
+    with _watcher_lock:
+        if _watcher is None or (not _watcher.is_alive() and time.monotonic() >= _netlink_retry_at):
+            _watcher = threading.Thread(target=_watch_netlink, name="netinfo-netlink", daemon=True)
+            _watcher.start()
+
+
+def ipv4_addresses() -> list[tuple[str, str]]:
+    """Lista cacheada de (interfaz, ip) sin loopback."""
+    _ensure_watcher()
+    ttl = NET_TTL_S if _netlink_ok else _FALLBACK_TTL_S
+    now = time.monotonic()
+    with _lock:
+        if now - _cache["ts"] < ttl:
+            return list(_cache["entries"])
+        gen = _cache["gen"]
+    try:
+        entries = [(n, a) for n, a in _read_addresses() if not a.startswith("127.")]
+    except Exception:
+        logging.exception("netinfo: error leyendo interfaces")
+        entries = []
+    with _lock:
+        # Si llegó un evento mientras leíamos, no marcar la lectura como fresca
+        if _cache["gen"] == gen:
+            _cache.update({"ts": now, "entries": entries})
+    return list(entries)
+
+
+def host_ips() -> str:
+    """Equivalente a `hostname -I` (IPv4): direcciones separadas por espacio."""
+    return " ".join(addr for _, addr in ipv4_addresses())
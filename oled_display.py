@@ -1,11 +1,20 @@
 # oled_display.py
+#
+# Render del OLED con backend elegible por OLED_BACKEND:
+# - ssd1306: pantalla real por I2C (board/busio/adafruit se importan al primer frame)
+# - memory:  framebuffer en memoria que emula la RAM del SSD1306 (tests, benchmarks)
+# - file:    como memory y además vuelca cada frame a OLED_FILE (.png o .pbm)
+import os
 import time
+import logging
 import threading
-import board
-import busio
-from adafruit_ssd1306 import SSD1306_I2C
+from functools import lru_cache
 from PIL import Image, ImageDraw, ImageFont
 
+OLED_BACKEND = os.getenv("OLED_BACKEND", "ssd1306").lower()
+OLED_FILE = os.getenv("OLED_FILE", "data/oled.png")
+OLED_I2C_ADDR = int(os.getenv("OLED_I2C_ADDR", "0x3c"), 0)
+
 _auto_thread = None
 _stop_event = threading.Event()
 _LOCK = threading.Lock()
@@ -29,31 +38,234 @@ def _load_font(size: int):
 FONT_HEADER = _load_font(12)
 FONT_BODY = _load_font(11)
 
-# Configurar OLED
-i2c = busio.I2C(board.SCL, board.SDA)
-oled = SSD1306_I2C(128, 64, i2c, addr=0x3c)
-
-width = oled.width
-height = oled.height
+# Lienzo del OLED (la pantalla se abre al primer frame, ver _get_writer)
+width = 128
+height = 64
 image = Image.new("1", (width, height))
 draw = ImageDraw.Draw(image)
 
+
+# ---------------------------------------------------------------------------
+# Escritura por páginas: la RAM del SSD1306 son 8 páginas de 8 filas x 128
+# columnas. Se guarda el último frame enviado y solo se mandan los tramos de
+# columnas que cambian en cada página (ventana columna/página + datos), en vez
+# del framebuffer entero (~1 KB) por cualquier cambio, como el reloj.
+# ---------------------------------------------------------------------------
+
+_SET_COL_ADDR = 0x21
+_SET_PAGE_ADDR = 0x22
+# Tramos separados por menos columnas se mandan juntos: sale más barato que otra ventana
+_MERGE_GAP = 8
+# Lo que cuesta oled.show(): 6 comandos (2 bytes cada uno) + 0x40 + framebuffer
+_FULL_FRAME_BYTES = 6 * 2 + 1 + 128 * 64 // 8
+
+
+class PageDiffWriter:
+    """Backend ssd1306: el dispositivo I2C se abre en el primer envío."""
+
+    name = "ssd1306"
+
+    def __init__(self, width: int, height: int, device=None):
+        self.device = device
+        self.width = width
+        self.pages = height // 8
+        self._prev: bytes | None = None   # último frame en formato de páginas
+        self.stats = {"frames": 0, "skipped": 0, "bytes": 0, "writes": 0,
+                      "render_total": 0.0, "render_max": 0.0}
+
+    def frame_bytes(self, img) -> bytes:
+        """Imagen modo "1" -> RAM del SSD1306 (página a página, bit 0 = fila de arriba)."""
+        # Traspuesta + espejo: cada fila de t es una columna de la pantalla con
+        # las páginas en orden inverso y los bits ya colocados como los quiere el chip.
+        t = img.transpose(Image.Transpose.TRANSPOSE).transpose(Image.Transpose.FLIP_LEFT_RIGHT).tobytes()
+        n = self.pages
+        return b"".join(t[n - 1 - p::n] for p in range(n))
+
+    def _runs(self, old: bytes, new: bytes, base: int) -> list[tuple[int, int]]:
+        """Tramos [c0, c1] de columnas distintas dentro de una página."""
+        runs = []
+        for c in range(self.width):
+            if old[base + c] != new[base + c]:
+                if runs and c - runs[-1][1] <= _MERGE_GAP:
+                    runs[-1][1] = c
+                else:
+                    runs.append([c, c])
+        return [(a, b) for a, b in runs]
+
+    def _send(self, c0: int, c1: int, p0: int, p1: int, data: bytes) -> int:
+        # un solo bloque de comandos (control 0x00) y uno de datos (control 0x40)
+        cmds = bytes([0x00, _SET_COL_ADDR, c0, c1, _SET_PAGE_ADDR, p0, p1])
+        if self.device is None:
+            self.device = _open_ssd1306(self.width, self.pages * 8)
+        with self.device.i2c_device as dev:
+            dev.write(cmds)
+            dev.write(b"\x40" + data)
+        self.stats["writes"] += 1
+        return len(cmds) + 1 + len(data)
+
+    def write(self, img) -> int:
+        """Manda a la pantalla solo lo que cambió respecto al último frame. Devuelve bytes I2C."""
+        new = self.frame_bytes(img)
+        old = self._prev
+        w = self.width
+        sent = 0
+        if old is None:
+            sent = self._send(0, w - 1, 0, self.pages - 1, new)
+        else:
+            for p in range(self.pages):
+                base = p * w
+                if old[base:base + w] == new[base:base + w]:
+                    continue
+                for c0, c1 in self._runs(old, new, base):
+                    sent += self._send(c0, c1, p, p, new[base + c0:base + c1 + 1])
+        self._prev = new
+        if sent:
+            self.stats["frames"] += 1
+            self.stats["bytes"] += sent
+        else:
+            self.stats["skipped"] += 1
+        return sent
+
+    def invalidate(self):
+        """La RAM de la pantalla ya no es fiable (error I2C): el siguiente frame va entero."""
+        self._prev = None
+
+    def note_render(self, elapsed: float):
+        self.stats["render_total"] += elapsed
+        self.stats["render_max"] = max(self.stats["render_max"], elapsed)
+
+
+class MemoryWriter(PageDiffWriter):
+    """
+    Backend memory: mismo diff por páginas, pero las escrituras van a una copia
+    de la RAM del controlador. Las estadísticas de bytes siguen siendo las que
+    costaría el I2C real.
+    """
+
+    name = "memory"
+
+    def __init__(self, width: int, height: int):
+        super().__init__(width, height)
+        self.ram = bytearray(width * height // 8)
+
+    def _send(self, c0: int, c1: int, p0: int, p1: int, data: bytes) -> int:
+        # direccionamiento horizontal dentro de la ventana, como el SSD1306
+        ncols = c1 - c0 + 1
+        for i in range(0, len(data), ncols):
+            p = p0 + i // ncols
+            if p > p1:
+                break
+            base = p * self.width + c0
+            self.ram[base:base + ncols] = data[i:i + ncols]
+        self.stats["writes"] += 1
+        return 7 + 1 + len(data)
+
+    def frame(self):
+        """La pantalla tal y como quedó (reconstruida desde la RAM emulada)."""
+        n = self.pages
+        t = bytearray(len(self.ram))
+        for p in range(n):
+            t[n - 1 - p::n] = self.ram[p * self.width:(p + 1) * self.width]
+        img = Image.frombytes("1", (n * 8, self.width), bytes(t))
+        return img.transpose(Image.Transpose.FLIP_LEFT_RIGHT).transpose(Image.Transpose.TRANSPOSE)
+
+
+class FileWriter(MemoryWriter):
+    """Backend file: MemoryWriter + volcado del frame a disco (PNG o PBM según extensión)."""
+
+    name = "file"
+
+    def __init__(self, width: int, height: int, path: str):
+        super().__init__(width, height)
+        self.path = path
+
+    def write(self, img) -> int:
+        sent = super().write(img)
+        if sent:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            root, ext = os.path.splitext(self.path)
+            tmp = f"{root}.tmp{ext}"
+            img.save(tmp)
+            os.replace(tmp, self.path)   # quien lo lea nunca ve un fichero a medias
+        return sent
+
+
+def _open_ssd1306(w: int, h: int):
+    import board
+    import busio
+    from adafruit_ssd1306 import SSD1306_I2C
+
+    i2c = busio.I2C(board.SCL, board.SDA)
+    return SSD1306_I2C(w, h, i2c, addr=OLED_I2C_ADDR)
+
+
+_writer = None
+
+
+def _get_writer():
+    """Crea el backend en el primer frame; sin pantalla, cae a memoria para no tumbar el bot."""
+    global _writer
+    if _writer is None:
+        if OLED_BACKEND == "memory":
+            _writer = MemoryWriter(width, height)
+        elif OLED_BACKEND == "file":
+            _writer = FileWriter(width, height, OLED_FILE)
+        else:
+            try:
+                _writer = PageDiffWriter(width, height, device=_open_ssd1306(width, height))
+            except Exception as e:
+                logging.warning("OLED: no pude abrir el SSD1306 (%s); uso backend en memoria", e)
+                _writer = MemoryWriter(width, height)
+    return _writer
+
+
+def get_backend():
+    """Backend activo (p.ej. MemoryWriter.frame() para ver la pantalla sin hardware)."""
+    with _LOCK:
+        return _get_writer()
+
+# ---------------------------------------------------------------------------
+# Caché de texto: las mismas cadenas ("PatanaBot", la hora, líneas fijas) se
+# repiten frame tras frame. Se rasterizan una vez con FreeType y luego cada
+# frame es pegar bitmaps; los anchos medidos también se guardan.
+# ---------------------------------------------------------------------------
+
+@lru_cache(maxsize=1024)
+def _text_bbox(text: str, font) -> tuple[int, int, int, int]:
+    return draw.textbbox((0, 0), text, font=font)
+
+
+@lru_cache(maxsize=256)
+def _line_bitmap(text: str, font):
+    """Bitmap "1" con el texto dibujado en (0, 0), igual que lo haría draw.text."""
+    _, _, right, bottom = _text_bbox(text, font)
+    bmp = Image.new("1", (max(1, right), max(1, bottom)))
+    ImageDraw.Draw(bmp).text((0, 0), text, font=font, fill=255)
+    return bmp
+
+
+def _draw_text(xy: tuple[int, int], text: str, font):
+    if text:
+        bmp = _line_bitmap(text, font)
+        # con máscara: solo se pintan los píxeles encendidos, como draw.text
+        image.paste(bmp, xy, bmp)
+
+
 def _wrap_text(text: str, font, max_width: int):
-    # Wrap simple por palabras
+    # Wrap por palabras: búsqueda binaria de cuántas caben en cada línea
     words = text.split()
     lines = []
-    line = ""
-    for w in words:
-        test = f"{line} {w}".strip()
-        bbox = draw.textbbox((0, 0), test, font=font)
-        if bbox[2] <= max_width:
-            line = test
-        else:
-            if line:
-                lines.append(line)
-            line = w
-    if line:
-        lines.append(line)
+    while words:
+        lo, hi = 1, len(words)
+        while lo < hi:
+            mid = (lo + hi + 1) // 2
+            if _text_bbox(" ".join(words[:mid]), font)[2] <= max_width:
+                lo = mid
+            else:
+                hi = mid - 1
+        # una palabra que no cabe sola va en su propia línea
+        lines.append(" ".join(words[:lo]))
+        words = words[lo:]
     return lines
 
 def render_status(
@@ -82,15 +294,16 @@ def render_status(
         return
 
     with _LOCK:
+        t0 = time.perf_counter()
         try:
             draw.rectangle((0, 0, width, height), outline=0, fill=0)
 
             # Header
-            draw.text((0, 0), title[:10], font=FONT_HEADER, fill=255)
+            _draw_text((0, 0), title[:10], FONT_HEADER)
             if right:
-                bbox = draw.textbbox((0, 0), right, font=FONT_HEADER)
+                bbox = _text_bbox(right, FONT_HEADER)
                 rw = bbox[2] - bbox[0]
-                draw.text((width - rw, 0), right, font=FONT_HEADER, fill=255)
+                _draw_text((width - rw, 0), right, FONT_HEADER)
 
             y = 16  # debajo del header
 
@@ -103,11 +316,12 @@ def render_status(
                 # wrap por si se pasa
                 wrapped = _wrap_text(text, FONT_BODY, width)
                 for wline in wrapped[:1]:  # 1 línea por bloque (compacto)
-                    draw.text((0, y), wline, font=FONT_BODY, fill=255)
+                    _draw_text((0, y), wline, FONT_BODY)
                     y += 16
 
-            oled.image(image)
-            oled.show()
+            writer = _get_writer()
+            writer.write(image)
+            writer.note_render(time.perf_counter() - t0)
 
             _LAST_RENDER = payload
             _LAST_TS = now
@@ -115,7 +329,30 @@ def render_status(
         except Exception:
             # Si OLED falla, no queremos tumbar el bot.
             # Aquí podrías hacer logging.exception(...) si ya tienes logging configurado.
-            pass
+            if _writer is not None:
+                _writer.invalidate()
+
+def oled_stats() -> dict:
+    writer = get_backend()
+    s = dict(writer.stats)
+    s["backend"] = writer.name
+    renders = s["frames"] + s["skipped"]
+    s["bytes_avg"] = s["bytes"] / s["frames"] if s["frames"] else 0.0
+    s["render_avg"] = s["render_total"] / renders if renders else 0.0
+    s["full_frame_bytes"] = _FULL_FRAME_BYTES
+    s["text_cache"] = _line_bitmap.cache_info()
+    s["width_cache"] = _text_bbox.cache_info()
+    return s
+
+
+def oled_stats_text() -> str:
+    s = oled_stats()
+    return (
+        f"OLED ({s['backend']}): {s['frames']} frames ({s['skipped']} sin cambios en RAM) | "
+        f"I2C medio {s['bytes_avg']:.0f} B/frame (completo {s['full_frame_bytes']} B) | "
+        f"render medio/máx {s['render_avg'] * 1000:.1f}/{s['render_max'] * 1000:.1f}ms | "
+        f"caché texto {s['text_cache'].hits}/{s['text_cache'].hits + s['text_cache'].misses} aciertos"
+    )
 
 # Compatibilidad: tu bot usa actualizar_pantalla(texto)
 def actualizar_pantalla(texto: str):
@@ -159,5 +396,27 @@ def start_auto_update(get_payload_fn, interval=2):
     _auto_thread = threading.Thread(target=_loop, daemon=True)
     _auto_thread.start()
 
+async def run_auto_update_async(get_payload_fn, interval=2):
+    """
+    Equivalente a start_auto_update para el modo asyncio: una tarea del event loop.
+    get_payload_fn y el render (I2C) son bloqueantes, así que van a un hilo del loop.
+    """
+    import asyncio
+
+    while not _stop_event.is_set():
+        try:
+            p = await asyncio.to_thread(get_payload_fn) or {}
+            await asyncio.to_thread(
+                render_status,
+                title=p.get("title", "PatanaBot"),
+                right=p.get("right", time.strftime("%H:%M")),
+                line1=p.get("line1", ""),
+                line2=p.get("line2", ""),
+                line3=p.get("line3", ""),
+            )
+        except Exception:
+            pass
+        await asyncio.sleep(interval)
+
 def stop_auto_update():
     _stop_event.set()
\ No newline at end of file
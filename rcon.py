@@ -0,0 +1,169 @@
+# rcon.py
+#
+# Cliente del protocolo RCON de Source (el que usa Minecraft) en Python puro.
+# Una conexión TCP autenticada y persistente, compartida por todo el bot, en vez
+# de un `docker exec rcon-cli` (sesión exec nueva dentro del contenedor) por consulta.
+
+import os
+import re
+import socket
+import struct
+import logging
+import threading
+from typing import NamedTuple, Optional
+
+MC_RCON_PORT = int(os.getenv("MC_RCON_PORT", "25575"))
+MC_RCON_TIMEOUT_S = float(os.getenv("MC_RCON_TIMEOUT_S", "5"))
+
+_TYPE_RESPONSE = 0
+_TYPE_COMMAND = 2
+_TYPE_AUTH = 3
+
+# Minecraft corta las respuestas en paquetes de 4096 bytes; el resto lo descartamos
+_MAX_PACKET = 4096 + 14
+
+
+class RconError(Exception):
+    pass
+
+
+class RconAuthError(RconError):
+    pass
+
+
+class RconSentError(RconError):
+    """Falló después de enviar el comando: puede haberse ejecutado, no se repite."""
+
+
+class PlayerList(NamedTuple):
+    count: int
+    max: int
+    names: list[str]
+
+
+_LIST_RE = re.compile(r"There are (\d+) of a max(?: of)? (\d+) players online:?(.*)", re.DOTALL)
+
+
+def parse_list(out: str) -> Optional[PlayerList]:
+    """Salida de `list` ("There are 2 of a max of 20 players online: a, b") o None si no cuadra."""
+    m = _LIST_RE.search(out)
+    if not m:
+        return None
+    names = [x.strip() for x in m.group(3).split(",") if x.strip()]
+    return PlayerList(int(m.group(1)), int(m.group(2)), names)
+
+
+class RconClient:
+    def __init__(self, host: str, password: str, port: int = MC_RCON_PORT, timeout: float = MC_RCON_TIMEOUT_S):
+        self.host = host
+        self.port = port
+        self.password = password
+        self.timeout = timeout
+        self._sock: Optional[socket.socket] = None
+        self._next_id = 0
+        self._lock = threading.Lock()
+
+    # ---- socket ----
+
+    def _recv_exact(self, n: int) -> bytes:
+        buf = bytearray()
+        while len(buf) < n:
+            chunk = self._sock.recv(n - len(buf))
+            if not chunk:
+                raise ConnectionError("RCON: conexión cerrada")
+            buf.extend(chunk)
+        return bytes(buf)
+
+    def _send(self, ptype: int, body: str) -> int:
+        self._next_id = (self._next_id % 0x7FFFFFFF) + 1
+        payload = struct.pack("<ii", self._next_id, ptype) + body.encode("utf-8") + b"\0\0"
+        self._sock.sendall(struct.pack("<i", len(payload)) + payload)
+        return self._next_id
+
+    def _recv(self) -> tuple[int, int, str]:
+        (length,) = struct.unpack("<i", self._recv_exact(4))
+        if length < 10 or length > _MAX_PACKET:
+            raise RconError(f"RCON: paquete inválido ({length} bytes)")
+        data = self._recv_exact(length)
+        req_id, ptype = struct.unpack("<ii", data[:8])
+        return req_id, ptype, data[8:-2].decode("utf-8", "replace")
+
+    def _connect(self):
+        sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._sock = sock
+        try:
+            self._send(_TYPE_AUTH, self.password)
+            # AUTH_RESPONSE usa el mismo tipo que COMMAND (2); algunos servidores
+            # mandan antes un RESPONSE vacío que hay que saltar
+            while True:
+                rid, ptype, _ = self._recv()
+                if ptype == _TYPE_COMMAND:
+                    break
+            if rid == -1:
+                raise RconAuthError("RCON: contraseña rechazada")
+        except Exception:
+            self.close()
+            raise
+
+    def _stale(self) -> bool:
+        """¿El servidor cerró la conexión persistente mientras estaba ociosa?"""
+        try:
+            self._sock.setblocking(False)
+            try:
+                return self._sock.recv(1, socket.MSG_PEEK) == b""
+            finally:
+                self._sock.settimeout(self.timeout)
+        except BlockingIOError:
+            return False
+        except OSError:
+            return True
+
+    def close(self):
+        if self._sock is not None:
+            try:
+                self._sock.close()
+            except OSError:
+                pass
+            self._sock = None
+
+    # ---- API ----
+
+    def command(self, cmd: str) -> str:
+        """
+        Ejecuta un comando y devuelve el texto de respuesta. Reconecta una vez si
+        la conexión cayó antes de enviarlo; si falla después (p.ej. `stop` cierra
+        el socket), lanza RconSentError sin repetirlo.
+        """
+        with self._lock:
+            for attempt in (1, 2):
+                sent = False
+                try:
+                    if self._sock is not None and self._stale():
+                        self.close()
+                    if self._sock is None:
+                        self._connect()
+                    req_id = self._send(_TYPE_COMMAND, cmd)
+                    sent = True
+                    while True:
+                        rid, _, body = self._recv()
+                        if rid == req_id:
+                            return body
+                        # respuesta tardía de un comando anterior que expiró: se descarta
+                except RconAuthError:
+                    raise
+                except (OSError, ConnectionError, RconError) as e:
+                    self.close()
+                    if sent:
+                        raise RconSentError(f"RCON {self.host}:{self.port}: sin respuesta a {cmd.split()[0]!r}: {e}") from e
+                    if attempt == 2:
+                        raise RconError(f"RCON {self.host}:{self.port}: {e}") from e
+                    logging.info("RCON: reconectando (%s)", e)
+        raise RuntimeError("unreachable")
+
+    def players(self) -> PlayerList:
+        out = self.command("list")
+        result = parse_list(out)
+        if result is None:
+            raise RconError(f"RCON: respuesta de list inesperada: {out[:80]!r}")
+        return result
@@ -0,0 +1,267 @@
+# runner.py
+#
+# Ejecución de comandos externos para los handlers:
+# - argv sin shell (shell=True solo para compatibilidad con llamadaSistema)
+# - timeout por llamada; al vencer se mata el grupo de procesos entero
+# - semáforo global para limitar cuántos hijos corren a la vez en la Pi
+# - captura de salida acotada (el exceso se lee y se descarta)
+# - métricas de latencia por comando
+
+import os
+import time
+import asyncio
+import signal
+import logging
+import threading
+import subprocess
+from typing import NamedTuple, Optional, Sequence, Union
+
+CMD_MAX_PROCS = int(os.getenv("CMD_MAX_PROCS", "3"))
+CMD_TIMEOUT_S = float(os.getenv("CMD_TIMEOUT_S", "15"))
+MAX_OUTPUT = 64 * 1024
+
+_sem = threading.BoundedSemaphore(CMD_MAX_PROCS)
+_stats_lock = threading.Lock()
+_stats: dict[str, dict] = {}
+
+
+class CmdResult(NamedTuple):
+    argv: Union[str, Sequence[str]]
+    rc: Optional[int]  # None si no llegó a terminar (timeout / no arrancó)
+    stdout: str
+    stderr: str
+    elapsed: float
+    timed_out: bool = False
+    truncated: bool = False
+
+    @property
+    def ok(self) -> bool:
+        return self.rc == 0
+
+    @property
+    def text(self) -> str:
+        return self.stdout.strip()
+
+
+def _reader(stream, chunks: list, limit: int, flags: dict):
+    kept = 0
+    try:
+        for chunk in iter(lambda: stream.read1(4096), b""):
+            part = chunk[:max(0, limit - kept)]
+            if part:
+                chunks.append(part)
+                kept += len(part)
+            if len(part) < len(chunk):
+                flags["truncated"] = True
+    except Exception:
+        pass
+    finally:
+        stream.close()
+
+
+def _record(label: str, elapsed: float, ok: bool, timed_out: bool):
+    with _stats_lock:
+        st = _stats.setdefault(label, {"count": 0, "errors": 0, "timeouts": 0, "total_s": 0.0, "max_s": 0.0, "last_s": 0.0})
+        st["count"] += 1
+        st["total_s"] += elapsed
+        st["last_s"] = elapsed
+        st["max_s"] = max(st["max_s"], elapsed)
+        if timed_out:
+            st["timeouts"] += 1
+        elif not ok:
+            st["errors"] += 1
+
+
+def run(
+    argv: Union[str, Sequence[str]],
+    timeout: Optional[float] = None,
+    max_output: int = MAX_OUTPUT,
+    shell: bool = False,
+    label: Optional[str] = None,
+) -> CmdResult:
+    """
+    Ejecuta `argv` y devuelve CmdResult. Nunca lanza por timeout ni por
+    comando inexistente: el error queda en rc/stderr para que el handler responda.
+    `timeout` cubre la espera por el semáforo más la ejecución.
+    """
+    timeout = CMD_TIMEOUT_S if timeout is None else timeout
+    if label is None:
+        label = argv.split()[0] if isinstance(argv, str) else " ".join(argv[:2])
+
+    started = time.monotonic()
+    if not _sem.acquire(timeout=timeout):
+        elapsed = time.monotonic() - started
+        _record(label, elapsed, False, True)
+        logging.warning("runner: sin hueco para %s tras %.1fs", label, elapsed)
+        return CmdResult(argv, None, "", "Demasiados comandos en curso.", elapsed, timed_out=True)
+
+    try:
+        try:
+            proc = subprocess.Popen(
+                argv,
+                shell=shell,
+                stdin=subprocess.DEVNULL,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                start_new_session=True,  # para poder matar también a los nietos
+            )
+        except OSError as e:
+            elapsed = time.monotonic() - started
+            _record(label, elapsed, False, False)
+            return CmdResult(argv, None, "", str(e), elapsed)
+
+        out_chunks: list[bytes] = []
+        err_chunks: list[bytes] = []
+        flags = {"truncated": False}
+        readers = [
+            threading.Thread(target=_reader, args=(proc.stdout, out_chunks, max_output, flags), daemon=True),
+            threading.Thread(target=_reader, args=(proc.stderr, err_chunks, max_output, flags), daemon=True),
+        ]
+        for t in readers:
+            t.start()
+
+        timed_out = False
+        remaining = max(0.0, timeout - (time.monotonic() - started))
+        try:
+            proc.wait(timeout=remaining)
+        except subprocess.TimeoutExpired:
+            timed_out = True
+            try:
+                os.killpg(proc.pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+            proc.wait()
+        for t in readers:
+            t.join(timeout=1)
+    finally:
+        _sem.release()
+
+    elapsed = time.monotonic() - started
+    rc = None if timed_out else proc.returncode
+    _record(label, elapsed, rc == 0, timed_out)
+    if timed_out:
+        logging.warning("runner: timeout (%.1fs) en %s", timeout, label)
+
+    return CmdResult(
+        argv,
+        rc,
+        b"".join(out_chunks).decode("utf-8", "replace"),
+        b"".join(err_chunks).decode("utf-8", "replace"),
+        elapsed,
+        timed_out=timed_out,
+        truncated=flags["truncated"],
+    )
+
+
+async def _areader(stream, chunks: list, limit: int, flags: dict):
+    kept = 0
+    while True:
+        chunk = await stream.read(4096)
+        if not chunk:
+            break
+        part = chunk[:max(0, limit - kept)]
+        if part:
+            chunks.append(part)
+            kept += len(part)
+        if len(part) < len(chunk):
+            flags["truncated"] = True
+
+
+async def arun(
+    argv: Sequence[str],
+    timeout: Optional[float] = None,
+    max_output: int = MAX_OUTPUT,
+    label: Optional[str] = None,
+) -> CmdResult:
+    """
+    Versión asyncio de run() para el modo asíncrono del bot: mismo resultado,
+    mismo semáforo global (compartido con los hilos) y mismas métricas.
+    """
+    timeout = CMD_TIMEOUT_S if timeout is None else timeout
+    if label is None:
+        label = " ".join(argv[:2])
+
+    started = time.monotonic()
+    # El semáforo es de threading: se sondea sin bloquear el event loop
+    while not _sem.acquire(blocking=False):
+        if time.monotonic() - started >= timeout:
+            elapsed = time.monotonic() - started
+            _record(label, elapsed, False, True)
+            logging.warning("runner: sin hueco para %s tras %.1fs", label, elapsed)
+            return CmdResult(argv, None, "", "Demasiados comandos en curso.", elapsed, timed_out=True)
+        await asyncio.sleep(0.05)
+
+    try:
+        try:
+            proc = await asyncio.create_subprocess_exec(
+                *argv,
+                stdin=subprocess.DEVNULL,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                start_new_session=True,
+            )
+        except OSError as e:
+            elapsed = time.monotonic() - started
+            _record(label, elapsed, False, False)
+            return CmdResult(argv, None, "", str(e), elapsed)
+
+        out_chunks: list[bytes] = []
+        err_chunks: list[bytes] = []
+        flags = {"truncated": False}
+        readers = asyncio.gather(
+            _areader(proc.stdout, out_chunks, max_output, flags),
+            _areader(proc.stderr, err_chunks, max_output, flags),
+        )
+
+        timed_out = False
+        remaining = max(0.0, timeout - (time.monotonic() - started))
+        try:
+            await asyncio.wait_for(proc.wait(), timeout=remaining)
+        except asyncio.TimeoutError:
+            timed_out = True
+            try:
+                os.killpg(proc.pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+            await proc.wait()
+        try:
+            await asyncio.wait_for(readers, timeout=1)
+        except asyncio.TimeoutError:
+            pass
+    finally:
+        _sem.release()
+
+    elapsed = time.monotonic() - started
+    rc = None if timed_out else proc.returncode
+    _record(label, elapsed, rc == 0, timed_out)
+    if timed_out:
+        logging.warning("runner: timeout (%.1fs) en %s", timeout, label)
+
+    return CmdResult(
+        argv,
+        rc,
+        b"".join(out_chunks).decode("utf-8", "replace"),
+        b"".join(err_chunks).decode("utf-8", "replace"),
+        elapsed,
+        timed_out=timed_out,
+        truncated=flags["truncated"],
+    )
+
+
+def stats() -> dict[str, dict]:
+    with _stats_lock:
+        return {k: dict(v) for k, v in _stats.items()}
+
+
+def stats_text() -> str:
+    """Resumen para /diag: llamadas, media/máx de latencia, errores y timeouts por comando."""
+    st = stats()
+    if not st:
+        return "Comandos: sin llamadas todavía."
+    lines = ["Comandos (n | media | máx | err | timeout):"]
+    for label, s in sorted(st.items(), key=lambda kv: -kv[1]["total_s"]):
+        avg_ms = s["total_s"] * 1000 / s["count"]
+        lines.append(
+            f"  {label}: {s['count']} | {avg_ms:.0f}ms | {s['max_s'] * 1000:.0f}ms | {s['errors']} | {s['timeouts']}"
+        )
+    return "\n".join(lines)
@@ -0,0 +1,141 @@
+# sampler.py
+#
+# Hilo único que muestrea sysmetrics a ritmo fijo y guarda las últimas N
+# muestras de cada métrica en buffers circulares (array 'f').
+# OLED, alertas y comandos leen latest() sin hacer I/O.
+
+import os
+import math
+import time
+import logging
+import threading
+from array import array
+from typing import Callable, Optional
+
+import sysmetrics
+
+SAMPLE_INTERVAL_S = float(os.getenv("METRICS_INTERVAL_S", "2"))
+HISTORY_SIZE = int(os.getenv("METRICS_HISTORY", "1800"))  # 1 h a 2 s
+
+# Series numéricas que se guardan en el histórico
+SERIES = ("cpu", "mem", "temp", "disk_root", "disk_media")
+
+_NAN = float("nan")
+
+
+class _Ring:
+    """Buffer circular de tamaño fijo sobre array('f'); None se guarda como NaN."""
+
+    __slots__ = ("_buf", "_idx", "_count")
+
+    def __init__(self, size: int):
+        self._buf = array("f", [_NAN]) * size
+        self._idx = 0
+        self._count = 0
+
+    def append(self, value: Optional[float]):
+        self._buf[self._idx] = _NAN if value is None else value
+        self._idx = (self._idx + 1) % len(self._buf)
+        self._count = min(self._count + 1, len(self._buf))
+
+    def values(self, n: Optional[int] = None) -> list[Optional[float]]:
+        """Últimas n muestras, de la más antigua a la más reciente."""
+        count = self._count if n is None else min(n, self._count)
+        size = len(self._buf)
+        start = (self._idx - count) % size
+        if start + count <= size:
+            raw = self._buf[start:start + count]
+        else:
+            raw = self._buf[start:] + self._buf[:(start + count) % size]
+        return [None if math.isnan(v) else v for v in raw]
+
+
+_lock = threading.Lock()
+_rings: dict[str, _Ring] = {}
+_latest: Optional[dict] = None
+_listeners: list[Callable[[dict], None]] = []
+_thread: Optional[threading.Thread] = None
+_stop_event = threading.Event()
+
+
+def _series_values(snap: dict) -> dict:
+    mem = snap.get("mem") or {}
+    disks = snap.get("disks") or {}
+    root = disks.get("/") or {}
+    media = disks.get("/media/disco") or {}
+    return {
+        "cpu": snap.get("cpu"),
+        "mem": mem.get("percent"),
+        "temp": snap.get("temp"),
+        "disk_root": root.get("percent"),
+        "disk_media": media.get("percent"),
+    }
+
+
+def _sample_once():
+    global _latest
+    snap = sysmetrics.snapshot()
+    values = _series_values(snap)
+    with _lock:
+        for name in SERIES:
+            _rings[name].append(values[name])
+        _latest = snap
+        listeners = list(_listeners)
+    for fn in listeners:
+        try:
+            fn(snap)
+        except Exception:
+            logging.exception("sampler: listener falló")
+
+
+def add_listener(fn: Callable[[dict], None]):
+    """fn(snapshot) se llama en el hilo del sampler tras cada muestra."""
+    with _lock:
+        _listeners.append(fn)
+
+
+def start_sampler(interval: float = SAMPLE_INTERVAL_S, history: int = HISTORY_SIZE):
+    global _thread
+    if _thread and _thread.is_alive():
+        return
+
+    with _lock:
+        for name in SERIES:
+            if name not in _rings:
+                _rings[name] = _Ring(history)
+
+    _stop_event.clear()
+
+    def _loop():
+        while not _stop_event.is_set():
+            started = time.monotonic()
+            try:
+                _sample_once()
+            except Exception:
+                logging.exception("sampler: error leyendo métricas")
+            # ritmo fijo aunque la lectura tarde
+            _stop_event.wait(max(0.0, interval - (time.monotonic() - started)))
+
+    _thread = threading.Thread(target=_loop, name="metrics-sampler", daemon=True)
+    _thread.start()
+
+
+def stop_sampler():
+    _stop_event.set()
+
+
+def latest() -> dict:
+    """
+    Última muestra completa (mismo formato que sysmetrics.snapshot()).
+    Si el sampler aún no ha arrancado, lee directamente una vez.
+    """
+    with _lock:
+        snap = _latest
+    return snap if snap is not None else sysmetrics.snapshot()
+
+
+def history(metric: str, n: Optional[int] = None) -> list[Optional[float]]:
+    """Últimas n muestras de `metric` (una de SERIES), de la más antigua a la más reciente."""
+    with _lock:
+        ring = _rings.get(metric)
+        return ring.values(n) if ring else []
@@ -0,0 +1,143 @@
+# sysmetrics.py
+#
+# Lecturas del sistema sin forks: /proc/stat, /proc/meminfo, statvfs y la
+# zona térmica. Sustituye a `top`, `free`, `df` y `vcgencmd` en /status y OLED.
+
+import os
+import time
+import threading
+from typing import Optional
+
+THERMAL_ZONE = "/sys/class/thermal/thermal_zone0/temp"
+DISK_PATHS = ("/", "/media/disco")
+
+_cpu_lock = threading.Lock()
+_cpu_prev: dict = {"total": 0, "idle": 0, "ts": 0.0}
+
+
+def _read_cpu_times() -> Optional[tuple[int, int]]:
+    """Devuelve (total, idle) en jiffies desde la línea agregada de /proc/stat."""
+    try:
+        with open("/proc/stat", "r") as f:
+            fields = f.readline().split()
+    except Exception:
+        return None
+    if not fields or fields[0] != "cpu":
+        return None
+    # user nice system idle iowait irq softirq steal (guest ya va incluido en user)
+    values = [int(v) for v in fields[1:9]]
+    idle = values[3] + (values[4] if len(values) > 4 else 0)
+    return sum(values), idle
+
+
+def read_cpu_percent(min_interval: float = 0.1) -> Optional[int]:
+    """
+    % de CPU usado desde la lectura anterior (deltas de /proc/stat).
+    La primera llamada toma dos muestras separadas `min_interval` segundos.
+    """
+    with _cpu_lock:
+        cur = _read_cpu_times()
+        if cur is None:
+            return None
+        if not _cpu_prev["total"]:
+            _cpu_prev.update({"total": cur[0], "idle": cur[1], "ts": time.monotonic()})
+            time.sleep(min_interval)
+            cur = _read_cpu_times()
+            if cur is None:
+                return None
+
+        d_total = cur[0] - _cpu_prev["total"]
+        d_idle = cur[1] - _cpu_prev["idle"]
+        if d_total <= 0:
+            # Llamadas muy seguidas: no hay delta todavía
+            return _cpu_prev.get("pct")
+
+        pct = int(round(100 * (d_total - d_idle) / d_total))
+        pct = max(0, min(100, pct))
+        _cpu_prev.update({"total": cur[0], "idle": cur[1], "ts": time.monotonic(), "pct": pct})
+        return pct
+
+
+def read_meminfo() -> Optional[dict]:
+    """
+    RAM en MB como la muestra `free -m`:
+    total, used (total - available), free, available, percent.
+    """
+    try:
+        meminfo = {}
+        with open("/proc/meminfo", "r") as f:
+            for line in f:
+                k, v = line.split(":", 1)
+                meminfo[k] = int(v.split()[0])
+    except Exception:
+        return None
+
+    total = meminfo.get("MemTotal", 0)
+    if not total:
+        return None
+    avail = meminfo.get("MemAvailable", meminfo.get("MemFree", 0))
+    used = total - avail
+    return {
+        "total": total // 1024,
+        "used": used // 1024,
+        "free": meminfo.get("MemFree", 0) // 1024,
+        "available": avail // 1024,
+        "percent": int(used * 100 / total),
+    }
+
+
+def read_mem_percent() -> Optional[int]:
+    mem = read_meminfo()
+    return mem["percent"] if mem else None
+
+
+def read_temp_c() -> Optional[float]:
+    try:
+        with open(THERMAL_ZONE, "r") as f:
+            return float(f.read().strip()) / 1000.0
+    except Exception:
+        return None
+
+
+def read_disk(path: str) -> Optional[dict]:
+    """
+    Uso de disco vía statvfs con el mismo criterio que `df`:
+    used = bloques - libres, avail = libres para no-root, percent redondeado hacia arriba.
+    """
+    try:
+        st = os.statvfs(path)
+    except Exception:
+        return None
+    size = st.f_blocks * st.f_frsize
+    if not size:
+        return None
+    used = (st.f_blocks - st.f_bfree) * st.f_frsize
+    avail = st.f_bavail * st.f_frsize
+    denom = used + avail
+    percent = -(-used * 100 // denom) if denom else 0
+    return {"path": path, "size": size, "used": used, "avail": avail, "percent": int(percent)}
+
+
+def fmt_bytes(n: Optional[int]) -> str:
+    """Tamaño corto estilo `df -h` (1K = 1024): 512M, 29G, 1.8T."""
+    if n is None:
+        return "N/A"
+    size = float(n)
+    for unit in ("B", "K", "M", "G", "T"):
+        if size < 1024 or unit == "T":
+            break
+        size /= 1024
+    if unit == "B":
+        return f"{int(size)}B"
+    return f"{size:.1f}{unit}" if size < 10 else f"{size:.0f}{unit}"
+
+
+def snapshot() -> dict:
+    """Todas las métricas de una vez; cada campo puede ser None si no está disponible."""
+    return {
+        "ts": time.time(),
+        "cpu": read_cpu_percent(),
+        "mem": read_meminfo(),
+        "temp": read_temp_c(),
+        "disks": {path: read_disk(path) for path in DISK_PATHS},
+    }
@@ -0,0 +1,262 @@
+# systemd_api.py
+#
+# Estado de las unidades systemd con un único `systemctl show` para todas
+# (un fork por consulta en vez de uno por servicio) y una caché corta que
+# comparten /servicios, /plex, /zerotier...
+# Opcionalmente, un watcher sobre `journalctl -f -o json` mantiene una tabla de
+# estados al día (solo consulta systemd cuando el journal anuncia un cambio).
+
+import os
+import json
+import time
+import logging
+import threading
+import subprocess
+from typing import Callable, NamedTuple, Optional, Sequence
+
+import runner
+
+SYSTEMD_CACHE_S = float(os.getenv("SYSTEMD_CACHE_S", "5"))
+
+_PROPS = [
+    "Id", "LoadState", "ActiveState", "SubState", "MainPID",
+    "MemoryCurrent", "CPUUsageNSec", "ActiveEnterTimestampMonotonic", "NRestarts", "Result",
+]
+# systemd marca "sin dato" con [not set] o con UINT64_MAX
+_UNSET = {"", "[not set]", str(2 ** 64 - 1)}
+
+
+class UnitStatus(NamedTuple):
+    unit: str
+    load: str                     # loaded | not-found | masked...
+    active: str                   # active | inactive | failed | activating...
+    sub: str                      # running | dead | exited...
+    pid: int
+    memory: Optional[int]         # bytes (MemoryAccounting)
+    cpu_ns: Optional[int]         # CPU acumulada (CPUAccounting)
+    since: Optional[float]        # time.monotonic() al pasar a active
+    restarts: int
+    result: str = ""                  # success | exit-code | signal | timeout...
+    cpu_pct: Optional[float] = None   # entre esta consulta y la anterior
+
+    @property
+    def uptime(self) -> Optional[float]:
+        if self.active != "active" or not self.since:
+            return None
+        return max(0.0, time.monotonic() - self.since)
+
+
+class SystemdError(Exception):
+    pass
+
+
+def _int(value: Optional[str]) -> Optional[int]:
+    if value is None or value in _UNSET:
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        return None
+
+
+def parse_show(text: str, units: Sequence[str]) -> dict[str, UnitStatus]:
+    """
+    Parsea la salida de `systemctl show u1 u2 ...`: un bloque KEY=VALUE por
+    unidad, separados por línea en blanco y en el mismo orden que se pidieron.
+    """
+    blocks, cur = [], {}
+    for line in text.splitlines():
+        if not line.strip():
+            if cur:
+                blocks.append(cur)
+                cur = {}
+            continue
+        key, _, value = line.partition("=")
+        cur[key] = value
+    if cur:
+        blocks.append(cur)
+
+    out = {}
+    for unit, b in zip(units, blocks):
+        since = _int(b.get("ActiveEnterTimestampMonotonic"))
+        out[unit] = UnitStatus(
+            unit=b.get("Id") or unit,
+            load=b.get("LoadState", ""),
+            active=b.get("ActiveState", "unknown"),
+            sub=b.get("SubState", ""),
+            pid=_int(b.get("MainPID")) or 0,
+            memory=_int(b.get("MemoryCurrent")),
+            cpu_ns=_int(b.get("CPUUsageNSec")),
+            since=since / 1e6 if since else None,
+            restarts=_int(b.get("NRestarts")) or 0,
+            result=b.get("Result", ""),
+        )
+    return out
+
+
+def show(units: Sequence[str]) -> dict[str, UnitStatus]:
+    """Una llamada a systemctl para todas las unidades. Lanza SystemdError si falla."""
+    units = list(units)
+    if not units:
+        return {}
+    res = runner.run(
+        ["systemctl", "show", "--no-pager", "--property=" + ",".join(_PROPS), *units],
+        timeout=10, label="systemctl show",
+    )
+    if not res.ok:
+        raise SystemdError(res.stderr.strip() or f"systemctl rc={res.rc}")
+    return parse_show(res.stdout, units)
+
+
+_lock = threading.Lock()
+_cache = {"ts": 0.0, "units": {}}   # unidad -> UnitStatus
+_prev_cpu: dict[str, tuple[float, int]] = {}   # unidad -> (monotonic, cpu_ns)
+
+
+def status(units: Sequence[str], max_age: float = SYSTEMD_CACHE_S) -> dict[str, UnitStatus]:
+    """
+    Estado de las unidades pedidas, como mucho de hace max_age segundos.
+    Si hay que refrescar, se consultan a la vez todas las que ya estaban en caché.
+    """
+    with _lock:
+        now = time.monotonic()
+        cached = _cache["units"]
+        if now - _cache["ts"] >= max_age or any(u not in cached for u in units):
+            wanted = list(dict.fromkeys([*units, *cached]))
+            fresh = show(wanted)
+            for unit, st in fresh.items():
+                prev = _prev_cpu.get(unit)
+                if st.cpu_ns is not None:
+                    if prev and now > prev[0] and st.cpu_ns >= prev[1]:
+                        pct = 100.0 * (st.cpu_ns - prev[1]) / 1e9 / (now - prev[0])
+                        fresh[unit] = st._replace(cpu_pct=pct)
+                    _prev_cpu[unit] = (now, st.cpu_ns)
+            _cache["units"] = fresh
+            _cache["ts"] = now
+        return {u: _cache["units"][u] for u in units if u in _cache["units"]}
+
+
+def invalidate(unit: Optional[str] = None):
+    """
+    Tras start/stop: la próxima consulta vuelve a preguntar a systemd. Con unit
+    y el watcher vivo, además se relee esa unidad a su tabla (si journalctl no
+    puede leer los mensajes del sistema, el journal nunca la actualizaría).
+    """
+    with _lock:
+        _cache["ts"] = 0.0
+    if unit is None or not _watch["alive"]:
+        return
+    with _watch_lock:
+        if unit not in _watch["units"]:
+            return
+    try:
+        _set_state(unit, show([unit])[unit])
+    except (SystemdError, KeyError) as e:
+        logging.warning("systemd: no pude releer %s: %s", unit, e)
+
+
+def unit_active(unit: str) -> str:
+    """
+    Equivalente a `systemctl is-active`, sin fork: de la tabla del watcher si
+    sigue la unidad, si no de la caché.
+    """
+    if _watch["alive"]:
+        with _watch_lock:
+            st = _watch["units"].get(unit)
+        if st is not None:
+            return "not-found" if st.load == "not-found" else st.active
+    try:
+        st = status([unit]).get(unit)
+    except SystemdError as e:
+        logging.warning("systemd: %s", e)
+        return "unknown"
+    if st is None or st.load == "not-found":
+        return "not-found"
+    return st.active
+
+
+# ---------------------------------------------------------------------------
+# Watcher: journalctl -f filtrado a las unidades; cada mensaje de systemd sobre
+# una de ellas (Started/Stopped/Failed...) provoca un `systemctl show` solo de
+# esa unidad. Los listeners reciben (unidad, estado anterior, estado nuevo).
+# ---------------------------------------------------------------------------
+
+_watch_lock = threading.Lock()
+_watch = {"alive": False, "units": {}}   # unidad -> UnitStatus
+_watch_listeners: list[Callable[[str, Optional[UnitStatus], UnitStatus], None]] = []
+_watch_thread: Optional[threading.Thread] = None
+
+
+def _unit_id(unit: str) -> str:
+    return unit if "." in unit else unit + ".service"
+
+
+def _set_state(unit: str, st: UnitStatus):
+    with _watch_lock:
+        prev = _watch["units"].get(unit)
+        _watch["units"][unit] = st
+    if prev is not None and (prev.active, prev.sub) == (st.active, st.sub):
+        return
+    for fn in list(_watch_listeners):
+        try:
+            fn(unit, prev, st)
+        except Exception:
+            logging.exception("systemd: listener falló")
+
+
+def _journal_loop(units: list[str]):
+    names = {_unit_id(u): u for u in units}
+    argv = ["journalctl", "--follow", "--lines=0", "--output=json",
+            "--output-fields=UNIT,MESSAGE_ID,JOB_RESULT"]
+    for unit_id in names:
+        argv += ["-u", unit_id]
+
+    backoff = 1
+    while True:
+        proc = None
+        started = time.monotonic()
+        try:
+            # estado de partida (y lo que cambiara mientras el journal no se leía)
+            for unit, st in show(units).items():
+                _set_state(unit, st)
+            proc = subprocess.Popen(argv, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+            _watch["alive"] = True
+            for line in proc.stdout:
+                try:
+                    unit = names.get(json.loads(line).get("UNIT"))
+                except ValueError:
+                    continue
+                if unit:
+                    _set_state(unit, show([unit])[unit])
+            raise SystemdError(f"journalctl terminó (rc={proc.wait()})")
+        except Exception as e:
+            logging.warning("systemd watcher: %s", e)
+        finally:
+            _watch["alive"] = False
+            if proc is not None and proc.poll() is None:
+                proc.kill()
+                proc.wait()
+        if time.monotonic() - started > 60:
+            backoff = 1
+        time.sleep(backoff)
+        backoff = min(backoff * 2, 60)
+
+
+def watch_units(units: Sequence[str], listener: Optional[Callable] = None):
+    """Arranca (una vez) el watcher de las unidades; listener(unidad, anterior, nuevo)."""
+    global _watch_thread
+    if listener:
+        _watch_listeners.append(listener)
+    if _watch_thread and _watch_thread.is_alive():
+        return
+    _watch_thread = threading.Thread(target=_journal_loop, args=(list(units),),
+                                     name="systemd-watch", daemon=True)
+    _watch_thread.start()
+
+
+def watched() -> dict[str, UnitStatus]:
+    """Tabla de estados del watcher (vacía si no está corriendo)."""
+    if not _watch["alive"]:
+        return {}
+    with _watch_lock:
+        return dict(_watch["units"])
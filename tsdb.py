@@ -0,0 +1,192 @@
+# tsdb.py
+#
+# Mini base de series temporales para la salud de la Pi.
+# - Nunca guarda muestras crudas: solo rollups (min/max/sum/count) en tres
+#   niveles: 1 min, 15 min y 1 h.
+# - Cada nivel es un directorio de segmentos binarios append-only con
+#   registros de tamaño fijo; la retención borra segmentos enteros.
+# - Los buckets cerrados se acumulan en RAM y se escriben en bloque cada
+#   TSDB_FLUSH_S para no desgastar la SD con escrituras pequeñas.
+
+import os
+import time
+import struct
+import atexit
+import logging
+import threading
+from typing import Optional
+
+TSDB_DIR = os.getenv("TSDB_DIR", "data/tsdb")
+FLUSH_S = int(os.getenv("TSDB_FLUSH_S", "600"))
+
+# Ids persistidos en disco: solo se añaden al final, nunca se reordenan
+METRICS = ("cpu", "mem", "temp", "disk_root", "disk_media")
+_METRIC_ID = {name: i for i, name in enumerate(METRICS)}
+
+# nivel -> (segundos por bucket, retención en segundos, formato del nombre de segmento)
+TIERS = {
+    "1m":  (60,   2 * 86400,   "%Y%m%d"),
+    "15m": (900,  35 * 86400,  "%Y%m"),
+    "1h":  (3600, 400 * 86400, "%Y"),
+}
+
+# bucket_ts (u32), metric (u16), min, max, sum (f32), count (u32) -> 22 bytes
+_REC = struct.Struct("<IHfffI")
+
+_lock = threading.Lock()
+# nivel -> metric -> [bucket_ts, min, max, sum, count] del bucket en curso
+_open: dict[str, dict[str, list]] = {tier: {} for tier in TIERS}
+# nivel -> registros cerrados pendientes de escribir (bucket_ts, metric, min, max, sum, count)
+_pending: dict[str, list[tuple]] = {tier: [] for tier in TIERS}
+_last_flush = time.time()
+
+
+def _segment_path(tier: str, bucket_ts: int) -> str:
+    fmt = TIERS[tier][2]
+    return os.path.join(TSDB_DIR, tier, time.strftime(fmt, time.gmtime(bucket_ts)) + ".seg")
+
+
+def record(snap: dict):
+    """
+    Acumula una muestra (formato sysmetrics.snapshot()/sampler) en los tres niveles.
+    Pensado para registrarse con sampler.add_listener(tsdb.record).
+    """
+    mem = snap.get("mem") or {}
+    disks = snap.get("disks") or {}
+    values = {
+        "cpu": snap.get("cpu"),
+        "mem": mem.get("percent"),
+        "temp": snap.get("temp"),
+        "disk_root": (disks.get("/") or {}).get("percent"),
+        "disk_media": (disks.get("/media/disco") or {}).get("percent"),
+    }
+    add(int(snap.get("ts") or time.time()), values)
+
+
+def add(ts: int, values: dict):
+    """Agrega {metric: valor} con timestamp `ts` (epoch s). Ignora valores None."""
+    with _lock:
+        for tier, (step, _, _) in TIERS.items():
+            bucket = ts - ts % step
+            acc_by_metric = _open[tier]
+            for metric, v in values.items():
+                if v is None or metric not in _METRIC_ID:
+                    continue
+                acc = acc_by_metric.get(metric)
+                if acc is not None and acc[0] != bucket:
+                    _pending[tier].append((acc[0], _METRIC_ID[metric], acc[1], acc[2], acc[3], acc[4]))
+                    acc = None
+                if acc is None:
+                    acc_by_metric[metric] = [bucket, v, v, v, 1]
+                else:
+                    acc[1] = min(acc[1], v)
+                    acc[2] = max(acc[2], v)
+                    acc[3] += v
+                    acc[4] += 1
+        due = time.time() - _last_flush >= FLUSH_S
+    if due:
+        flush()
+
+
+def flush():
+    """Escribe los buckets cerrados (una escritura por segmento) y aplica la retención."""
+    global _last_flush
+    with _lock:
+        pending = {tier: recs for tier, recs in _pending.items() if recs}
+        for tier in pending:
+            _pending[tier] = []
+        _last_flush = time.time()
+
+    for tier, recs in pending.items():
+        by_segment: dict[str, bytearray] = {}
+        for rec in recs:
+            buf = by_segment.setdefault(_segment_path(tier, rec[0]), bytearray())
+            buf += _REC.pack(*rec)
+        for path, buf in by_segment.items():
+            try:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                with open(path, "ab") as f:
+                    torn = f.tell() % _REC.size  # resto de un corte de luz a mitad de escritura
+                    if torn:
+                        f.truncate(f.tell() - torn)
+                    f.write(buf)
+            except Exception:
+                logging.exception("tsdb: no pude escribir %s", path)
+
+    _apply_retention()
+
+
+def _apply_retention():
+    now = time.time()
+    for tier, (_, retention, _) in TIERS.items():
+        tier_dir = os.path.join(TSDB_DIR, tier)
+        try:
+            names = os.listdir(tier_dir)
+        except FileNotFoundError:
+            continue
+        for name in names:
+            path = os.path.join(tier_dir, name)
+            try:
+                # Un segmento append-only no se toca después de su último dato
+                if os.path.getmtime(path) < now - retention:
+                    os.remove(path)
+            except Exception:
+                logging.exception("tsdb: no pude aplicar retención a %s", path)
+
+
+def pick_tier(start: int, end: int) -> str:
+    """Nivel más fino que cubre la ventana con pocos cientos de puntos."""
+    span = end - start
+    if span <= 6 * 3600 and start >= time.time() - TIERS["1m"][1]:
+        return "1m"
+    if span <= 7 * 86400 and start >= time.time() - TIERS["15m"][1]:
+        return "15m"
+    return "1h"
+
+
+def query(metric: str, start: int, end: int, tier: Optional[str] = None) -> list[tuple[int, float, float, float]]:
+    """
+    Rollups de `metric` en [start, end): lista ordenada de (bucket_ts, min, max, avg).
+    Lee solo los segmentos del nivel elegido más lo que aún está en RAM.
+    """
+    if metric not in _METRIC_ID:
+        raise ValueError(f"Métrica desconocida: {metric}")
+    mid = _METRIC_ID[metric]
+    tier = tier or pick_tier(start, end)
+    step = TIERS[tier][0]
+
+    rows: dict[int, tuple] = {}
+
+    tier_dir = os.path.join(TSDB_DIR, tier)
+    try:
+        names = sorted(os.listdir(tier_dir))
+    except FileNotFoundError:
+        names = []
+    for name in names:
+        path = os.path.join(tier_dir, name)
+        try:
+            # El segmento no puede tener datos posteriores a su última escritura
+            if os.path.getmtime(path) < start:
+                continue
+            with open(path, "rb") as f:
+                data = f.read()
+        except Exception:
+            continue
+        usable = len(data) - len(data) % _REC.size  # descarta un registro a medio escribir
+        for bucket, m, vmin, vmax, vsum, count in _REC.iter_unpack(memoryview(data)[:usable]):
+            if m == mid and start - step < bucket < end and count:
+                rows[bucket] = (bucket, vmin, vmax, vsum / count)
+
+    with _lock:
+        in_memory = [r for r in _pending[tier] if r[1] == mid]
+        acc = _open[tier].get(metric)
+        if acc is not None:
+            in_memory.append((acc[0], mid, acc[1], acc[2], acc[3], acc[4]))
+    for bucket, _, vmin, vmax, vsum, count in in_memory:
+        if start - step < bucket < end and count:
+            rows[bucket] = (bucket, vmin, vmax, vsum / count)
+
+    return [rows[k] for k in sorted(rows)]
+
+
+atexit.register(flush)
@@ -1,14 +1,13 @@
 # utils.py
 
-import os
+import netinfo
+import runner
 
-def llamadaSistema(entrada):
-    salida = ""  # Creamos variable vacía
-    f = os.popen(entrada)  # Llamada al sistema
-    for i in f.readlines():  # Leemos caracter a caracter sobre la línea devuelta por la llamada al sistema
-        salida += i  # Insertamos cada uno de los caracteres en nuestra variable
-    salida = salida[:-1]  # Truncamos el caracter fin de línea '\n'
-    return salida  # Devolvemos la respuesta al comando ejecutado
+def llamadaSistema(entrada, timeout=None):
+    # Compatibilidad: comando de shell como texto. Código nuevo: runner.run([...])
+    salida = runner.run(entrada, shell=True, timeout=timeout).stdout
+    return salida[:-1] if salida.endswith("\n") else salida  # Truncamos el fin de línea '\n'
 
 def obtener_ip():
-    return llamadaSistema("hostname -I").strip()
+    # Cacheado e invalidado por netlink: barato aunque se llame en cada frame OLED
+    return netinfo.host_ips()